@@ -1,9 +1,94 @@
 import scrapy
+from scrapy import signals
 from scrapy.linkextractors import LinkExtractor
 from scrapy.spiders import CrawlSpider, Rule
+import json
+import os
 import re
+import time
 from datetime import datetime
 
+from archive_analytics import ArchiveAnalytics
+from archive_index import ArchiveCatalog
+from archive_store import ArchiveStore, latest_snapshot, snapshot_copy
+from archive_io import (
+    ArchiveReader, StreamedList, ThreadLog, archive_suffix, compression_of, finalize_thread_log,
+    latest_archive, new_board, open_archive_output, plain_archive, scan_thread_log, without_content_html,
+    write_archive
+)
+from crawl_metrics import deep_sizeof, timed
+from extraction import extract_posts, link_texts
+from forum_urls import board_shard, canonical_url
+from thread_history import ThreadHistory
+
+
+def archive_output(settings, directory='archives'):
+    """Where and how to write a crawl's archive
+    directory: 'archives' for a crawl's archive; the crawl state directory for
+    the partial archive of an interrupted crawl, which isn't published
+    Returns: (output_file, compact, content_html)
+    """
+    os.makedirs(directory, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+    content_html = settings.getbool('ARCHIVE_CONTENT_HTML', True)
+    if settings.get('ARCHIVE_STORAGE') == 'dedup':
+        # The store compresses on its own and only keeps snapshots it can
+        # rebuild byte for byte, which needs the standard indented layout
+        return os.path.join(directory, f'223-archive-{timestamp}.json'), False, content_html
+    suffix = archive_suffix(settings.get('ARCHIVE_COMPRESSION'))
+    return (os.path.join(directory, f'223-archive-{timestamp}{suffix}'),
+            settings.getbool('ARCHIVE_COMPACT'), content_html)
+
+
+def remove_partial_archives(directory):
+    """Delete the partial archives an interrupted crawl left in its state directory"""
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith('223-archive-'):
+                os.remove(os.path.join(directory, name))
+
+
+def store_archive(settings, output_file, crawled_at, stats, logger):
+    """Put a freshly written archive in place: into the deduplicated store when
+    ARCHIVE_STORAGE is 'dedup', and into the archive catalog, after rolling up
+    its analytics (ARCHIVE_ANALYTICS) and adding it to the thread history index
+    (THREAD_HISTORY_INDEX)
+    """
+    archives_dir = os.path.dirname(output_file)
+    if settings.getbool('ARCHIVE_ANALYTICS'):
+        # Roll up while the archive is still a plain file, so analytics queries never read it
+        try:
+            totals = ArchiveAnalytics(archives_dir).build(output_file)
+            logger.info(f"📈 Analytics rollups: {totals['posts']} posts in {totals['rows']} rows "
+                        f"({totals['undated_posts']} without a readable date)")
+        except Exception as e:
+            logger.warning(f"⚠️  Could not roll up archive analytics: {e}")
+    
+    if settings.getbool('THREAD_HISTORY_INDEX'):
+        # Offsets stay valid after a dedup import: snapshots rebuild byte for byte.
+        # Also picks up archives added or deleted by hand since the last crawl
+        try:
+            added, gone = ThreadHistory(archives_dir).update()
+            logger.info(f"🕰️  Thread history index updated: {len(added)} archives added, {len(gone)} forgotten")
+        except Exception as e:
+            logger.warning(f"⚠️  Could not update the thread history index: {e}")
+    
+    if settings.get('ARCHIVE_STORAGE') == 'dedup':
+        # Keep only the content-addressed snapshot; the file is removed once verified
+        summary = ArchiveStore(archives_dir).import_archive(output_file, remove=True)
+        if summary['verified']:
+            logger.info(f"📦 Stored as deduplicated snapshot: {summary['new_threads']}/{summary['threads']} new threads, "
+                        f"{summary['new_comments']}/{summary['comments']} new comments")
+        else:
+            logger.warning(f"⚠️  Snapshot of {output_file} did not verify, keeping the plain archive file")
+    
+    # Register the new archive so the server never has to parse it for metadata
+    if os.path.exists(output_file):
+        try:
+            ArchiveCatalog(archives_dir).record(output_file, crawled_at, stats)
+        except Exception as e:
+            logger.warning(f"⚠️  Could not update archive catalog: {e}")
+
 
 class TapatalkForumSpider(CrawlSpider):
     name = '223_fetcher'
@@ -11,6 +96,7 @@ class TapatalkForumSpider(CrawlSpider):
     start_urls = ['https://www.tapatalk.com/groups/223']
     
     custom_settings = {
+        # Where a crawl starts; the adaptive throttle (politeness.py) tunes both
         'DOWNLOAD_DELAY': 1,  # Be respectful to the server
         'CONCURRENT_REQUESTS_PER_DOMAIN': 2,
         'ROBOTSTXT_OBEY': True,
@@ -26,25 +112,299 @@ class TapatalkForumSpider(CrawlSpider):
         # Rule for board/forum pages (ending with -fNUMBER/)
         Rule(LinkExtractor(allow=r'/groups/223/.+-f\d+/$'), 
              callback='parse_board', 
-             follow=True),
+             follow=True,
+             process_request='filter_board_request'),
         
         # Rule for FIRST PAGE of threads only (ending with -tNUMBER.html, NO -s pagination)
         # This ensures pagination pages aren't treated as separate threads
         Rule(LinkExtractor(allow=r'/groups/223/.+-t\d+\.html$', deny=r'-s\d+\.html'),  
              callback='parse_thread', 
-             follow=True),
+             follow=True,
+             process_request='filter_thread_request'),
     )
     
     def __init__(self, *args, **kwargs):
         super(TapatalkForumSpider, self).__init__(*args, **kwargs)
         # Hierarchical data structure: boards contain threads, threads contain comments
         self.forum_data = {}
+        # Estimated memory held in forum_data, for crawl metrics (see crawl_metrics.py)
+        self.forum_data_bytes = 0
+        # Calls and seconds spent per @timed spider method
+        self.callback_times = {}
         # Progress tracking
         self.boards_discovered = 0
         self.threads_discovered = 0
         self.threads_completed = 0
         self.comments_extracted = 0
+        # Streaming output: completed threads go to an on-disk log instead of forum_data
+        self.thread_log = None
+        self.stored_thread_urls = set()
+        # Seen-index: canonical URLs of every thread already scheduled, checked
+        # before a thread request is made (see claim_thread)
+        self.scheduled_threads = set()
+        self.duplicate_requests_skipped = 0
+        # Incremental mode: summaries of the threads in the previous archive
+        self.previous_archive = None
+        self.previous_threads = {}
+        self.threads_carried_over = 0
+        # Multi-page threads whose pages are being fetched in parallel, keyed by thread URL
+        self.pending_threads = {}
+        # Estimated memory held in pending_threads, kept up to date page by page
+        self.pending_threads_bytes = 0
+        self.thread_pages_failed = 0
+        self.threads_incomplete = 0
+        # Checkpointing: counters and partially fetched threads, saved next to the thread log
+        self.checkpoint_path = None
+        self.checkpoint_interval = 0
+        self.last_checkpoint = time.monotonic()
+        self.keep_crawl_state = False
+        # Sharded crawls (shard.py): this process only crawls the boards of its shard
+        self.shard = 0
+        self.shards = 1
+        self.shard_status_path = None
+        self.last_shard_status = 0
+    
+    # Progress counters saved in checkpoints and restored on resume
+    CHECKPOINT_COUNTERS = ('boards_discovered', 'threads_discovered', 'threads_carried_over',
+                           'thread_pages_failed', 'threads_incomplete', 'duplicate_requests_skipped')
+    # Seconds between progress updates of a crawl shard to its shard.json
+    SHARD_STATUS_INTERVAL = 5
+    # Scheduler priority of board listing pages. They are cheap and feed every
+    # thread request, so discovery stays ahead of thread fetching (pages of
+    # threads in flight get priority 1, new threads 0)
+    BOARD_PRIORITY = 2
+    
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(TapatalkForumSpider, cls).from_crawler(crawler, *args, **kwargs)
+        checkpoint = None
+        if crawler.settings.getbool('STREAM_THREADS'):
+            state_dir = crawler.settings.get('CRAWL_STATE_DIR', 'crawlstate')
+            spider.checkpoint_path = os.path.join(state_dir, 'checkpoint.json')
+            spider.checkpoint_interval = crawler.settings.getfloat('CHECKPOINT_INTERVAL', 0)
+            if crawler.settings.getbool('RESUME_CRAWL'):
+                checkpoint = spider.load_checkpoint()
+            elif os.path.exists(spider.checkpoint_path):
+                spider.logger.warning(f"⚠️  Starting a new crawl; the interrupted one in {state_dir} "
+                                      f"can no longer be resumed")
+            if checkpoint:
+                log_path = checkpoint['thread_log']
+            else:
+                timestamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+                log_path = os.path.join(state_dir, f'threads-{timestamp}.jsonl')
+            spider.thread_log = ThreadLog(log_path)
+            spider.logger.info(f"💾 Streaming completed threads to {spider.thread_log.path}")
+        elif crawler.settings.getbool('RESUME_CRAWL'):
+            spider.logger.warning("⚠️  Resuming needs STREAM_THREADS = True, starting a new crawl")
+        
+        if checkpoint and checkpoint.get('previous_archive'):
+            # Compare against the same archive as the interrupted crawl did, not
+            # the partial archive it wrote when it stopped
+            spider.load_previous_archive(checkpoint['previous_archive'])
+        elif crawler.settings.getbool('INCREMENTAL_CRAWL'):
+            previous = latest_archive()
+            snapshot = latest_snapshot()
+            if snapshot and (previous is None or snapshot > os.path.basename(previous)):
+                # The newest crawl only exists in the deduplicated store; rebuild it to read from
+                previous = snapshot_copy(snapshot)
+            if previous:
+                spider.load_previous_archive(previous)
+            else:
+                spider.logger.warning("⚠️  Incremental crawl requested but no previous archive found, crawling everything")
+        
+        if checkpoint:
+            spider.restore_checkpoint(checkpoint)
+            crawler.signals.connect(spider.schedule_resumed_pages, signal=signals.spider_opened)
+        
+        spider.shards = crawler.settings.getint('CRAWL_SHARDS', 1)
+        if spider.shards > 1:
+            if not spider.thread_log:
+                raise ValueError('Sharded crawls need STREAM_THREADS = True')
+            spider.shard = crawler.settings.getint('CRAWL_SHARD', 0)
+            spider.shard_status_path = os.path.join(os.path.dirname(spider.checkpoint_path), 'shard.json')
+            spider.save_shard_status()
+            spider.logger.info(f"🧩 Crawling shard {spider.shard + 1} of {spider.shards}")
+        return spider
+    
+    def load_checkpoint(self):
+        """Read the checkpoint of an interrupted crawl, or None if there is nothing to resume"""
+        if not os.path.exists(self.checkpoint_path):
+            self.logger.warning(f"⚠️  No interrupted crawl to resume ({self.checkpoint_path} not found), starting a new crawl")
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if not os.path.exists(checkpoint['thread_log']):
+            self.logger.warning(f"⚠️  Thread log {checkpoint['thread_log']} is gone, starting a new crawl")
+            return None
+        return checkpoint
     
+    def save_checkpoint(self):
+        """Atomically save counters and partially fetched threads
+        Completed threads are already in the thread log, so a checkpoint stays
+        small: its size depends on the threads in flight, not on crawl progress.
+        """
+        checkpoint = {
+            'saved_at': datetime.now().isoformat(),
+            'thread_log': self.thread_log.path,
+            'previous_archive': self.previous_archive.path if self.previous_archive else None,
+            'counters': {name: getattr(self, name) for name in self.CHECKPOINT_COUNTERS},
+            'pending_threads': {
+                thread_url: dict(pending, failed=sorted(pending['failed']), outstanding=sorted(pending['outstanding']))
+                for thread_url, pending in self.pending_threads.items()
+            },
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+        self.last_checkpoint = time.monotonic()
+    
+    def maybe_checkpoint(self):
+        """Save a checkpoint if CHECKPOINT_INTERVAL seconds have passed since the last one
+        (and a shard's progress every SHARD_STATUS_INTERVAL seconds)
+        """
+        now = time.monotonic()
+        if self.checkpoint_interval and now - self.last_checkpoint >= self.checkpoint_interval:
+            self.save_checkpoint()
+        if self.shard_status_path and now - self.last_shard_status >= self.SHARD_STATUS_INTERVAL:
+            self.save_shard_status()
+    
+    def save_shard_status(self, closed_reason=None):
+        """Atomically write this shard's progress and thread log for the shard.py launcher"""
+        status = {
+            'shard': self.shard,
+            'shards': self.shards,
+            'thread_log': self.thread_log.path,
+            'updated_at': datetime.now().isoformat(),
+            'closed': closed_reason,
+            'pending_threads': len(self.pending_threads),
+            'counters': {name: getattr(self, name)
+                         for name in ('threads_completed', 'comments_extracted') + self.CHECKPOINT_COUNTERS},
+        }
+        tmp_path = self.shard_status_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, self.shard_status_path)
+        self.last_shard_status = time.monotonic()
+    
+    def restore_checkpoint(self, checkpoint):
+        """Pick up an interrupted crawl
+        Threads completed in its thread log are marked as done (so they aren't
+        fetched again), and counters and partially fetched threads come from the
+        checkpoint. Threads stored incomplete when it stopped are fetched again.
+        """
+        boards, threads = scan_thread_log(self.thread_log.path)
+        for board_url, board in boards.items():
+            self.forum_data[board_url] = dict(board, threads=[])
+            self.forum_data_bytes += deep_sizeof(self.forum_data[board_url])
+        complete = 0
+        for (board_url, thread_url), thread in threads.items():
+            if not thread['incomplete']:
+                self.stored_thread_urls.add((board_url, thread_url))
+                self.scheduled_threads.add(thread_url)
+                complete += 1
+                self.comments_extracted += thread['comments']
+        
+        for name, value in checkpoint['counters'].items():
+            setattr(self, name, value)
+        # The log is written as threads complete, so it's more current than the checkpoint
+        self.threads_completed = complete
+        
+        for thread_url, pending in checkpoint['pending_threads'].items():
+            if thread_url in self.scheduled_threads:
+                continue  # completed after the checkpoint was saved
+            self.scheduled_threads.add(thread_url)
+            self.pending_threads[thread_url] = {
+                'thread_data': pending['thread_data'],
+                'board_url': pending['board_url'],
+                'page_size': pending['page_size'],
+                'pages': {int(start): comments for start, comments in pending['pages'].items()},
+                'failed': set(),
+                # Pages that had failed get another try
+                'outstanding': set(pending['outstanding']) | set(pending['failed']),
+            }
+            self.track_pending_bytes(thread_url, deep_sizeof(pending['thread_data']) + deep_sizeof(pending['pages']))
+        self.logger.info(f"⏯️  Resuming crawl from {checkpoint['saved_at']}: {complete} threads already complete, "
+                         f"{len(self.pending_threads)} partially fetched")
+    
+    def schedule_resumed_pages(self, spider):
+        """spider_opened handler: request the missing pages of partially fetched threads"""
+        for thread_url, pending in list(self.pending_threads.items()):
+            if not pending['outstanding']:
+                self.assemble_thread(thread_url)
+                continue
+            for start in sorted(pending['outstanding']):
+                # Their first attempt may already be marked as seen by the duplicate filter
+                self.crawler.engine.crawl(self.thread_page_request(thread_url, start).replace(dont_filter=True))
+    
+    def load_previous_archive(self, path):
+        """Index the threads of the previous archive for incremental crawling
+        Only a small summary per thread is kept; full threads are re-read from
+        the archive file when they are carried over.
+        """
+        self.previous_archive = ArchiveReader(plain_archive(path))
+        for board, threads_offset in self.previous_archive.iter_boards():
+            for offset, end in self.previous_archive.iter_threads(threads_offset):
+                thread = self.previous_archive.load(offset, end)
+                comments = thread['comments']
+                self.previous_threads[canonical_url(thread['thread_url'])] = {
+                    'board_url': board['board_url'],
+                    'offset': offset,
+                    'end': end,
+                    'comments': len(comments),
+                    'last_post_id': comments[-1]['post_id'] if comments else None,
+                    'last_post_date': comments[-1]['post_date'] if comments else None,
+                }
+        self.logger.info(f"🔁 Incremental crawl against {path}: {len(self.previous_threads)} known threads")
+    
+    def claim_thread(self, url):
+        """Seen-index check made before scheduling a thread
+        Returns: True the first time a thread is seen under any URL variant,
+        False (counting the skipped request) after that
+        """
+        thread_url = canonical_url(url)
+        if thread_url in self.scheduled_threads:
+            self.duplicate_requests_skipped += 1
+            return False
+        self.scheduled_threads.add(thread_url)
+        return True
+    
+    def owns_board(self, url):
+        """Whether a board page belongs to this crawl shard (always, unless sharded)"""
+        return self.shards == 1 or board_shard(url, self.shards) == self.shard
+    
+    def filter_board_request(self, request, response):
+        """Rule hook: fetch board listings first; in a sharded crawl, leave other
+        shards' boards to them
+        """
+        return request.replace(priority=self.BOARD_PRIORITY) if self.owns_board(request.url) else None
+    
+    def filter_thread_request(self, request, response):
+        """Rule hook: skip threads that are already scheduled. In incremental mode,
+        known threads are only fetched via parse_board (which can tell from the
+        listing whether they changed)
+        """
+        if canonical_url(request.url) in self.previous_threads:
+            return None
+        if self.shards > 1 and board_shard(response.url, self.shards) != self.shard:
+            # Shards only take threads from their own board listings, so the
+            # same thread isn't crawled by two shards
+            return None
+        return request if self.claim_thread(request.url) else None
+    
+    def ensure_board(self, board_url, board_name='Unknown Board'):
+        """Register a board in the hierarchical structure if it is new
+        Returns: True if the board was created
+        """
+        if board_url in self.forum_data:
+            return False
+        self.forum_data[board_url] = new_board(board_url, board_name)
+        self.forum_data_bytes += deep_sizeof(self.forum_data[board_url])
+        if self.thread_log:
+            self.thread_log.add_board(self.forum_data[board_url])
+        return True
+    
+    @timed
     def parse_start_url(self, response):
         """Parse the main forum index page to discover boards"""
         self.logger.info(f"Parsing main forum page: {response.url}")
@@ -57,32 +417,30 @@ class TapatalkForumSpider(CrawlSpider):
             board_links = response.xpath('//a[contains(@href, "-f") and contains(@href, "/")]/@href').getall()
             board_links = [link for link in board_links if re.search(r'-f\d+/$', link)]
         
+        # Link texts of the whole page, looked up once rather than per board link
+        link_names = link_texts(response.selector.root)
         for link in board_links:
             full_url = response.urljoin(link)
-            board_name = response.css(f'a[href="{link}"]::text').get()
+            board_name = link_names.get(link)
             
             if not board_name:
                 board_name = 'Unknown Board'
             else:
                 board_name = board_name.strip()
             
-            # Normalize board URL (remove query params)
-            normalized_url = re.sub(r'\?.*$', '', full_url)
+            normalized_url = canonical_url(full_url)
+            if not self.owns_board(normalized_url):
+                continue
             
             # Initialize board in hierarchical structure
-            if normalized_url not in self.forum_data:
-                self.forum_data[normalized_url] = {
-                    'board_name': board_name,
-                    'board_url': normalized_url,
-                    'discovered_at': datetime.now().isoformat(),
-                    'threads': []
-                }
+            if self.ensure_board(normalized_url, board_name):
                 self.boards_discovered += 1
                 self.logger.info(f"📁 Board discovered: '{board_name}' (Total: {self.boards_discovered})")
             
             # Follow the board link
-            yield response.follow(link, callback=self.parse_board)
+            yield response.follow(link, callback=self.parse_board, priority=self.BOARD_PRIORITY)
     
+    @timed
     def parse_board(self, response):
         """Parse a board/forum page to discover threads"""
         self.logger.info(f"Parsing board page: {response.url}")
@@ -96,16 +454,131 @@ class TapatalkForumSpider(CrawlSpider):
             # Fallback selectors
             thread_links = response.css('a[href*=".html"]::attr(href)').getall()
         
+        # Incremental mode: decide per listing row whether a known thread changed
+        revisited = set()
+        if self.previous_threads:
+            for anchor in response.css('a.topictitle'):
+                thread_url = canonical_url(response.urljoin(anchor.attrib.get('href', '')))
+                if thread_url in self.previous_threads:
+                    revisited.add(thread_url)
+                    if self.claim_thread(thread_url):
+                        yield from self.revisit_known_thread(thread_url, anchor)
+        
         for link in thread_links:
-            # Filter to only get thread links (not other pages)
-            if re.search(r'\d+-.+\.html', link):
+            # Filter to only get thread links (not other pages); known threads were claimed above
+            thread_url = canonical_url(response.urljoin(link))
+            if re.search(r'\d+-.+\.html', link) and thread_url not in revisited and self.claim_thread(thread_url):
                 yield response.follow(link, callback=self.parse_thread)
         
         # Handle pagination for boards
         next_page = response.css('a.next::attr(href), a[rel="next"]::attr(href)').get()
         if next_page:
-            yield response.follow(next_page, callback=self.parse_board)
+            yield response.follow(next_page, callback=self.parse_board, priority=self.BOARD_PRIORITY)
+    
+    def extract_listing_info(self, anchor):
+        """Read reply count, last post date and page offsets from a board listing row"""
+        row = anchor.xpath('ancestor::li[contains(@class, "row")][1] | ancestor::tr[1]')
+        replies_text = ' '.join(row.css('dd.posts ::text, .posts ::text, .replies ::text').getall())
+        replies = re.search(r'\d+', replies_text.replace(',', ''))
+        last_post_date = row.css('dd.lastpost time::attr(datetime), .lastpost time::attr(datetime)').get()
+        page_starts = sorted({int(start) for start in
+                              re.findall(r'-s(\d+)\.html', ' '.join(row.css('.pagination a::attr(href)').getall()))})
+        return {
+            'replies': int(replies.group()) if replies else None,
+            'last_post_date': last_post_date.strip() if last_post_date else None,
+            # Tapatalk pagination offsets are post offsets, so the first one is the page size
+            'page_size': page_starts[0] if page_starts and page_starts[0] > 0 else None,
+        }
+    
+    def revisit_known_thread(self, thread_url, anchor):
+        """Carry over an unchanged thread, or fetch only the pages that can hold new posts"""
+        previous = self.previous_threads[thread_url]
+        listing = self.extract_listing_info(anchor)
+        
+        if listing['replies'] is not None:
+            unchanged = listing['replies'] + 1 == previous['comments']
+            grown = listing['replies'] + 1 > previous['comments']
+        else:
+            unchanged = listing['last_post_date'] is not None and listing['last_post_date'] == previous['last_post_date']
+            grown = False
+        
+        if unchanged:
+            self.carry_over_thread(thread_url)
+            return
+        
+        page_size = listing['page_size']
+        if grown and page_size and previous['comments'] > page_size:
+            # Jump straight to the last page we already have and continue from there
+            start = ((previous['comments'] - 1) // page_size) * page_size
+            page_url = re.sub(r'\.html$', f'-s{start}.html', thread_url)
+            self.logger.info(f"🔁 Thread changed, resuming at page offset {start}: {thread_url}")
+            yield scrapy.Request(page_url, callback=self.parse_thread_update, errback=self.known_thread_failed,
+                                 cb_kwargs={'thread_url': thread_url, 'start': start},
+                                 meta={'known_thread': thread_url})
+        else:
+            self.logger.info(f"🔁 Thread changed, refetching: {thread_url}")
+            yield self.refetch_known_thread(thread_url)
+    
+    def refetch_known_thread(self, thread_url):
+        """Request a known thread from its first page, falling back to its previous
+        version if that fails"""
+        return scrapy.Request(thread_url, callback=self.parse_thread, errback=self.known_thread_failed,
+                              dont_filter=True, meta={'known_thread': thread_url})
+    
+    def known_thread_failed(self, failure):
+        """Errback for refetches of changed known threads: a full crawl would still
+        have the thread, so keep the version from the previous archive"""
+        thread_url = failure.request.meta['known_thread']
+        self.logger.error(f"❌ Failed to refetch changed thread, keeping its previous version: {thread_url}: "
+                          f"{failure.value!r}")
+        self.carry_over_thread(thread_url)
+    
+    def carry_over_thread(self, thread_url):
+        """Copy an unchanged thread from the previous archive into this crawl"""
+        previous = self.previous_threads[thread_url]
+        thread_data = self.previous_archive.load(previous['offset'], previous['end'])
+        self.threads_discovered += 1
+        if self.add_thread_to_board(previous['board_url'], thread_data):
+            self.threads_completed += 1
+            self.threads_carried_over += 1
+            self.comments_extracted += len(thread_data['comments'])
+    
+    @timed
+    def parse_thread_update(self, response, thread_url, start):
+        """Parse the last known page of a changed thread and append its new posts"""
+        previous = self.previous_threads[thread_url]
+        thread_data = self.previous_archive.load(previous['offset'], previous['end'])
+        known_comments = thread_data['comments'][:start]
+        
+        page_comments = self.extract_posts(response, start)
+        
+        # The page must begin with the post we already archived at this offset,
+        # otherwise posts were deleted or moved and offsets no longer line up
+        if (not page_comments or len(thread_data['comments']) <= start
+                or page_comments[0]['post_id'] != thread_data['comments'][start]['post_id']):
+            self.logger.warning(f"⚠️  Thread offsets shifted since last archive, refetching: {thread_url}")
+            yield self.refetch_known_thread(thread_url)
+            return
+        
+        self.threads_discovered += 1
+        board_url = self.extract_board_from_breadcrumbs(response)
+        thread_title = response.css('h2.topic-title a::text, h1[itemprop="headline"]::text, .topic-title::text').get()
+        thread_data.update({
+            'thread_title': thread_title.strip() if thread_title else thread_data['thread_title'],
+            'crawled_at': datetime.now().isoformat(),
+            'comments': known_comments + page_comments,
+        })
+        new_comments = len(thread_data['comments']) - previous['comments']
+        self.logger.info(f"📝 Thread update: '{thread_data['thread_title']}' - {new_comments:+d} comments on last known page")
+        
+        next_page = response.css('li.arrow.next a::attr(href), a[rel="next"]::attr(href), li.next a::attr(href)').get()
+        if next_page:
+            yield response.follow(next_page, callback=self.parse_thread_continuation,
+                                cb_kwargs={'thread_data': thread_data, 'board_url': board_url})
+        else:
+            self.complete_thread(board_url, thread_data)
     
+    @timed
     def parse_thread(self, response):
         """Parse a thread page to extract posts and comments"""
         # Extract thread title - it's inside an anchor tag within h2.topic-title
@@ -115,12 +588,18 @@ class TapatalkForumSpider(CrawlSpider):
         
         # Extract posts - select the parent row that contains both profile and post content
         # Structure: div.post (parent) contains dl.postprofile (user info) and div#post_container* (content)
-        posts = response.css('div.post.postrow, div[id^="p_"]')
+        posts = self.extract_posts(response)
         
         if not posts:
             self.logger.warning(f"⚠️  No posts found on {response.url}")
             return
         
+        thread_url = canonical_url(response.url)
+        if thread_url in self.pending_threads:
+            # Another URL variant of a thread whose pages are already being fetched
+            self.logger.debug(f"Thread already in progress, skipping: {response.url}")
+            return
+        
         # Track thread discovery
         self.threads_discovered += 1
         
@@ -132,40 +611,147 @@ class TapatalkForumSpider(CrawlSpider):
             'thread_title': thread_title.strip() if thread_title else 'Untitled Thread',
             'thread_url': response.url,
             'crawled_at': datetime.now().isoformat(),
-            'comments': []  # Renamed from 'posts' to 'comments' per user request
+            'comments': posts  # Renamed from 'posts' to 'comments' per user request
         }
         
-        # Extract all posts (comments) in the thread
-        for idx, post in enumerate(posts):
-            post_data = self.extract_post_data(post, idx)
-            thread_data['comments'].append(post_data)
-        
         self.logger.info(f"📝 Thread: '{thread_title.strip() if thread_title else 'Untitled'}' - {len(posts)} comments")
         
         # Check for pagination in thread
         # Tapatalk uses <li class="arrow next"><a rel="next">
         next_page = response.css('li.arrow.next a::attr(href), a[rel="next"]::attr(href), li.next a::attr(href)').get()
-        if next_page:
+        page_starts = self.extract_page_starts(response)
+        if next_page and page_starts:
+            # The pagination block tells us every page up front, so fetch them all at once
+            yield from self.schedule_thread_pages(thread_url, board_url, thread_data, page_starts)
+        elif next_page:
             # If there's pagination, we need to handle it
             yield response.follow(next_page, callback=self.parse_thread_continuation,
                                 cb_kwargs={'thread_data': thread_data, 'board_url': board_url})
         else:
             # No more pages, add thread to board
-            num_comments = len(thread_data['comments'])
-            was_added = self.add_thread_to_board(board_url, thread_data)
-            if was_added:
-                self.threads_completed += 1
-                self.comments_extracted += num_comments
-                self.logger.info(f"✅ Progress: {self.threads_completed}/{self.threads_discovered} threads completed | {self.comments_extracted} total comments")
+            self.complete_thread(board_url, thread_data)
+    
+    def extract_page_starts(self, response):
+        """Return every page offset of a thread from its pagination block
+        Tapatalk pages are -sNUM.html where NUM is the offset of the page's first
+        post, so the smallest offset is the page size and the largest the last page.
+        The block elides middle pages ("1 2 3 ... 40"), so fill in the gaps.
+        """
+        hrefs = response.css('.pagination a::attr(href), li.arrow.next a::attr(href)').getall()
+        starts = sorted({int(start) for start in re.findall(r'-s(\d+)\.html', ' '.join(hrefs))} - {0})
+        if not starts:
+            return []
+        page_size = starts[0]
+        return list(range(page_size, starts[-1] + 1, page_size))
+    
+    def schedule_thread_pages(self, thread_url, board_url, thread_data, page_starts):
+        """Request all remaining pages of a thread concurrently"""
+        self.pending_threads[thread_url] = {
+            'thread_data': thread_data,
+            'board_url': board_url,
+            'page_size': page_starts[0],
+            'pages': {},
+            'failed': set(),
+            'outstanding': set(page_starts),
+        }
+        self.track_pending_bytes(thread_url, deep_sizeof(thread_data))
+        self.logger.info(f"   ↳ Fetching {len(page_starts)} more pages in parallel")
+        for start in page_starts:
+            yield self.thread_page_request(thread_url, start)
     
+    def track_pending_bytes(self, thread_url, size):
+        """Add size to the estimated memory of a thread being assembled (and of all of them)"""
+        pending = self.pending_threads[thread_url]
+        pending['bytes'] = pending.get('bytes', 0) + size
+        self.pending_threads_bytes += size
+    
+    def thread_page_request(self, thread_url, start):
+        page_url = re.sub(r'\.html$', f'-s{start}.html', thread_url)
+        # Finish threads that are already in flight before starting new ones
+        return scrapy.Request(page_url, callback=self.parse_thread_page, errback=self.thread_page_failed,
+                              priority=1, cb_kwargs={'thread_url': thread_url, 'start': start})
+    
+    @timed
+    def parse_thread_page(self, response, thread_url, start):
+        """Collect one page of a thread fetched by schedule_thread_pages"""
+        pending = self.pending_threads.get(thread_url)
+        if pending is None:
+            return
+        
+        page = self.extract_posts(response, start)
+        self.track_pending_bytes(thread_url, deep_sizeof(page) - deep_sizeof(pending['pages'].get(start, [])))
+        pending['pages'][start] = page
+        pending['outstanding'].discard(start)
+        self.maybe_checkpoint()
+        
+        # The thread may have grown a page since the first page was fetched
+        next_page = response.css('li.arrow.next a::attr(href), a[rel="next"]::attr(href), li.next a::attr(href)').get()
+        next_start = start + pending['page_size']
+        if next_page and next_start not in pending['pages'] and next_start not in pending['outstanding'] \
+                and next_start not in pending['failed']:
+            pending['outstanding'].add(next_start)
+            yield self.thread_page_request(thread_url, next_start)
+        
+        if not pending['outstanding']:
+            self.assemble_thread(thread_url)
+    
+    def thread_page_failed(self, failure):
+        """Errback for thread pages that failed after all retries"""
+        thread_url = failure.request.cb_kwargs['thread_url']
+        start = failure.request.cb_kwargs['start']
+        pending = self.pending_threads.get(thread_url)
+        self.thread_pages_failed += 1
+        self.logger.error(f"❌ Failed to fetch page at offset {start} of {thread_url}: {failure.value!r}")
+        if pending is None:
+            return
+        pending['failed'].add(start)
+        pending['outstanding'].discard(start)
+        if not pending['outstanding']:
+            self.assemble_thread(thread_url)
+    
+    def assemble_thread(self, thread_url):
+        """Join a thread's pages in order once every page has arrived or failed"""
+        pending = self.pending_threads.pop(thread_url)
+        self.pending_threads_bytes -= pending.get('bytes', 0)
+        thread_data = pending['thread_data']
+        
+        comments = list(thread_data['comments'])
+        for start in sorted(pending['pages']):
+            comments.extend(pending['pages'][start])
+        
+        # Posts can shift between pages while a thread is being fetched; keep each post once
+        seen_post_ids = set()
+        thread_data['comments'] = []
+        for comment in comments:
+            if comment['post_id'] is not None:
+                if comment['post_id'] in seen_post_ids:
+                    continue
+                seen_post_ids.add(comment['post_id'])
+            comment['post_index'] = len(thread_data['comments'])
+            thread_data['comments'].append(comment)
+        
+        if pending['failed']:
+            self.threads_incomplete += 1
+            self.logger.warning(f"⚠️  Thread stored without {len(pending['failed'])} failed page(s): {thread_url}")
+        self.logger.info(f"   ↳ Assembled {len(pending['pages']) + 1} pages: {len(thread_data['comments'])} comments")
+        self.complete_thread(pending['board_url'], thread_data, incomplete=bool(pending['failed']))
+    
+    def complete_thread(self, board_url, thread_data, incomplete=False):
+        """Add a fully fetched thread to its board and update progress counters"""
+        num_comments = len(thread_data['comments'])
+        was_added = self.add_thread_to_board(board_url, thread_data, incomplete)
+        if was_added:
+            self.threads_completed += 1
+            self.comments_extracted += num_comments
+            self.logger.info(f"✅ Progress: {self.threads_completed}/{self.threads_discovered} threads completed | {self.comments_extracted} total comments")
+            self.maybe_checkpoint()
+        return was_added
+    
+    @timed
     def parse_thread_continuation(self, response, thread_data, board_url):
         """Parse continuation pages of a thread"""
-        posts = response.css('div.post.postrow, div[id^="p_"]')
-        
-        start_idx = len(thread_data['comments'])
-        for idx, post in enumerate(posts, start=start_idx):
-            post_data = self.extract_post_data(post, idx)
-            thread_data['comments'].append(post_data)
+        posts = self.extract_posts(response, len(thread_data['comments']))
+        thread_data['comments'].extend(posts)
         
         self.logger.info(f"   ↳ Continuation page: +{len(posts)} comments (total: {len(thread_data['comments'])})")
         
@@ -176,44 +762,14 @@ class TapatalkForumSpider(CrawlSpider):
                                 cb_kwargs={'thread_data': thread_data, 'board_url': board_url})
         else:
             # All pages processed, add thread to board
-            num_comments = len(thread_data['comments'])
-            was_added = self.add_thread_to_board(board_url, thread_data)
-            if was_added:
-                self.threads_completed += 1
-                self.comments_extracted += num_comments
-                self.logger.info(f"✅ Progress: {self.threads_completed}/{self.threads_discovered} threads completed | {self.comments_extracted} total comments")
-    
-    def extract_post_data(self, post_selector, index):
-        """Extract data from a single post"""
-        # Author information - Tapatalk uses span with itemprop="name"
-        author = post_selector.css('span[itemprop="name"]::text').get()
-        if not author:
-            # Fallback selectors
-            author = post_selector.css('.username-coloured span::text, .username span::text').get()
-        if not author:
-            # Try direct text from username elements
-            author = post_selector.css('.display_username::text, .username::text, .author a::text').get()
-        
-        # Post content - extract text from the content div
-        content = post_selector.css('.content.noskim ::text').getall()
-        content_html = post_selector.css('.content.noskim').get()
-        
-        # Post metadata - use time element's datetime attribute (most reliable)
-        post_date = post_selector.css('time::attr(datetime)').get()
-        if not post_date:
-            # Fallback to timespan title
-            post_date = post_selector.css('.timespan::attr(title)').get()
-        
-        post_id = post_selector.css('::attr(id)').get()
-        
-        return {
-            'post_index': index,
-            'post_id': post_id,
-            'author': author.strip() if author else 'Anonymous',
-            'content': ' '.join(content).strip() if content else '',
-            'content_html': content_html,
-            'post_date': post_date.strip() if post_date else None,
-        }
+            self.complete_thread(board_url, thread_data)
+    
+    @timed
+    def extract_posts(self, response, start=0):
+        """Extract every post (comment) on a thread page, numbered from start
+        Selectors and their fallbacks are in extraction.py
+        """
+        return extract_posts(response.selector.root, start)
     
     def extract_board_from_breadcrumbs(self, response):
         """Extract board URL from breadcrumbs on thread page"""
@@ -230,36 +786,29 @@ class TapatalkForumSpider(CrawlSpider):
         # Fallback: return base forum URL
         return 'https://www.tapatalk.com/groups/223/'
     
-    def add_thread_to_board(self, board_url, thread_data):
+    def add_thread_to_board(self, board_url, thread_data, incomplete=False):
         """Add a thread to its parent board in the hierarchical structure
         Returns: True if thread was added, False if it was a duplicate
         """
-        # Normalize board URL (remove session ID and pagination params)
-        board_url = re.sub(r'\?.*$', '', board_url)  # Remove query params
-        board_url = re.sub(r'-s\d+\.html$', '.html', board_url)  # Remove pagination from URL
+        board_url = canonical_url(board_url)
         
         # Ensure board exists in forum_data
-        if board_url not in self.forum_data:
-            # Create board entry if it doesn't exist
-            self.forum_data[board_url] = {
-                'board_name': 'Unknown Board',
-                'board_url': board_url,
-                'discovered_at': datetime.now().isoformat(),
-                'threads': []
-            }
+        self.ensure_board(board_url)
         
         # Normalize thread URL to check for duplicates
-        thread_base_url = re.sub(r'\?.*$', '', thread_data['thread_url'])  # Remove query params
-        thread_base_url = re.sub(r'-s\d+\.html$', '.html', thread_base_url)  # Remove pagination
-        
-        # Check if thread already exists in board
-        existing_thread_urls = [re.sub(r'\?.*$', '', re.sub(r'-s\d+\.html$', '.html', t['thread_url'])) 
-                               for t in self.forum_data[board_url]['threads']]
+        thread_base_url = canonical_url(thread_data['thread_url'])
         
-        if thread_base_url not in existing_thread_urls:
+        # Check if thread already exists in board (stored URLs are already normalized)
+        if (board_url, thread_base_url) not in self.stored_thread_urls:
+            self.stored_thread_urls.add((board_url, thread_base_url))
             # Normalize the thread URL in the data
             thread_data['thread_url'] = thread_base_url
-            self.forum_data[board_url]['threads'].append(thread_data)
+            if self.thread_log:
+                # Streaming mode: persist now, keep only the board skeleton in memory
+                self.thread_log.add_thread(board_url, thread_data, incomplete)
+            else:
+                self.forum_data[board_url]['threads'].append(thread_data)
+                self.forum_data_bytes += deep_sizeof(thread_data)
             self.logger.debug(f"Added thread '{thread_data['thread_title']}' to board")
             return True
         else:
@@ -268,12 +817,60 @@ class TapatalkForumSpider(CrawlSpider):
     
     def closed(self, reason):
         """Called when spider closes - output the hierarchical forum data"""
-        import json
-        
         self.logger.info("=" * 80)
         self.logger.info(f"Spider closing: {reason}")
         self.logger.info("=" * 80)
         
+        if self.previous_archive:
+            self.logger.info(f"🔁 Threads carried over unchanged from previous archive: {self.threads_carried_over}")
+        self.logger.info(f"🔁 Duplicate thread requests skipped: {self.duplicate_requests_skipped} | "
+                         f"filtered by URL fingerprint: {self.crawler.stats.get_value('dupefilter/filtered', 0)}")
+        
+        if self.checkpoint_path and reason != 'finished':
+            # Keep what's needed to resume, including the threads still waiting
+            # on pages (saved before they're stored incomplete below)
+            self.save_checkpoint()
+            self.keep_crawl_state = True
+            self.logger.info(f"⏸️  Crawl state saved to {self.checkpoint_path}; continue with ./run_crawler.sh resume")
+        
+        # Threads still waiting on pages (e.g. the crawl was stopped early) are
+        # stored with what was fetched rather than dropped
+        for thread_url in list(self.pending_threads):
+            pending = self.pending_threads[thread_url]
+            pending['failed'] |= pending['outstanding']
+            pending['outstanding'] = set()
+            self.assemble_thread(thread_url)
+        if self.thread_pages_failed or self.threads_incomplete:
+            self.logger.warning(f"⚠️  Thread pages failed: {self.thread_pages_failed} | "
+                                f"threads stored incomplete: {self.threads_incomplete}")
+        
+        if self.previous_archive:
+            self.previous_archive.close()
+        
+        if self.shards > 1:
+            # shard.py merges the thread logs of all shards into one archive
+            self.thread_log.close()
+            self.save_shard_status(closed_reason=reason)
+            self.logger.info(f"🧩 Shard {self.shard + 1} of {self.shards} done: {self.threads_completed} threads, "
+                             f"{self.comments_extracted} comments in {self.thread_log.path}")
+            return
+        
+        if self.thread_log:
+            output_file, crawled_at, stats = self.finalize_streamed_output()
+        else:
+            output_file, crawled_at, stats = self.write_in_memory_output()
+        if self.keep_crawl_state:
+            # Not a crawl of its own: publishing it would make it the latest
+            # archive (and incremental base) and count it in history and
+            # analytics next to the archive the resumed crawl writes
+            self.logger.info(f"⏸️  Partial archive kept out of archives/ until the crawl is resumed: {output_file}")
+            return
+        store_archive(self.settings, output_file, crawled_at, stats, self.logger)
+    
+    def write_in_memory_output(self):
+        """Write the hierarchical forum data held in forum_data
+        Returns: (output_file, crawled_at, stats)
+        """
         # Convert forum_data dict to list of boards for output
         boards_list = list(self.forum_data.values())
         
@@ -296,24 +893,66 @@ class TapatalkForumSpider(CrawlSpider):
         self.logger.info(f"   📦 Total in output: {len(boards_list)} boards, {total_threads} threads, {total_comments} comments")
         
         # Write hierarchical structure to file with timestamp
-        timestamp = datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-        output_file = f'archives/223-archive-{timestamp}.json'
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump({
+        output_file, compact, content_html = archive_output(self.settings)
+        crawled_at = datetime.now().isoformat()
+        stats = {
+            'boards_discovered': self.boards_discovered,
+            'threads_discovered': self.threads_discovered,
+            'threads_completed': self.threads_completed,
+            'comments_extracted': self.comments_extracted,
+            'boards': len(boards_list),
+            'threads': total_threads,
+            'comments': total_comments
+        }
+        if not content_html:
+            boards_list = [dict(board, threads=StreamedList(map(without_content_html, board['threads'])))
+                           for board in boards_list]
+        with open_archive_output(output_file, compression_of(output_file)) as f:
+            write_archive(f, {
                 'forum': '223',
-                'crawled_at': datetime.now().isoformat(),
-                'stats': {
-                    'boards_discovered': self.boards_discovered,
-                    'threads_discovered': self.threads_discovered,
-                    'threads_completed': self.threads_completed,
-                    'comments_extracted': self.comments_extracted,
-                    'boards': len(boards_list),
-                    'threads': total_threads,
-                    'comments': total_comments
-                },
-                'boards': boards_list
-            }, f, indent=2, ensure_ascii=False)
+                'crawled_at': crawled_at,
+                'stats': stats,
+                'boards': StreamedList(boards_list)
+            }, compact)
+        
+        self.logger.info("=" * 80)
+        self.logger.info(f"✅ Hierarchical forum data written to {output_file}")
+        self.logger.info("=" * 80)
+        return output_file, crawled_at, stats
+    
+    def finalize_streamed_output(self):
+        """Build the hierarchical archive from the streamed thread log
+        Returns: (output_file, crawled_at, stats)
+        """
+        self.thread_log.close()
+        
+        self.logger.info("📊 CRAWL STATISTICS:")
+        self.logger.info(f"   📁 Boards discovered: {self.boards_discovered}")
+        self.logger.info(f"   📝 Threads discovered: {self.threads_discovered}")
+        self.logger.info(f"   ✅ Threads completed: {self.threads_completed}")
+        self.logger.info(f"   💬 Comments extracted: {self.comments_extracted}")
+        
+        state_dir = os.path.dirname(self.checkpoint_path)
+        # An interrupted crawl's archive replaces the last one's in the crawl state directory
+        remove_partial_archives(state_dir)
+        output_file, compact, content_html = archive_output(self.settings, state_dir if self.keep_crawl_state
+                                                            else 'archives')
+        crawled_at = datetime.now().isoformat()
+        stats = finalize_thread_log(self.thread_log.path, output_file, crawl_stats={
+            'boards_discovered': self.boards_discovered,
+            'threads_discovered': self.threads_discovered,
+            'threads_completed': self.threads_completed,
+            'comments_extracted': self.comments_extracted,
+        }, crawled_at=crawled_at, compact=compact, content_html=content_html)
+        self.logger.info(f"   📦 Total in output: {stats['boards']} boards, {stats['threads']} threads, {stats['comments']} comments")
+        
+        if not self.keep_crawl_state:
+            if not self.settings.getbool('KEEP_THREAD_LOG'):
+                os.remove(self.thread_log.path)
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
         
         self.logger.info("=" * 80)
         self.logger.info(f"✅ Hierarchical forum data written to {output_file}")
         self.logger.info("=" * 80)
+        return output_file, crawled_at, stats
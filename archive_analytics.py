@@ -0,0 +1,326 @@
+"""
+Activity rollups of archives: who posts where and when, without reading archives.
+
+Each archive is reduced in one streaming pass (one thread in memory at a time)
+to counts per (board, author, day): posts, and threads started, where a thread
+counts for the author and day of its first post. Days come from each comment's
+post_date; posts without a readable date count under day ''. Rollups of all
+archives are kept in one SQLite database (archives/.index/analytics.sqlite3),
+so per-archive reports (most active authors, posts per day and board, board
+activity) and time series across archives are GROUP BY queries over a table
+far smaller than any archive.
+
+The spider rolls up each archive as it writes it (ARCHIVE_ANALYTICS in
+settings.py); any other archive is rolled up the first time it's asked for,
+and again if its file size changes.
+
+Usage:
+    python3 archive_analytics.py build [archive ...]   # every archive by default
+    python3 archive_analytics.py authors archives/223-archive-X.json [--board ID] [--limit N]
+"""
+
+import os
+import re
+import sqlite3
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from archive_index import INDEX_DIRNAME
+from archive_io import ArchiveReader, file_lock, plain_archive
+from forum_urls import forum_id_from_url
+
+# Bump when the rollups change; archives rolled up by an older version are redone
+ANALYTICS_VERSION = 1
+
+# post_date layouts besides ISO 8601 (Tapatalk's .timespan titles)
+DATE_FORMATS = (
+    '%a %b %d, %Y %I:%M %p',
+    '%a %b %d, %Y %H:%M',
+    '%b %d, %Y %I:%M %p',
+    '%d %b %Y, %H:%M',
+    '%d %b %Y %H:%M',
+)
+
+_ISO_DAY = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def post_day(post_date):
+    """ISO day (YYYY-MM-DD) of a post_date, or '' if it can't be read"""
+    if not post_date:
+        return ''
+    post_date = post_date.strip()
+    match = _ISO_DAY.match(post_date)
+    if match:
+        return match.group(0)
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(post_date, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return ''
+
+
+def rollup(path, archives_dir=None):
+    """Roll an archive up in one pass
+    Returns: (header, {board_id: [board_name, threads, posts]},
+              Counter of (board_id, author, day) -> posts, Counter of the same -> threads started)
+    """
+    boards = {}
+    posts = Counter()
+    started = Counter()
+    with ArchiveReader(plain_archive(path, archives_dir)) as reader:
+        header = reader.header()
+        for board, threads_offset in reader.iter_boards():
+            board_id = forum_id_from_url(board.get('board_url'))
+            totals = boards.setdefault(board_id, [board.get('board_name'), 0, 0])
+            for offset, end in reader.iter_threads(threads_offset):
+                comments = reader.load(offset, end).get('comments') or []
+                totals[1] += 1
+                totals[2] += len(comments)
+                keys = [(board_id, comment.get('author') or 'Anonymous', post_day(comment.get('post_date')))
+                        for comment in comments]
+                posts.update(keys)
+                if keys:
+                    started[keys[0]] += 1
+    return header, boards, posts, started
+
+
+@contextmanager
+def _connect(path):
+    db = sqlite3.connect(path, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def _filters(board_id=None, author=None, since=None, until=None):
+    # WHERE clause (after archive_id = ?) and its parameters
+    sql, params = '', []
+    for condition, value in (('board_id = ?', board_id), ('author = ?', author),
+                             ("day >= ?", since), ("day <= ?", until)):
+        if value is not None:
+            sql += f' AND {condition}'
+            params.append(value)
+    if since is not None or until is not None:
+        sql += " AND day != ''"
+    return sql, params
+
+
+class ArchiveAnalytics:
+    """Rollup store for every archive, with the queries the server answers from it"""
+
+    def __init__(self, archives_dir='archives'):
+        self.archives_dir = archives_dir
+        self.path = os.path.join(archives_dir, INDEX_DIRNAME, 'analytics.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with _connect(self.path) as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS archives (
+                    archive_id INTEGER PRIMARY KEY,
+                    filename TEXT NOT NULL UNIQUE,
+                    size_bytes INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    crawled_at TEXT,
+                    boards INTEGER NOT NULL,
+                    threads INTEGER NOT NULL,
+                    posts INTEGER NOT NULL,
+                    undated_posts INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS boards (
+                    archive_id INTEGER NOT NULL,
+                    board_id INTEGER NOT NULL,
+                    board_name TEXT,
+                    threads INTEGER NOT NULL,
+                    posts INTEGER NOT NULL,
+                    PRIMARY KEY (archive_id, board_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS activity (
+                    archive_id INTEGER NOT NULL,
+                    board_id INTEGER NOT NULL,
+                    author TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    posts INTEGER NOT NULL,
+                    threads_started INTEGER NOT NULL,
+                    PRIMARY KEY (archive_id, board_id, author, day)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS activity_by_author ON activity (archive_id, author);
+                CREATE INDEX IF NOT EXISTS activity_by_day ON activity (archive_id, day);
+            ''')
+
+    def _archive(self, db, filename):
+        return db.execute('SELECT * FROM archives WHERE filename = ?', (filename,)).fetchone()
+
+    def has(self, filename):
+        """Whether an archive's rollups are stored (by the current version)"""
+        with _connect(self.path) as db:
+            archive = self._archive(db, filename)
+        return archive is not None and archive['version'] == ANALYTICS_VERSION
+
+    def is_current(self, filepath):
+        """Whether an archive's rollups are stored and were made from the file as it is now"""
+        with _connect(self.path) as db:
+            archive = self._archive(db, os.path.basename(filepath))
+        return archive is not None and archive['version'] == ANALYTICS_VERSION and \
+            archive['size_bytes'] == os.path.getsize(filepath)
+
+    def ensure(self, filepath):
+        """Roll an archive up unless its current rollups are stored; returns its filename"""
+        with file_lock(self.path):
+            if not self.is_current(filepath):
+                self.build(filepath)
+        return os.path.basename(filepath)
+
+    def build(self, filepath):
+        """Roll an archive up and store the result, replacing any earlier rollups of it
+        Returns: the archive's totals
+        """
+        filename = os.path.basename(filepath)
+        header, boards, posts, started = rollup(filepath, self.archives_dir)
+        totals = {
+            'filename': filename,
+            'crawled_at': header.get('crawled_at'),
+            'boards': len(boards),
+            'threads': sum(board[1] for board in boards.values()),
+            'posts': sum(posts.values()),
+            'undated_posts': sum(count for (_, _, day), count in posts.items() if not day),
+            'rows': len(posts),
+        }
+        with _connect(self.path) as db:
+            previous = self._archive(db, filename)
+            if previous is not None:
+                for table in ('activity', 'boards', 'archives'):
+                    db.execute(f'DELETE FROM {table} WHERE archive_id = ?', (previous['archive_id'],))
+            archive_id = db.execute('''
+                INSERT INTO archives (filename, size_bytes, version, crawled_at, boards, threads, posts, undated_posts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (filename, os.path.getsize(filepath), ANALYTICS_VERSION, totals['crawled_at'],
+                  totals['boards'], totals['threads'], totals['posts'], totals['undated_posts'])).lastrowid
+            db.executemany('INSERT INTO boards VALUES (?, ?, ?, ?, ?)',
+                           [(archive_id, board_id, name, threads, board_posts)
+                            for board_id, (name, threads, board_posts) in boards.items()])
+            db.executemany('INSERT INTO activity VALUES (?, ?, ?, ?, ?, ?)',
+                           [(archive_id, *key, count, started[key]) for key, count in posts.items()])
+        return totals
+
+    def summary(self, filename, top=10):
+        """Totals of an archive, the span of its post dates and its most active authors and boards"""
+        with _connect(self.path) as db:
+            archive = self._archive(db, filename)
+            if archive is None:
+                return None
+            span = db.execute('''
+                SELECT MIN(day) AS first_day, MAX(day) AS last_day, COUNT(DISTINCT day) AS active_days,
+                       COUNT(DISTINCT author) AS authors
+                FROM activity WHERE archive_id = ? AND day != ''
+            ''', (archive['archive_id'],)).fetchone()
+        totals = {key: archive[key] for key in ('filename', 'crawled_at', 'boards', 'threads', 'posts', 'undated_posts')}
+        return {
+            **totals,
+            **dict(span),
+            'top_authors': self.authors(filename, limit=top),
+            'top_boards': sorted(self.boards(filename), key=lambda board: board['posts'], reverse=True)[:top],
+        }
+
+    def _query(self, filename, sql, params=()):
+        # Rows of a query on one archive's rollups; its first parameter is the archive id
+        with _connect(self.path) as db:
+            archive = self._archive(db, filename)
+            if archive is None:
+                return []
+            rows = db.execute(sql, [archive['archive_id'], *params]).fetchall()
+        return [dict(row) for row in rows]
+
+    def boards(self, filename):
+        """Per board: threads, posts, distinct authors and the span of post dates"""
+        return self._query(filename, '''
+            SELECT b.board_id, b.board_name, b.threads, b.posts,
+                   COUNT(DISTINCT a.author) AS authors,
+                   MIN(NULLIF(a.day, '')) AS first_day, MAX(NULLIF(a.day, '')) AS last_day
+            FROM boards b LEFT JOIN activity a ON a.archive_id = b.archive_id AND a.board_id = b.board_id
+            WHERE b.archive_id = ?
+            GROUP BY b.board_id ORDER BY b.board_id
+        ''')
+
+    def authors(self, filename, board_id=None, since=None, until=None, offset=0, limit=50):
+        """Authors by number of posts, most active first"""
+        where, params = _filters(board_id=board_id, since=since, until=until)
+        return self._query(filename, f'''
+            SELECT author, SUM(posts) AS posts, SUM(threads_started) AS threads_started,
+                   COUNT(DISTINCT board_id) AS boards,
+                   MIN(NULLIF(day, '')) AS first_day, MAX(NULLIF(day, '')) AS last_day
+            FROM activity WHERE archive_id = ?{where}
+            GROUP BY author ORDER BY posts DESC, author LIMIT ? OFFSET ?
+        ''', [*params, limit, offset])
+
+    def days(self, filename, board_id=None, author=None, since=None, until=None, period='day'):
+        """Posts, threads started and active authors per day (or per 'month'/'year'), oldest first"""
+        length = {'day': 10, 'month': 7, 'year': 4}[period]
+        where, params = _filters(board_id, author, since, until)
+        return self._query(filename, f'''
+            SELECT substr(day, 1, {length}) AS period, SUM(posts) AS posts,
+                   SUM(threads_started) AS threads_started, COUNT(DISTINCT author) AS authors
+            FROM activity WHERE archive_id = ? AND day != ''{where}
+            GROUP BY period ORDER BY period
+        ''', params)
+
+    def timeseries(self, filenames, board_id=None, author=None):
+        """One point per archive (in the given order): threads, posts and authors it
+        holds, optionally for one board and/or author, to follow the forum across crawls
+        """
+        where, params = _filters(board_id, author)
+        points = []
+        with _connect(self.path) as db:
+            for filename in filenames:
+                archive = self._archive(db, filename)
+                if archive is None:
+                    continue
+                row = db.execute(f'''
+                    SELECT COALESCE(SUM(posts), 0) AS posts, COALESCE(SUM(threads_started), 0) AS threads_started,
+                           COUNT(DISTINCT author) AS authors, MAX(NULLIF(day, '')) AS last_day
+                    FROM activity WHERE archive_id = ?{where}
+                ''', [archive['archive_id'], *params]).fetchone()
+                threads = archive['threads']
+                if author is not None:
+                    threads = row['threads_started']
+                elif board_id is not None:
+                    board = db.execute('SELECT threads FROM boards WHERE archive_id = ? AND board_id = ?',
+                                       (archive['archive_id'], board_id)).fetchone()
+                    threads = board['threads'] if board else 0
+                points.append({'archive': filename, 'crawled_at': archive['crawled_at'],
+                               'threads': threads, **dict(row)})
+        return points
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from archive_io import list_archives
+
+    parser = argparse.ArgumentParser(description='Activity rollups of 223 archives')
+    parser.add_argument('--archives-dir', default='archives', help='Where archives and their rollups are kept')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='Roll up archives that have no current rollups')
+    build_parser.add_argument('archives', nargs='*', help='Archive files (default: every archive file)')
+    build_parser.add_argument('--force', action='store_true', help='Redo rollups that are already stored')
+    authors_parser = commands.add_parser('authors', help='Most active authors of an archive')
+    authors_parser.add_argument('archive', help='Archive file')
+    authors_parser.add_argument('--board', type=int, help='Only this board id')
+    authors_parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    analytics = ArchiveAnalytics(args.archives_dir)
+    if args.command == 'build':
+        for path in args.archives or list_archives(args.archives_dir):
+            if args.force or not analytics.is_current(path):
+                totals = analytics.build(path)
+                print(f"📈 {totals['filename']}: {totals['posts']} posts in {totals['rows']} rollup rows")
+            else:
+                print(f"✅ {os.path.basename(path)}: up to date")
+    else:
+        filename = analytics.ensure(args.archive)
+        for author in analytics.authors(filename, board_id=args.board, limit=args.limit):
+            print(f"   {author['posts']:>7} posts  {author['threads_started']:>5} threads  {author['author']}")
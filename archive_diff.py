@@ -0,0 +1,159 @@
+"""
+Diff two archives: what changed between two crawls.
+
+Boards are aligned by board_url, threads by topic id (falling back to the
+normalized thread_url) and comments by post_id. The comparison runs as indexed
+joins between the two archives' on-disk query indexes (see archive_index.py),
+so neither archive is ever loaded into memory and the work is roughly linear
+in the number of threads and comments.
+
+Results are cached per archive pair in archives/.index/ and reused until
+either archive's index is rebuilt.
+
+Usage:
+    python archive_diff.py archives/223-archive-A.json archives/223-archive-B.json [-o diff.json]
+"""
+
+import json
+import os
+import sqlite3
+
+from archive_index import INDEX_DIRNAME, ArchiveIndex
+from archive_io import replacing
+
+
+def _rows(db, sql):
+    return [dict(row) for row in db.execute(sql)]
+
+
+def diff_indexes(index_a, index_b):
+    """Compute the change set from archive A to archive B"""
+    db = sqlite3.connect(index_a.path)
+    db.row_factory = sqlite3.Row
+    try:
+        db.execute('ATTACH DATABASE ? AS b', (index_b.path,))
+
+        # Threads present in both archives, paired by identity
+        db.execute('''
+            CREATE TEMP TABLE pairs AS
+            SELECT ta.thread_id AS a_id, tb.thread_id AS b_id
+            FROM main.threads ta JOIN b.threads tb ON tb.thread_key = ta.thread_key
+        ''')
+        db.execute('CREATE INDEX temp.pairs_by_a ON pairs (a_id)')
+
+        boards_added = _rows(db, '''
+            SELECT bb.board_url, bb.board_name FROM b.boards bb
+            WHERE NOT EXISTS (SELECT 1 FROM main.boards ba WHERE ba.board_url = bb.board_url)
+            ORDER BY bb.position
+        ''')
+        boards_removed = _rows(db, '''
+            SELECT ba.board_url, ba.board_name FROM main.boards ba
+            WHERE NOT EXISTS (SELECT 1 FROM b.boards bb WHERE bb.board_url = ba.board_url)
+            ORDER BY ba.position
+        ''')
+
+        thread_columns = 't.topic_id AS thread_id, t.thread_title, t.thread_url, t.comment_count, bd.board_url'
+        threads_added = _rows(db, f'''
+            SELECT {thread_columns} FROM b.threads t JOIN b.boards bd ON bd.position = t.board_position
+            WHERE NOT EXISTS (SELECT 1 FROM main.threads ta WHERE ta.thread_key = t.thread_key)
+            ORDER BY t.thread_id
+        ''')
+        threads_removed = _rows(db, f'''
+            SELECT {thread_columns} FROM main.threads t JOIN main.boards bd ON bd.position = t.board_position
+            WHERE NOT EXISTS (SELECT 1 FROM b.threads tb WHERE tb.thread_key = t.thread_key)
+            ORDER BY t.thread_id
+        ''')
+
+        # Comments are only compared inside threads that exist in both archives;
+        # comments of added/removed threads are implied by the thread change
+        comments_added = _rows(db, '''
+            SELECT tb.topic_id AS thread_id, cb.post_id, cb.position AS post_index
+            FROM pairs p
+            JOIN b.threads tb ON tb.thread_id = p.b_id
+            JOIN b.comments cb ON cb.thread_id = p.b_id
+            WHERE cb.post_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM main.comments ca WHERE ca.thread_id = p.a_id AND ca.post_id = cb.post_id)
+            ORDER BY p.b_id, cb.position
+        ''')
+        comments_removed = _rows(db, '''
+            SELECT ta.topic_id AS thread_id, ca.post_id, ca.position AS post_index
+            FROM pairs p
+            JOIN main.threads ta ON ta.thread_id = p.a_id
+            JOIN main.comments ca ON ca.thread_id = p.a_id
+            WHERE ca.post_id IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM b.comments cb WHERE cb.thread_id = p.b_id AND cb.post_id = ca.post_id)
+            ORDER BY p.a_id, ca.position
+        ''')
+        comments_edited = _rows(db, '''
+            SELECT tb.topic_id AS thread_id, cb.post_id, cb.position AS post_index
+            FROM pairs p
+            JOIN b.threads tb ON tb.thread_id = p.b_id
+            JOIN b.comments cb ON cb.thread_id = p.b_id
+            JOIN main.comments ca ON ca.thread_id = p.a_id AND ca.post_id = cb.post_id
+            WHERE cb.post_id IS NOT NULL AND ca.content_hash != cb.content_hash
+            ORDER BY p.b_id, cb.position
+        ''')
+    finally:
+        db.close()
+
+    return {
+        'from': os.path.basename(index_a.archive_path),
+        'to': os.path.basename(index_b.archive_path),
+        'summary': {
+            'boards_added': len(boards_added),
+            'boards_removed': len(boards_removed),
+            'threads_added': len(threads_added),
+            'threads_removed': len(threads_removed),
+            'comments_added': len(comments_added),
+            'comments_removed': len(comments_removed),
+            'comments_edited': len(comments_edited),
+        },
+        'boards': {'added': boards_added, 'removed': boards_removed},
+        'threads': {'added': threads_added, 'removed': threads_removed},
+        'comments': {'added': comments_added, 'removed': comments_removed, 'edited': comments_edited},
+    }
+
+
+def cached_diff_path(path_a, path_b, archives_dir='archives'):
+    """Diff two archive files, returning the path of the cached JSON change set"""
+    index_a = ArchiveIndex(path_a, archives_dir)
+    index_b = ArchiveIndex(path_b, archives_dir)
+    cache_path = os.path.join(archives_dir, INDEX_DIRNAME,
+                              f'diff--{os.path.basename(path_a)}--{os.path.basename(path_b)}.json')
+
+    # Valid as long as neither index has been rebuilt since the diff was written
+    if os.path.exists(cache_path):
+        cached_at = os.path.getmtime(cache_path)
+        if cached_at >= os.path.getmtime(index_a.path) and cached_at >= os.path.getmtime(index_b.path):
+            return cache_path
+
+    changes = diff_indexes(index_a, index_b)
+    with replacing(cache_path) as tmp_path, open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(changes, f, ensure_ascii=False)
+    return cache_path
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Show what changed between two 223 archives')
+    parser.add_argument('archive_a', help='Older archive file')
+    parser.add_argument('archive_b', help='Newer archive file')
+    parser.add_argument('-o', '--output', help='Write the full change set as JSON to this file')
+    parser.add_argument('--archives-dir', default='archives', help='Where indexes and cached diffs are kept')
+    args = parser.parse_args()
+
+    with open(cached_diff_path(args.archive_a, args.archive_b, args.archives_dir), encoding='utf-8') as f:
+        changes = json.load(f)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(changes, f, indent=2, ensure_ascii=False)
+
+    print(f"📊 {changes['from']} → {changes['to']}")
+    for key, value in changes['summary'].items():
+        print(f"   {key.replace('_', ' ')}: {value}")
+    for thread in changes['threads']['added'][:20]:
+        print(f"   ➕ {thread['thread_title']} ({thread['comment_count']} comments)")
+    for thread in changes['threads']['removed'][:20]:
+        print(f"   ➖ {thread['thread_title']}")
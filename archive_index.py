@@ -0,0 +1,332 @@
+"""
+Persistent indexes for the archives directory.
+
+Listing archives used to mean json.load()-ing every archive just to read its
+crawled_at and stats. The catalog keeps that header data in a small SQLite
+database (archives/.index/catalog.sqlite3), keyed by filename and invalidated
+by file size and mtime. The spider records each archive as it writes it; any
+archive the catalog doesn't know yet is indexed by reading only its header.
+
+ArchiveIndex is a per-archive SQLite index (archives/.index/<filename>.sqlite3)
+of boards, threads and the byte offsets of every comment, plus an FTS5
+full-text index over comment text, built once in a single streaming pass. It
+lets the server page through and search an archive without ever loading the
+whole JSON document.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from archive_io import ArchiveReader, file_lock, plain_archive, read_header, replacing
+from forum_urls import forum_id_from_url, topic_id_from_url
+
+INDEX_DIRNAME = '.index'
+
+# Bump when the per-archive index schema changes; stale indexes are rebuilt
+INDEX_VERSION = 5
+
+
+@contextmanager
+def _connect(path):
+    # One short-lived connection per call keeps the indexes safe to use from
+    # the server's worker threads
+    db = sqlite3.connect(path, timeout=30)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+class ArchiveCatalog:
+    """SQLite-backed cache of per-archive header metadata"""
+
+    def __init__(self, archives_dir='archives'):
+        self.archives_dir = archives_dir
+        self.index_dir = os.path.join(archives_dir, INDEX_DIRNAME)
+        self.path = os.path.join(self.index_dir, 'catalog.sqlite3')
+        os.makedirs(self.index_dir, exist_ok=True)
+        with _connect(self.path) as db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS archives (
+                    filename TEXT PRIMARY KEY,
+                    size_bytes INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    crawled_at TEXT,
+                    stats TEXT
+                )
+            ''')
+
+    def record(self, filepath, crawled_at, stats):
+        """Store the header of an archive that was just written"""
+        st = os.stat(filepath)
+        with _connect(self.path) as db:
+            db.execute('INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?)',
+                       (os.path.basename(filepath), st.st_size, st.st_mtime_ns, crawled_at, json.dumps(stats)))
+
+    def get(self, filepath):
+        """Return metadata for an archive, indexing its header if it's new or changed"""
+        filename = os.path.basename(filepath)
+        st = os.stat(filepath)
+
+        with _connect(self.path) as db:
+            row = db.execute('SELECT * FROM archives WHERE filename = ?', (filename,)).fetchone()
+
+        if row is None or row['size_bytes'] != st.st_size or row['mtime_ns'] != st.st_mtime_ns:
+            header = read_header(filepath)
+            crawled_at, stats = header.get('crawled_at', 'unknown'), header.get('stats', {})
+            self.record(filepath, crawled_at, stats)
+        else:
+            crawled_at, stats = row['crawled_at'], json.loads(row['stats'])
+
+        return {
+            'filename': filename,
+            'filepath': filepath,
+            'size_bytes': st.st_size,
+            'size_mb': round(st.st_size / 1024 / 1024, 2),
+            'crawled_at': crawled_at,
+            'stats': stats,
+            'modified_at': datetime.fromtimestamp(st.st_mtime).isoformat()
+        }
+
+
+def thread_key(topic_id, thread_url):
+    """Identity of a thread across archives: its topic id, which survives title/slug
+    changes, or the normalized thread URL when there is none"""
+    return f't{topic_id}' if topic_id is not None else (thread_url or '')
+
+
+def content_hash(comment):
+    """Fingerprint of a comment's text, used to detect edited posts. Only the
+    plain-text content counts, so archives written without content_html compare
+    cleanly with ones that have it."""
+    return hashlib.sha1((comment.get('content') or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ArchiveIndex:
+    """Per-archive SQLite index of boards, threads and comment byte offsets.
+
+    Boards are addressed by their Tapatalk forum id and threads by their topic
+    id. Listing boards and threads is answered from the index alone; comments
+    are read back from the archive by offset, one page at a time. Compressed
+    archives are indexed (and read) through their decompressed copy.
+    """
+
+    def __init__(self, archive_path, archives_dir='archives'):
+        self.archive_path = archive_path
+        self.archives_dir = archives_dir
+        self.path = os.path.join(archives_dir, INDEX_DIRNAME, os.path.basename(archive_path) + '.sqlite3')
+        with file_lock(self.path):
+            self.data_path = plain_archive(archive_path, archives_dir)
+            if not self._is_current():
+                self.build()
+
+    def _is_current(self):
+        if not os.path.exists(self.path):
+            return False
+        st = os.stat(self.data_path)
+        try:
+            with _connect(self.path) as db:
+                meta = dict(db.execute('SELECT key, value FROM meta').fetchall())
+        except sqlite3.DatabaseError:
+            return False
+        return meta.get('version') == str(INDEX_VERSION) and \
+            meta.get('size_bytes') == str(st.st_size) and meta.get('mtime_ns') == str(st.st_mtime_ns)
+
+    def build(self):
+        """Index the archive in one streaming pass (one thread in memory at a time)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        st = os.stat(self.data_path)
+        with replacing(self.path) as tmp_path, _connect(tmp_path) as db, ArchiveReader(self.data_path) as reader:
+            db.executescript('''
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE boards (
+                    position INTEGER PRIMARY KEY,
+                    board_id INTEGER NOT NULL,
+                    board_name TEXT,
+                    board_url TEXT,
+                    discovered_at TEXT,
+                    thread_count INTEGER NOT NULL,
+                    comment_count INTEGER NOT NULL
+                );
+                CREATE TABLE threads (
+                    thread_id INTEGER PRIMARY KEY,
+                    topic_id INTEGER,
+                    thread_key TEXT NOT NULL,
+                    board_id INTEGER NOT NULL,
+                    board_position INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    thread_title TEXT,
+                    thread_url TEXT,
+                    crawled_at TEXT,
+                    comment_count INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE TABLE comments (
+                    thread_id INTEGER NOT NULL,
+                    position INTEGER NOT NULL,
+                    post_id TEXT,
+                    content_hash TEXT,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (thread_id, position)
+                ) WITHOUT ROWID;
+                CREATE VIRTUAL TABLE comments_fts USING fts5(
+                    content, author, thread_title, post_date,
+                    board_id UNINDEXED, thread_id UNINDEXED, position UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                );
+            ''')
+
+            thread_id = 0
+            for board_position, (board, threads_offset) in enumerate(reader.iter_boards()):
+                board_id = forum_id_from_url(board.get('board_url'))
+                thread_count = comment_count = 0
+                for thread_position, (offset, end) in enumerate(reader.iter_threads(threads_offset)):
+                    thread_id += 1
+                    thread, comments = reader.load_thread(offset)
+                    db.executemany('INSERT INTO comments VALUES (?, ?, ?, ?, ?, ?)',
+                                   [(thread_id, position, comment.get('post_id'), content_hash(comment),
+                                     c_offset, c_end - c_offset)
+                                    for position, (comment, c_offset, c_end) in enumerate(comments)])
+                    db.executemany('INSERT INTO comments_fts VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                   [(comment.get('content'), comment.get('author'), thread.get('thread_title'),
+                                     comment.get('post_date'), board_id, thread_id, position)
+                                    for position, (comment, _, _) in enumerate(comments)])
+                    topic_id = topic_id_from_url(thread.get('thread_url'))
+                    db.execute('INSERT INTO threads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (thread_id, topic_id, thread_key(topic_id, thread.get('thread_url')),
+                                board_id, board_position, thread_position,
+                                thread.get('thread_title'), thread.get('thread_url'), thread.get('crawled_at'),
+                                len(comments), offset, end - offset))
+                    thread_count += 1
+                    comment_count += len(comments)
+                # Keyed by position: boards whose id can't be read (0) or that share one stay apart
+                db.execute('INSERT INTO boards VALUES (?, ?, ?, ?, ?, ?, ?)',
+                           (board_position, board_id, board.get('board_name'), board.get('board_url'),
+                            board.get('discovered_at'), thread_count, comment_count))
+
+            db.execute('CREATE INDEX boards_by_id ON boards (board_id)')
+            db.execute('CREATE INDEX threads_by_board ON threads (board_id, board_position, position)')
+            db.execute('CREATE INDEX threads_by_topic ON threads (topic_id)')
+            db.execute('CREATE INDEX threads_by_key ON threads (thread_key)')
+            db.execute('CREATE INDEX comments_by_post ON comments (thread_id, post_id)')
+            db.execute("INSERT INTO comments_fts (comments_fts) VALUES ('optimize')")
+            db.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('version', str(INDEX_VERSION)),
+                ('size_bytes', str(st.st_size)),
+                ('mtime_ns', str(st.st_mtime_ns)),
+            ])
+
+    def boards(self):
+        with _connect(self.path) as db:
+            rows = db.execute('''
+                SELECT board_id, board_name, board_url, discovered_at, thread_count, comment_count
+                FROM boards ORDER BY position
+            ''').fetchall()
+        return [dict(row) for row in rows]
+
+    def board(self, board_id):
+        """A board by id. Boards sharing an id are answered as one (the first one,
+        with the counts of all), like threads() lists their threads together."""
+        with _connect(self.path) as db:
+            row = db.execute('''
+                SELECT board_id, board_name, board_url, discovered_at,
+                       (SELECT SUM(thread_count) FROM boards WHERE board_id = b.board_id) AS thread_count,
+                       (SELECT SUM(comment_count) FROM boards WHERE board_id = b.board_id) AS comment_count
+                FROM boards b WHERE board_id = ? ORDER BY position LIMIT 1
+            ''', (board_id,)).fetchone()
+        return dict(row) if row else None
+
+    def threads(self, board_id, offset=0, limit=50):
+        with _connect(self.path) as db:
+            rows = db.execute('''
+                SELECT topic_id AS thread_id, thread_title, thread_url, crawled_at, comment_count
+                FROM threads WHERE board_id = ? ORDER BY board_position, position LIMIT ? OFFSET ?
+            ''', (board_id, limit, offset)).fetchall()
+        return [dict(row) for row in rows]
+
+    def thread(self, topic_id):
+        with _connect(self.path) as db:
+            row = db.execute('''
+                SELECT topic_id AS thread_id, board_id, thread_title, thread_url, crawled_at, comment_count
+                FROM threads WHERE topic_id = ? ORDER BY thread_id LIMIT 1
+            ''', (topic_id,)).fetchone()
+        return dict(row) if row else None
+
+    def comments(self, topic_id, offset=0, limit=50, fields=None):
+        """Read one page of a thread's comments from the archive by byte offset"""
+        with _connect(self.path) as db:
+            thread = db.execute('SELECT thread_id FROM threads WHERE topic_id = ? ORDER BY thread_id LIMIT 1',
+                                (topic_id,)).fetchone()
+            if thread is None:
+                return None
+            rows = db.execute('''
+                SELECT offset, length FROM comments WHERE thread_id = ? ORDER BY position LIMIT ? OFFSET ?
+            ''', (thread['thread_id'], limit, offset)).fetchall()
+
+        comments = []
+        # Looked up again: the decompressed copy may have been trimmed from the cache since
+        with open(plain_archive(self.archive_path, self.archives_dir), 'rb') as f:
+            for row in rows:
+                f.seek(row['offset'])
+                comment = json.loads(f.read(row['length']))
+                if fields is not None:
+                    comment = {key: value for key, value in comment.items() if key in fields}
+                comments.append(comment)
+        return comments
+
+    def search(self, query=None, author=None, board_id=None, since=None, offset=0, limit=20):
+        """Ranked full-text search over comments.
+
+        `query` is free text: every word must match (a trailing * makes a
+        prefix search). `author` matches the author field, `since` keeps posts
+        dated on or after an ISO date. Returns one page of results, best first,
+        with a highlighted snippet of the matching text.
+        """
+        terms = [_fts_term(word) for word in (query or '').split()]
+        if author:
+            terms.append('author : ' + _fts_phrase(author))
+        if not terms:
+            return []
+
+        sql = '''
+            SELECT t.topic_id AS thread_id, t.board_id, t.thread_title, t.thread_url,
+                   c.post_id, f.author, f.post_date, f.position AS post_index,
+                   snippet(comments_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet,
+                   bm25(comments_fts, 1.0, 2.0, 3.0) AS rank
+            FROM comments_fts f
+            JOIN threads t ON t.thread_id = f.thread_id
+            JOIN comments c ON c.thread_id = f.thread_id AND c.position = f.position
+            WHERE comments_fts MATCH ?
+        '''
+        params = [' AND '.join(terms)]
+        if board_id is not None:
+            sql += ' AND f.board_id = ?'
+            params.append(board_id)
+        if since:
+            sql += ' AND f.post_date >= ?'
+            params.append(since)
+        sql += ' ORDER BY rank LIMIT ? OFFSET ?'
+        params += [limit, offset]
+
+        with _connect(self.path) as db:
+            rows = db.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+
+def _fts_phrase(text):
+    """Quote text as an FTS5 phrase so user input can't break the query syntax"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _fts_term(word):
+    if word.endswith('*') and len(word) > 1:
+        return _fts_phrase(word.rstrip('*')) + '*'
+    return _fts_phrase(word)
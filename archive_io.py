@@ -0,0 +1,731 @@
+"""
+Archive I/O helpers shared by the crawler and the archive server.
+
+Archives are large hierarchical JSON documents (boards -> threads -> comments).
+These helpers write and read them without holding a whole forum in memory:
+
+- ThreadLog appends boards and completed threads to a JSONL file as they are
+  crawled.
+- write_archive()/iter_archive() serialise an archive whose board/thread lists
+  are lazy iterables, producing exactly the bytes json.dump(..., indent=2) would.
+- finalize_thread_log() builds the hierarchical archive from a ThreadLog, and
+  finalize_thread_logs() from several (one per crawl shard, see shard.py).
+- ArchiveReader walks an archive file in place (via mmap), yielding boards and
+  threads with their byte offsets without parsing the whole document.
+
+Archives may also be written compact and/or compressed (.json.gz, .json.zst).
+Compressed archives are read as a stream, or decompressed once into
+archives/.cache/ by plain_archive() for anything that needs random access.
+Copies in archives/.cache/ (decompressed archives, rebuilt snapshots) are
+recreated whenever they're needed, so the least recently used ones are
+deleted once they add up to CACHE_LIMIT_MB (trim_cache()).
+
+Files derived from archives (decompressed copies, indexes, rebuilt snapshots)
+may be built by several server workers at once: they are built under
+file_lock() and written through replacing(), so no one ever reads a
+half-written file.
+"""
+
+import glob
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: file_lock() only covers threads
+    fcntl = None
+
+INDENT = '  '
+
+# Archive file suffix for each ARCHIVE_COMPRESSION setting
+ARCHIVE_SUFFIXES = {None: '.json', 'gzip': '.json.gz', 'zstd': '.json.zst'}
+ARCHIVE_PATTERNS = tuple(f'223-archive-*{suffix}' for suffix in ARCHIVE_SUFFIXES.values())
+
+# Decompressed copies of compressed archives live here (inside archives_dir)
+CACHE_DIRNAME = '.cache'
+
+# Disk space the copies in CACHE_DIRNAME may take before the least recently used go
+CACHE_LIMIT_MB = int(os.environ.get('ARCHIVE_COPIES_MB', 2048))
+# Copies used this recently are kept over the limit: a request may need several at once
+CACHE_MIN_IDLE_SECS = 300
+
+_CHUNK_SIZE = 1 << 16
+
+# mkstemp() creates files only their owner can read; published files get the usual permissions
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class StreamedList:
+    """A JSON array whose items are produced lazily while writing"""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _encode(value, level):
+    """Encode a fully materialised value nested `level` deep"""
+    text = json.dumps(value, indent=2, ensure_ascii=False)
+    if level and '\n' in text:
+        # JSON strings never contain raw newlines, so this only re-indents structure
+        text = text.replace('\n', '\n' + INDENT * level)
+    return text
+
+
+def _iter_value(value, level):
+    if isinstance(value, StreamedList):
+        first = True
+        for item in value:
+            yield ('[' if first else ',') + '\n' + INDENT * (level + 1)
+            yield from _iter_value(item, level + 1)
+            first = False
+        yield '[]' if first else '\n' + INDENT * level + ']'
+    elif isinstance(value, dict) and any(isinstance(v, (StreamedList, dict)) for v in value.values()):
+        first = True
+        for key, item in value.items():
+            yield ('{' if first else ',') + '\n' + INDENT * (level + 1) + json.dumps(key, ensure_ascii=False) + ': '
+            yield from _iter_value(item, level + 1)
+            first = False
+        yield '\n' + INDENT * level + '}'
+    else:
+        yield _encode(value, level)
+
+
+def _iter_compact(value):
+    if isinstance(value, StreamedList):
+        first = True
+        for item in value:
+            yield '[' if first else ','
+            yield from _iter_compact(item)
+            first = False
+        yield '[]' if first else ']'
+    elif isinstance(value, dict) and any(isinstance(v, (StreamedList, dict)) for v in value.values()):
+        first = True
+        for key, item in value.items():
+            yield ('{' if first else ',') + json.dumps(key, ensure_ascii=False) + ':'
+            yield from _iter_compact(item)
+            first = False
+        yield '{}' if first else '}'
+    else:
+        yield json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_archive(archive, compact=False):
+    """Yield the text of an archive piece by piece.
+
+    Any list wrapped in StreamedList is consumed lazily, so boards and threads
+    can be generated from disk one at a time. The concatenated output is
+    byte-identical to json.dump(archive, f, indent=2, ensure_ascii=False), or
+    to json.dump(..., separators=(',', ':')) with compact=True.
+    """
+    return _iter_compact(archive) if compact else _iter_value(archive, 0)
+
+
+def write_archive(f, archive, compact=False):
+    """Write an archive dict to a text file object (see iter_archive)"""
+    for piece in iter_archive(archive, compact):
+        f.write(piece)
+
+
+def without_content_html(thread):
+    """Copy of a thread with content_html left out of every comment"""
+    return dict(thread, comments=[{key: value for key, value in comment.items() if key != 'content_html'}
+                                  for comment in thread['comments']])
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError('zstd archives need the zstandard package: pip install zstandard') from None
+    return zstandard
+
+
+def archive_suffix(compression):
+    """File suffix for an ARCHIVE_COMPRESSION value (None, 'gzip' or 'zstd')"""
+    if compression not in ARCHIVE_SUFFIXES:
+        raise ValueError(f'Unknown archive compression {compression!r}, expected one of: gzip, zstd')
+    return ARCHIVE_SUFFIXES[compression]
+
+
+def compression_of(path):
+    """'gzip', 'zstd' or None, from an archive's file name"""
+    if path.endswith('.gz'):
+        return 'gzip'
+    if path.endswith('.zst'):
+        return 'zstd'
+    return None
+
+
+def open_archive_output(path, compression=None):
+    """Open a text file for writing an archive, compressing it as it's written"""
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == 'zstd':
+        writer = _zstandard().ZstdCompressor(level=10).stream_writer(open(path, 'wb'))
+        return io.TextIOWrapper(writer, encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def open_archive(path):
+    """Open an archive (compressed or not) as a binary stream of its JSON bytes"""
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        return _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def iter_decompressed(path, chunk_size=_CHUNK_SIZE):
+    """Yield the uncompressed bytes of an archive in chunks"""
+    with open_archive(path) as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            yield block
+
+
+def iter_gzipped(path, chunk_size=_CHUNK_SIZE):
+    """Yield an archive's JSON bytes re-encoded as a gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in iter_decompressed(path, chunk_size):
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path for the duration of the block, shared by the
+    threads of this process and by other processes (through path + '.lock')
+    """
+    path = os.path.abspath(path)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+
+@contextmanager
+def replacing(path):
+    """Yield a new temporary file next to path, which replaces path once the block
+    completes and is removed if it fails. Every writer gets its own temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=os.path.basename(path) + '.',
+                                    suffix='.tmp')
+    os.close(fd)
+    os.chmod(tmp_path, 0o666 & ~_UMASK)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def touch_cached(path):
+    """Record a use of a copy in the cache (its access time), keeping its mtime"""
+    os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+
+
+def trim_cache(cache_dir, keep=None, limit_mb=None):
+    """Delete the least recently used copies from cache_dir until they fit in
+    limit_mb (CACHE_LIMIT_MB by default). `keep` and copies used in the last
+    CACHE_MIN_IDLE_SECS are never deleted.
+    Returns: the number of copies deleted
+    """
+    limit = (CACHE_LIMIT_MB if limit_mb is None else limit_mb) * 1024 * 1024
+    idle_since = time.time_ns() - CACHE_MIN_IDLE_SECS * 10**9
+    copies = []
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(('.lock', '.tmp')) or not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            copies.append((st.st_atime_ns, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in copies)
+    deleted = 0
+    for used_at, size, path in sorted(copies):
+        if total <= limit or used_at > idle_since:
+            break
+        if keep is not None and os.path.samefile(path, keep):
+            continue
+        try:
+            # Readers that have the file open keep reading it
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+    return deleted
+
+
+def plain_archive(path, archives_dir=None):
+    """Path of an uncompressed copy of an archive, for random access (ArchiveReader).
+
+    Plain archives are returned as is. Compressed ones are decompressed once
+    into <archives_dir>/.cache/ and refreshed when the original changes. The
+    copy carries the original's mtime, so a copy recreated after trim_cache()
+    deleted it looks the same to anything that checks it (the archive indexes).
+    """
+    if compression_of(path) is None:
+        return path
+    cache_dir = os.path.join(archives_dir or os.path.dirname(path), CACHE_DIRNAME)
+    cached = os.path.join(cache_dir, os.path.basename(path).rsplit('.', 1)[0])
+
+    def is_current():
+        return os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(path)
+
+    if is_current():
+        touch_cached(cached)
+        return cached
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(cached):
+        if not is_current():
+            with replacing(cached) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    for block in iter_decompressed(path):
+                        f.write(block)
+                os.utime(tmp_path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+    trim_cache(cache_dir, keep=cached)
+    return cached
+
+
+_BOARDS_KEY = re.compile(rb'"boards"\s*:\s*\[')
+
+
+def read_header(path):
+    """Top-level fields of an archive (forum, crawled_at, stats...) without the boards.
+
+    Compressed archives are only decompressed as far as the boards array.
+    """
+    if compression_of(path) is None:
+        with ArchiveReader(path) as reader:
+            return reader.header()
+
+    prefix = b''
+    with open_archive(path) as f:
+        while True:
+            block = f.read(_CHUNK_SIZE)
+            prefix += block
+            match = _BOARDS_KEY.search(prefix)
+            if match or not block:
+                break
+    if match is None:
+        return json.loads(prefix)
+    head = prefix[:match.start()].rstrip()
+    return json.loads(head.rstrip(b',') + b'}')
+
+
+def new_board(board_url, board_name='Unknown Board'):
+    """Create an empty board entry in the archive layout"""
+    return {
+        'board_name': board_name,
+        'board_url': board_url,
+        'discovered_at': datetime.now().isoformat(),
+        'threads': []
+    }
+
+
+class ThreadLog:
+    """Append-only JSONL log of boards and completed threads.
+
+    Each line is one record:
+        {"type": "board", "board": {...board without threads...}}
+        {"type": "thread", "board_url": "...", "thread": {...}}
+    Lines are flushed as they are written so a crash loses at most the record
+    being written. A thread logged again (e.g. completed on resume after being
+    stored incomplete) replaces its earlier record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self.threads_written = 0
+        self.comments_written = 0
+
+    def _append(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def add_board(self, board):
+        board = {key: value for key, value in board.items() if key != 'threads'}
+        self._append({'type': 'board', 'board': board})
+
+    def add_thread(self, board_url, thread_data, incomplete=False):
+        record = {'type': 'thread', 'board_url': board_url, 'thread': thread_data}
+        if incomplete:
+            # Some pages failed or were never fetched; a resumed crawl fetches it again
+            record['incomplete'] = True
+        self._append(record)
+        self.threads_written += 1
+        self.comments_written += len(thread_data['comments'])
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def scan_thread_log(path):
+    """Index a ThreadLog: board metadata plus the latest record of every thread.
+
+    Returns (boards, threads): boards maps board_url to the board fields, and
+    threads maps (board_url, thread_url) to {'offset', 'comments', 'incomplete'}
+    in order of first appearance.
+    """
+    boards = {}
+    threads = {}
+
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            line_offset = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn line left by a crash - the records around it are intact
+                continue
+            if record['type'] == 'board':
+                board = record['board']
+                known = boards.get(board['board_url'])
+                if known is None or known['board_name'] == 'Unknown Board':
+                    boards[board['board_url']] = board
+            elif record['type'] == 'thread':
+                board_url = record['board_url']
+                if board_url not in boards:
+                    boards[board_url] = {key: value for key, value in new_board(board_url).items()
+                                         if key != 'threads'}
+                threads[(board_url, record['thread']['thread_url'])] = {
+                    'offset': line_offset,
+                    'comments': len(record['thread']['comments']),
+                    'incomplete': record.get('incomplete', False),
+                }
+
+    return boards, threads
+
+
+def merge_thread_logs(paths):
+    """Scan several ThreadLogs (one per crawl shard) as if they were one.
+
+    Boards are merged by URL, preferring a named record over 'Unknown Board'.
+    A thread logged more than once under any board is kept once: a complete
+    record wins over an incomplete one, otherwise the first log wins.
+    Returns (boards, threads, duplicates): boards and threads as from
+    scan_thread_log(), each thread also carrying the 'path' of its log, and
+    duplicates counting the 'threads' and 'comments' that were dropped.
+    """
+    boards = {}
+    threads = {}
+    owners = {}
+    duplicates = {'threads': 0, 'comments': 0}
+
+    for path in paths:
+        log_boards, log_threads = scan_thread_log(path)
+        for board_url, board in log_boards.items():
+            known = boards.get(board_url)
+            if known is None or known['board_name'] == 'Unknown Board':
+                boards[board_url] = board
+        for key, thread in log_threads.items():
+            thread = dict(thread, path=path)
+            owner = owners.get(key[1])
+            if owner is not None:
+                if threads[owner]['incomplete'] and not thread['incomplete']:
+                    dropped = threads.pop(owner)
+                else:
+                    dropped, thread = thread, None
+                duplicates['threads'] += 1
+                duplicates['comments'] += dropped['comments']
+                if thread is None:
+                    continue
+            owners[key[1]] = key
+            threads[key] = thread
+
+    return boards, threads, duplicates
+
+
+def _iter_logged_threads(locations):
+    files = {}
+    try:
+        for path, offset in locations:
+            if path not in files:
+                files[path] = open(path, 'rb')
+            files[path].seek(offset)
+            yield json.loads(files[path].readline())['thread']
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def finalize_thread_log(log_path, output_path, crawl_stats=None, crawled_at=None,
+                        compact=False, content_html=True):
+    """Build the hierarchical archive from a ThreadLog with bounded memory.
+
+    Only board metadata and per-thread byte offsets are kept in memory; thread
+    bodies are read back from the log one at a time while writing. Boards are
+    sorted by name, exactly as the in-memory crawl output is. The output is
+    compressed according to its suffix (.json.gz, .json.zst).
+    Returns the stats block that was written.
+    """
+    return finalize_thread_logs([log_path], output_path, crawl_stats, crawled_at, compact, content_html)
+
+
+def finalize_thread_logs(log_paths, output_path, crawl_stats=None, crawled_at=None,
+                         compact=False, content_html=True):
+    """finalize_thread_log() over several ThreadLogs, merged by merge_thread_logs().
+
+    Threads dropped as duplicates across logs are also taken off the
+    threads_discovered, threads_completed and comments_extracted crawl counters.
+    """
+    boards, threads, duplicates = merge_thread_logs(log_paths)
+    thread_locations = {}
+    for (board_url, _), thread in threads.items():
+        thread_locations.setdefault(board_url, []).append((thread['path'], thread['offset']))
+    totals = {'threads': len(threads), 'comments': sum(thread['comments'] for thread in threads.values())}
+
+    board_list = list(boards.values())
+    board_list.sort(key=lambda b: b['board_name'])
+
+    stats = dict(crawl_stats or {
+        'boards_discovered': len(board_list),
+        'threads_discovered': totals['threads'],
+        'threads_completed': totals['threads'],
+        'comments_extracted': totals['comments'],
+    })
+    for counter, dropped in (('threads_discovered', duplicates['threads']),
+                             ('threads_completed', duplicates['threads']),
+                             ('comments_extracted', duplicates['comments'])):
+        if counter in stats:
+            stats[counter] = max(stats[counter] - dropped, 0)
+    stats.update({
+        'boards': len(board_list),
+        'threads': totals['threads'],
+        'comments': totals['comments']
+    })
+
+    def iter_boards():
+        for board in board_list:
+            board = dict(board)
+            threads = _iter_logged_threads(thread_locations.get(board['board_url'], []))
+            if not content_html:
+                threads = map(without_content_html, threads)
+            board['threads'] = StreamedList(threads)
+            yield board
+
+    with replacing(output_path) as tmp_path, open_archive_output(tmp_path, compression_of(output_path)) as f:
+        write_archive(f, {
+            'forum': '223',
+            'crawled_at': crawled_at or datetime.now().isoformat(),
+            'stats': stats,
+            'boards': StreamedList(iter_boards())
+        }, compact)
+    return stats
+
+
+# Structural scanning over raw archive bytes. _NEXT_BRACKET skips whitespace,
+# scalars and complete strings (including escaped quotes) and stops at the next
+# bracket, so matching a value's closing bracket is one regex call per bracket.
+_NEXT_BRACKET = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*([\[\]{}])')
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_SCALAR = re.compile(rb'[^,\]}\s]+')
+_WHITESPACE = re.compile(rb'\s*')
+_OPENING = frozenset(b'[{')
+
+
+class ArchiveReader:
+    """Read-only, incremental view of an archive JSON file.
+
+    The file is memory-mapped and only the values that are asked for get
+    decoded, so boards and threads can be visited one at a time with their
+    byte offsets (offset, end) into the file. Works with any JSON whitespace
+    layout, including compact archives.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self._last_end = (None, None)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _skip_ws(self, pos):
+        return _WHITESPACE.match(self.buf, pos).end()
+
+    def value_end(self, pos):
+        """Return the offset just past the JSON value starting at pos"""
+        if self._last_end[0] == pos:
+            return self._last_end[1]
+        end = self._scan_value(pos)
+        self._last_end = (pos, end)
+        return end
+
+    def _scan_value(self, pos):
+        char = self.buf[pos]
+        if char in _OPENING:
+            depth = 0
+            while True:
+                match = _NEXT_BRACKET.match(self.buf, pos)
+                if match is None:
+                    raise ValueError(f'Unterminated value in {self.path}')
+                depth += 1 if match.group(1) in (b'[', b'{') else -1
+                pos = match.end()
+                if depth == 0:
+                    return pos
+        if char == ord('"'):
+            return _STRING.match(self.buf, pos).end()
+        return _SCALAR.match(self.buf, pos).end()
+
+    def load(self, offset, end):
+        """Decode the JSON value stored at buf[offset:end]"""
+        return json.loads(self.buf[offset:end])
+
+    def iter_object(self, pos):
+        """Yield (key, value_offset) for the object starting at pos.
+
+        The end of each value is only scanned once the caller moves on (or asks
+        for it via value_end()), so breaking out early never scans a large value.
+        """
+        pos = self._skip_ws(pos + 1)
+        while self.buf[pos] != ord('}'):
+            key_end = _STRING.match(self.buf, pos).end()
+            key = json.loads(self.buf[pos:key_end])
+            pos = self._skip_ws(key_end)
+            value_pos = self._skip_ws(pos + 1)  # skip ':'
+            yield key, value_pos
+            pos = self._skip_ws(self.value_end(value_pos))
+            if self.buf[pos] == ord(','):
+                pos = self._skip_ws(pos + 1)
+
+    def iter_array(self, pos):
+        """Yield (item_offset, item_end) for the array starting at pos"""
+        array_pos = pos
+        pos = self._skip_ws(pos + 1)
+        while self.buf[pos] != ord(']'):
+            item_end = self.value_end(pos)
+            yield pos, item_end
+            pos = self._skip_ws(item_end)
+            if self.buf[pos] == ord(','):
+                pos = self._skip_ws(pos + 1)
+        # Walking the items found the array's end; remember it for value_end()
+        self._last_end = (array_pos, pos + 1)
+
+    def header(self):
+        """Return the top-level fields (forum, crawled_at, stats...) without the boards.
+
+        Scanning stops at the boards array, which the crawler always writes
+        last, so this only touches the first few hundred bytes of the file.
+        """
+        header = {}
+        for key, offset in self.iter_object(self._skip_ws(0)):
+            if key == 'boards':
+                break
+            header[key] = self.load(offset, self.value_end(offset))
+        return header
+
+    def iter_boards(self):
+        """Yield (board, threads_offset) for every board.
+
+        `board` holds the board fields except the threads list; pass
+        threads_offset to iter_threads() to visit that board's threads.
+        """
+        for key, offset in self.iter_object(self._skip_ws(0)):
+            if key != 'boards':
+                continue
+            for board_offset, _ in self.iter_array(offset):
+                board = {}
+                threads_offset = None
+                for board_key, value_offset in self.iter_object(board_offset):
+                    if board_key == 'threads':
+                        threads_offset = value_offset
+                    else:
+                        board[board_key] = self.load(value_offset, self.value_end(value_offset))
+                yield board, threads_offset
+
+    def iter_threads(self, threads_offset):
+        """Yield (thread_offset, thread_end) for each thread of a board"""
+        if threads_offset is None:
+            return
+        yield from self.iter_array(threads_offset)
+
+    def load_thread(self, thread_offset):
+        """Return (thread fields without comments, [(comment, offset, end), ...])"""
+        thread = {}
+        comments = []
+        for key, value_offset in self.iter_object(thread_offset):
+            if key == 'comments':
+                for c_offset, c_end in self.iter_array(value_offset):
+                    comments.append((self.load(c_offset, c_end), c_offset, c_end))
+            else:
+                thread[key] = self.load(value_offset, self.value_end(value_offset))
+        return thread, comments
+
+
+def list_archives(archives_dir='archives'):
+    """Archive files (plain or compressed) in archives_dir, oldest first"""
+    paths = []
+    for pattern in ARCHIVE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(archives_dir, pattern)))
+    return sorted(paths)
+
+
+def latest_archive(archives_dir='archives'):
+    """Path of the newest archive file in archives_dir, or None"""
+    archives = list_archives(archives_dir)
+    return archives[-1] if archives else None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build a 223 archive from crawl thread logs')
+    parser.add_argument('logs', nargs='+', metavar='log',
+                        help='Path to the JSONL thread log (several are merged, e.g. one per crawl shard)')
+    parser.add_argument('-o', '--output', help='Output archive path (default: archives/223-archive-<timestamp>.json); '
+                                                 'a .json.gz or .json.zst name writes a compressed archive')
+    parser.add_argument('--compact', action='store_true', help='Write without indentation')
+    parser.add_argument('--no-content-html', action='store_true', help="Leave out each comment's content_html")
+    args = parser.parse_args()
+
+    output = args.output or f"archives/223-archive-{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json"
+    stats = finalize_thread_logs(args.logs, output, compact=args.compact, content_html=not args.no_content_html)
+    print(f"✅ Wrote {output}: {stats['boards']} boards, {stats['threads']} threads, {stats['comments']} comments")
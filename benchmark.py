@@ -0,0 +1,314 @@
+"""
+Offline parse benchmark for the 223 spider.
+
+Replays saved forum pages through the spider's callbacks (parse_start_url,
+parse_board, parse_thread, parse_thread_continuation) as HtmlResponse objects,
+with no network and no Scrapy engine, and reports how fast they parse:
+pages/sec, posts/sec, time per callback and peak memory.
+
+A small corpus ships in benchmarks/fixtures/: the forum index, three boards
+and a few threads, with Tapatalk's markup but made-up members and posts, so
+the benchmark runs on a fresh checkout. A corpus of real pages is seeded from
+the crawler's HTTP cache (httpcache/ or .scrapy/httpcache/: the SQLite cache
+of http_cache.py, or Scrapy's filesystem layout), so any crawl run with
+HTTPCACHE_ENABLED leaves enough behind to build one. Save a run as a baseline
+and compare later runs against it, on the same corpus, to see whether a
+selector or data-structure change helped.
+
+Usage:
+    python benchmark.py                        # run on benchmarks/fixtures/
+    python benchmark.py --fixtures benchmarks/local seed [--cache-dir httpcache] [--max-per-kind 200]
+    python benchmark.py --fixtures benchmarks/local run [--rounds 5] [-o results.json]
+    python benchmark.py run --baseline results.json [--threshold 0.05]
+"""
+
+import ast
+import glob
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+FIXTURES_DIR = os.path.join('benchmarks', 'fixtures')
+SPIDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '223crawl.py')
+
+# Page kinds, in the order a crawl meets them, and the callback each replays through
+CALLBACKS = {
+    'index': 'parse_start_url',
+    'board': 'parse_board',
+    'thread': 'parse_thread',
+    'thread_page': 'parse_thread_continuation',
+}
+
+_THREAD_PAGE = re.compile(r'-t\d+-s\d+\.html')
+_THREAD = re.compile(r'-t\d+\.html')
+_BOARD = re.compile(r'-f\d+/?$')
+_POSTS = 'div.post.postrow, div[id^="p_"]'
+
+
+def load_spider_class(path=SPIDER_PATH):
+    """Import the spider from 223crawl.py (not importable by name)"""
+    spec = importlib.util.spec_from_file_location('spider_223crawl', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.TapatalkForumSpider
+
+
+def page_kind(url, start_url):
+    """Classify a forum URL as one of CALLBACKS, or None for anything else"""
+    url = re.sub(r'[?#].*$', '', url)
+    if url.rstrip('/') == start_url.rstrip('/'):
+        return 'index'
+    if _THREAD_PAGE.search(url):
+        return 'thread_page'
+    if _THREAD.search(url):
+        return 'thread'
+    if _BOARD.search(url):
+        return 'board'
+    return None
+
+
+def _cached_body(entry_dir):
+    """Decoded response body of one filesystem cache entry, or None"""
+    from http_cache import decode_body
+
+    with open(os.path.join(entry_dir, 'response_body'), 'rb') as f:
+        body = f.read()
+    headers_path = os.path.join(entry_dir, 'response_headers')
+    encoding = b''
+    if os.path.exists(headers_path):
+        with open(headers_path, 'rb') as f:
+            for line in f:
+                name, _, value = line.partition(b':')
+                if name.strip().lower() == b'content-encoding':
+                    encoding = value
+    return decode_body(body, encoding)
+
+
+def cache_entries(cache_dir):
+    """(url, status, decoded body or None) of every response in an HTTP cache
+    directory: SQLite cache databases and filesystem cache entries
+    """
+    from http_cache import cached_responses
+
+    for path in sorted(glob.glob(os.path.join(cache_dir, '*.sqlite3'))):
+        yield from cached_responses(path)
+    for root, _, files in sorted(os.walk(cache_dir)):
+        if 'meta' not in files or 'response_body' not in files:
+            continue
+        with open(os.path.join(root, 'meta'), encoding='utf-8') as f:
+            meta = ast.literal_eval(f.read())
+        yield meta.get('response_url') or meta['url'], meta.get('status'), _cached_body(root)
+
+
+def seed_fixtures(cache_dir, fixtures_dir=FIXTURES_DIR, max_per_kind=None, start_url=None):
+    """Copy forum pages from the HTTP cache into the fixture corpus.
+    Returns the number of pages of each kind in the corpus.
+    """
+    start_url = start_url or load_spider_class().start_urls[0]
+    pages_dir = os.path.join(fixtures_dir, 'pages')
+    os.makedirs(pages_dir, exist_ok=True)
+    manifest_path = os.path.join(fixtures_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = {page['url']: page for page in json.load(f)}
+
+    counts = {kind: 0 for kind in CALLBACKS}
+    for page in manifest.values():
+        counts[page['kind']] += 1
+
+    for url, status, body in cache_entries(cache_dir):
+        kind = page_kind(url, start_url)
+        if kind is None or status != 200 or url in manifest or body is None:
+            continue
+        if max_per_kind and counts[kind] >= max_per_kind:
+            continue
+
+        filename = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.html'
+        with open(os.path.join(pages_dir, filename), 'wb') as f:
+            f.write(body)
+        manifest[url] = {'url': url, 'kind': kind, 'file': filename}
+        counts[kind] += 1
+
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(sorted(manifest.values(), key=lambda page: page['url']), f, indent=2)
+    return counts
+
+
+def load_fixtures(fixtures_dir=FIXTURES_DIR):
+    """Read the corpus into memory as (kind, url, body, post_count), in crawl order"""
+    from parsel import Selector
+
+    with open(os.path.join(fixtures_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    kinds = list(CALLBACKS)
+    fixtures = []
+    for page in sorted(manifest, key=lambda page: (kinds.index(page['kind']), page['url'])):
+        with open(os.path.join(fixtures_dir, 'pages', page['file']), 'rb') as f:
+            body = f.read()
+        # Counted once up front so posts/sec doesn't depend on how the spider counts
+        posts = len(Selector(body=body, type='html').css(_POSTS)) if page['kind'].startswith('thread') else 0
+        fixtures.append((page['kind'], page['url'], body, posts))
+    return fixtures
+
+
+def replay(spider_cls, fixtures):
+    """Run every fixture through its callback on a fresh spider.
+    Returns {callback: [calls, seconds]} for one round.
+    """
+    from scrapy.http import HtmlResponse, Request
+
+    spider = spider_cls()
+    timings = {callback: [0, 0.0] for callback in CALLBACKS.values()}
+    for kind, url, body, _ in fixtures:
+        callback = CALLBACKS[kind]
+        response = HtmlResponse(url=url, body=body, encoding='utf-8', request=Request(url))
+        if kind == 'thread_page':
+            thread_data = {'thread_title': 'benchmark', 'thread_url': url, 'crawled_at': '', 'comments': []}
+            kwargs = {'thread_data': thread_data, 'board_url': spider_cls.start_urls[0]}
+        else:
+            kwargs = {}
+
+        started = time.perf_counter()
+        for _ in getattr(spider, callback)(response, **kwargs) or ():
+            pass
+        elapsed = time.perf_counter() - started
+
+        timings[callback][0] += 1
+        timings[callback][1] += elapsed
+    return timings
+
+
+def run_benchmark(fixtures_dir=FIXTURES_DIR, rounds=5):
+    """Time `rounds` replays of the corpus (best round wins) plus one traced for memory"""
+    if not os.path.exists(os.path.join(fixtures_dir, 'manifest.json')):
+        raise SystemExit(f'No fixture corpus in {fixtures_dir}: seed one from the HTTP cache of a crawl with '
+                         f'`python benchmark.py --fixtures {fixtures_dir} seed`')
+    spider_cls = load_spider_class()
+    logging.getLogger(spider_cls.name).setLevel(logging.ERROR)
+    fixtures = load_fixtures(fixtures_dir)
+    if not fixtures:
+        raise SystemExit(f'No fixtures in {fixtures_dir}; run `python benchmark.py --fixtures {fixtures_dir} seed` first')
+
+    # Warm-up: selector translation caches, imports
+    replay(spider_cls, fixtures)
+    best = None
+    for _ in range(rounds):
+        timings = replay(spider_cls, fixtures)
+        if best is None or sum(t for _, t in timings.values()) < sum(t for _, t in best.values()):
+            best = timings
+
+    tracemalloc.start()
+    replay(spider_cls, fixtures)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = sum(t for _, t in best.values())
+    pages = len(fixtures)
+    posts = sum(count for _, _, _, count in fixtures)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024  # kilobytes on Linux, bytes on macOS
+    return {
+        'created_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'rounds': rounds,
+        'pages': pages,
+        'posts': posts,
+        'seconds': round(seconds, 6),
+        'pages_per_sec': round(pages / seconds, 2) if seconds else None,
+        'posts_per_sec': round(posts / seconds, 2) if seconds else None,
+        'callbacks': {
+            callback: {
+                'calls': calls,
+                'seconds': round(elapsed, 6),
+                'ms_per_call': round(elapsed / calls * 1000, 3) if calls else None
+            } for callback, (calls, elapsed) in best.items()
+        },
+        'peak_python_memory_mb': round(peak_traced / 1024 / 1024, 2),
+        'max_rss_mb': round(max_rss / 1024 / 1024, 2)
+    }
+
+
+def compare(results, baseline, threshold=0.05):
+    """Print results next to a baseline. Returns False if throughput regressed by more than threshold"""
+    def change(new, old):
+        if not new or not old:
+            return '     n/a'
+        return f'{(new - old) / old:+8.1%}'
+
+    # Every change is reported so that positive means better
+    print(f"{'metric':<36}{'baseline':>12}{'current':>12}{'change':>10}")
+    for key in ('pages_per_sec', 'posts_per_sec'):
+        print(f"{key:<36}{baseline.get(key) or 0:>12}{results.get(key) or 0:>12}{change(results.get(key), baseline.get(key)):>10}")
+    key = 'peak_python_memory_mb'
+    print(f"{key:<36}{baseline.get(key) or 0:>12}{results.get(key) or 0:>12}{change(baseline.get(key), results.get(key)):>10}")
+    for callback, timing in results['callbacks'].items():
+        old = baseline.get('callbacks', {}).get(callback, {}).get('ms_per_call')
+        new = timing['ms_per_call']
+        print(f"{callback + ' ms/call':<36}{old or 0:>12}{new or 0:>12}{change(old, new):>10}")
+
+    if baseline.get('pages') != results['pages']:
+        print(f"⚠️  Corpus differs from the baseline ({baseline.get('pages')} vs {results['pages']} pages)")
+    old_rate, new_rate = baseline.get('pages_per_sec'), results['pages_per_sec']
+    return not (old_rate and new_rate and new_rate < old_rate * (1 - threshold))
+
+
+def print_results(results):
+    print(f"📄 {results['pages']} pages, {results['posts']} posts in {results['seconds']:.3f}s "
+          f"(best of {results['rounds']})")
+    print(f"   {results['pages_per_sec']} pages/sec, {results['posts_per_sec']} posts/sec")
+    for callback, timing in results['callbacks'].items():
+        if timing['calls']:
+            print(f"   {callback:<28}{timing['calls']:>6} calls {timing['seconds']:>9.3f}s {timing['ms_per_call']:>9.3f} ms/call")
+    print(f"   peak Python memory {results['peak_python_memory_mb']} MB, max RSS {results['max_rss_mb']} MB")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline parse benchmark for the 223 spider')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Fixture corpus directory')
+    # With no command, run the benchmark with its defaults
+    parser.set_defaults(command='run', rounds=5, output=None, baseline=None, threshold=0.05)
+    commands = parser.add_subparsers(dest='command')
+    seed_cmd = commands.add_parser('seed', help='Add pages from a Scrapy HTTP cache to the corpus')
+    seed_cmd.add_argument('--cache-dir', help='HTTP cache directory (default: .scrapy/httpcache or httpcache)')
+    seed_cmd.add_argument('--max-per-kind', type=int, help='Keep at most this many pages of each kind')
+    run_cmd = commands.add_parser('run', help='Replay the corpus and report parse speed')
+    run_cmd.add_argument('--rounds', type=int, default=5, help='Timed rounds; the fastest is reported')
+    run_cmd.add_argument('-o', '--output', help='Write results as JSON (use as a later --baseline)')
+    run_cmd.add_argument('--baseline', help='Results JSON from an earlier run to compare against')
+    run_cmd.add_argument('--threshold', type=float, default=0.05,
+                         help='Exit with status 1 if pages/sec drops by more than this fraction')
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        cache_dir = args.cache_dir or next(
+            (d for d in (os.path.join('.scrapy', 'httpcache'), 'httpcache') if os.path.isdir(d)), None)
+        if cache_dir is None:
+            raise SystemExit('No HTTP cache found; run a crawl with HTTPCACHE_ENABLED or pass --cache-dir')
+        counts = seed_fixtures(cache_dir, args.fixtures, args.max_per_kind)
+        print(f"✅ Corpus in {args.fixtures}: " + ', '.join(f'{count} {kind}' for kind, count in counts.items()))
+    else:
+        results = run_benchmark(args.fixtures, args.rounds)
+        print_results(results)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            print()
+            if not compare(results, baseline, args.threshold):
+                print(f"❌ pages/sec regressed by more than {args.threshold:.0%}")
+                sys.exit(1)
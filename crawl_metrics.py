@@ -0,0 +1,261 @@
+"""
+Live crawl metrics, cheap enough to leave on for every crawl.
+
+The CrawlMetrics extension (enabled in settings.py) keeps a few running
+counters from Scrapy signals and, every CRAWL_METRICS_INTERVAL seconds,
+writes a snapshot to CRAWL_STATE_DIR/metrics.json. The archive server serves
+that file at /crawl/status. A snapshot has:
+
+- requests: scheduled/received counts, response rate (recent and overall),
+  HTTP cache hits, a download latency histogram, queue depth, the current
+  concurrency and delay per download slot and bytes downloaded
+- callbacks: calls and time spent in the spider methods marked @timed
+  (parse_board, parse_thread, extract_posts...). Times include nested
+  timed calls, so parse_thread includes its extract_posts calls
+- memory: the estimated size of forum_data and of threads being assembled,
+  and the process RSS
+- progress: the spider's counters, plus an ETA from the recent thread
+  completion rate and the threads scheduled (claimed, see claim_thread) but
+  not yet completed
+
+Nothing is measured per request beyond a counter update and a histogram
+bucket, and deep object sizes are computed once per stored thread or
+fetched page, by the spider as it goes.
+"""
+
+import bisect
+import functools
+import inspect
+import json
+import os
+import resource
+import sys
+import time
+from datetime import datetime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+# Upper bounds (milliseconds) of the download latency histogram buckets; the
+# last bucket counts everything slower
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Spider counters copied into every snapshot
+PROGRESS_COUNTERS = ('boards_discovered', 'threads_discovered', 'threads_completed', 'comments_extracted',
+                     'threads_carried_over', 'thread_pages_failed', 'threads_incomplete',
+                     'duplicate_requests_skipped')
+
+
+def timed(method):
+    """Record calls and wall time of a spider method in spider.callback_times
+
+    Generator callbacks are timed while they run, not while Scrapy holds
+    them between items.
+    """
+    name = method.__name__
+
+    def record(spider, elapsed):
+        timing = spider.callback_times.setdefault(name, [0, 0.0])
+        timing[0] += 1
+        timing[1] += elapsed
+
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def timed_generator(self, *args, **kwargs):
+            results = method(self, *args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        result = next(results)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - started
+                    yield result
+            finally:
+                record(self, elapsed)
+        return timed_generator
+
+    @functools.wraps(method)
+    def timed_method(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            record(self, time.perf_counter() - started)
+    return timed_method
+
+
+def deep_sizeof(value):
+    """Approximate memory taken by a JSON-like value (dicts, lists, strings...)
+    or by an object's attributes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(deep_sizeof(item) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += deep_sizeof(vars(value))
+    return size
+
+
+def rss_bytes():
+    """Current resident set size of this process (peak RSS where /proc isn't available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class CrawlMetrics:
+    """Scrapy extension writing live crawl metrics to CRAWL_STATE_DIR/metrics.json"""
+
+    def __init__(self, crawler, path, interval):
+        self.crawler = crawler
+        self.path = path
+        self.interval = interval
+        self.task = None
+        self.started = None
+        self.requests_scheduled = 0
+        self.responses = 0
+        self.cache_hits = 0
+        self.bytes_downloaded = 0
+        self.bytes_from_cache = 0
+        self.latency_histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_total = 0.0
+        # (time, responses, threads_completed) at the previous snapshot, for recent rates
+        self.previous = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('CRAWL_METRICS_ENABLED'):
+            raise NotConfigured
+        path = os.path.join(crawler.settings.get('CRAWL_STATE_DIR', 'crawlstate'), 'metrics.json')
+        metrics = cls(crawler, path, crawler.settings.getfloat('CRAWL_METRICS_INTERVAL', 5))
+        crawler.signals.connect(metrics.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(metrics.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(metrics.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(metrics.response_received, signal=signals.response_received)
+        return metrics
+
+    def spider_opened(self, spider):
+        self.started = time.monotonic()
+        self.previous = (self.started, 0, getattr(spider, 'threads_completed', 0))
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.task = task.LoopingCall(self.write, spider)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.write(spider, closed_reason=reason)
+
+    def request_scheduled(self, request, spider):
+        self.requests_scheduled += 1
+
+    def response_received(self, response, request, spider):
+        self.responses += 1
+        if 'cached' in response.flags:
+            self.cache_hits += 1
+            self.bytes_from_cache += len(response.body)
+            return
+        self.bytes_downloaded += len(response.body)
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.latency_total += latency
+            self.latency_histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency * 1000)] += 1
+
+    def queue_depth(self):
+        """Requests waiting in the scheduler and being downloaded right now, and
+        the concurrency and delay of each download slot (see politeness.py)
+        """
+        engine = self.crawler.engine
+        slot = getattr(engine, '_slot', None) or getattr(engine, 'slot', None)
+        scheduler = getattr(slot, 'scheduler', None)
+        return {
+            'scheduled': len(scheduler) if hasattr(scheduler, '__len__') else None,
+            'downloading': len(engine.downloader.active),
+            'slots': {
+                key: {'concurrency': slot.concurrency, 'delay': slot.delay, 'waiting': len(slot.queue),
+                      'transferring': len(slot.transferring)}
+                for key, slot in engine.downloader.slots.items()
+            },
+        }
+
+    def snapshot(self, spider, closed_reason=None):
+        """Current metrics as a JSON-serializable dict"""
+        now = time.monotonic()
+        elapsed = max(now - self.started, 1e-9)
+        progress = {name: getattr(spider, name, 0) for name in PROGRESS_COUNTERS}
+        previous_time, previous_responses, previous_completed = self.previous
+        window = max(now - previous_time, 1e-9)
+        self.previous = (now, self.responses, progress['threads_completed'])
+
+        # ETA from the recent completion rate, falling back to the overall one
+        recent_rate = (progress['threads_completed'] - previous_completed) / window
+        rate = recent_rate or progress['threads_completed'] / elapsed
+        # Threads count from when they're scheduled, not when their first page is
+        # parsed, so that threads still queued are part of the ETA
+        scheduled = max(len(getattr(spider, 'scheduled_threads', ())), progress['threads_discovered'])
+        remaining = max(scheduled - progress['threads_completed'], 0)
+        eta_seconds = round(remaining / rate) if rate and not closed_reason else None
+
+        timed_latencies = sum(self.latency_histogram)
+        buckets = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        pending = getattr(spider, 'pending_threads', {})
+        return {
+            'spider': spider.name,
+            'updated_at': datetime.now().isoformat(),
+            'interval_seconds': self.interval,
+            'elapsed_seconds': round(elapsed, 1),
+            'closed': closed_reason,
+            'shard': f'{spider.shard + 1}/{spider.shards}' if getattr(spider, 'shards', 1) > 1 else None,
+            'progress': dict(progress,
+                             threads_scheduled=scheduled,
+                             threads_remaining=remaining,
+                             threads_per_minute=round(rate * 60, 1),
+                             eta_seconds=eta_seconds),
+            'requests': {
+                'scheduled': self.requests_scheduled,
+                'responses': self.responses,
+                'responses_per_minute': round((self.responses - previous_responses) / window * 60, 1),
+                'responses_per_minute_overall': round(self.responses / elapsed * 60, 1),
+                'cache_hits': self.cache_hits,
+                'bytes_downloaded': self.bytes_downloaded,
+                'bytes_from_cache': self.bytes_from_cache,
+                'queue': self.queue_depth() if not closed_reason else None,
+                'latency_ms': {
+                    'mean': round(self.latency_total / timed_latencies * 1000, 1) if timed_latencies else None,
+                    'histogram': dict(zip(buckets, self.latency_histogram)),
+                },
+            },
+            'callbacks': {
+                name: {
+                    'calls': calls,
+                    'seconds': round(seconds, 3),
+                    'mean_ms': round(seconds / calls * 1000, 3) if calls else None,
+                    'share_of_elapsed': round(seconds / elapsed, 4),
+                }
+                for name, (calls, seconds) in sorted(getattr(spider, 'callback_times', {}).items())
+            },
+            'memory': {
+                'forum_data_bytes': getattr(spider, 'forum_data_bytes', None),
+                'pending_threads': len(pending),
+                'pending_threads_bytes': getattr(spider, 'pending_threads_bytes', None),
+                'seen_threads': len(getattr(spider, 'scheduled_threads', ())),
+                'rss_bytes': rss_bytes(),
+            },
+        }
+
+    def write(self, spider, closed_reason=None):
+        """Atomically replace metrics.json with a fresh snapshot"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(spider, closed_reason), f, indent=2)
+        os.replace(tmp_path, self.path)
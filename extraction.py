@@ -0,0 +1,110 @@
+"""
+Compiled extraction of posts and board links from forum pages.
+
+The spider's selectors are written as CSS (with Scrapy's ::text and ::attr()
+extensions). Here they are translated to XPath once, with the same translator
+Scrapy uses, and compiled with lxml. They run directly on the page's lxml tree,
+without creating a Selector object for every match. The results are the same
+as response.css(...).get() would return.
+
+Tapatalk pages come in a few template variants, so some fields have fallback
+selectors (author, post date). Which of them occur on a page is checked once
+per page: a selector that matches nothing anywhere on the page can't match
+inside any one post, so it isn't tried post by post.
+"""
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+
+
+def _compile(css, first=False):
+    """Compile a CSS query to an lxml XPath; first=True keeps only the first match"""
+    xpath = _translator.css_to_xpath(css)
+    return etree.XPath(f'({xpath})[1]' if first else xpath, smart_strings=False)
+
+
+POSTS = _compile('div.post.postrow, div[id^="p_"]')
+
+# Fallback cascades, best first
+AUTHOR_SELECTORS = (
+    'span[itemprop="name"]::text',  # Tapatalk's usual author markup
+    '.username-coloured span::text, .username span::text',
+    '.display_username::text, .username::text, .author a::text',  # direct text of username elements
+)
+DATE_SELECTORS = (
+    'time::attr(datetime)',  # most reliable
+    '.timespan::attr(title)',
+)
+_AUTHOR = tuple(_compile(css, first=True) for css in AUTHOR_SELECTORS)
+_DATE = tuple(_compile(css, first=True) for css in DATE_SELECTORS)
+
+_CONTENT = _compile('.content.noskim', first=True)
+_CONTENT_TEXT = _compile('.content.noskim ::text')
+_POST_ID = _compile('::attr(id)', first=True)
+
+_LINKS = etree.XPath('descendant-or-self::a[@href]')
+_TEXT = etree.XPath('text()', smart_strings=False)
+
+
+def page_variant(root, cascade):
+    """The selectors of a fallback cascade that match anywhere on the page"""
+    return tuple(selector for selector in cascade if selector(root))
+
+
+def _first(element, cascade):
+    # Like `value = sel.css(a).get(); if not value: value = sel.css(b).get() ...`
+    for selector in cascade:
+        found = selector(element)
+        if found and found[0]:
+            return found[0]
+    return None
+
+
+def extract_post(element, index, authors=_AUTHOR, dates=_DATE):
+    """Comment dict of one post element"""
+    author = _first(element, authors)
+    content = _CONTENT_TEXT(element)
+    content_element = _CONTENT(element)
+    post_date = _first(element, dates)
+    post_id = _POST_ID(element)
+
+    return {
+        'post_index': index,
+        'post_id': post_id[0] if post_id else None,
+        'author': author.strip() if author else 'Anonymous',
+        'content': ' '.join(content).strip() if content else '',
+        'content_html': etree.tostring(content_element[0], method='html', encoding='unicode', with_tail=False)
+                        if content_element else None,
+        'post_date': post_date.strip() if post_date else None,
+    }
+
+
+def extract_posts(root, start=0):
+    """Comment dicts of every post on a thread page, numbered from start
+
+    root is the page's lxml tree (response.selector.root).
+    """
+    posts = POSTS(root)
+    if not posts:
+        return []
+    authors = page_variant(root, _AUTHOR)
+    dates = page_variant(root, _DATE)
+    return [extract_post(post, index, authors, dates) for index, post in enumerate(posts, start=start)]
+
+
+def link_texts(root):
+    """Map each href on the page to the first text of a link to it
+
+    The same as response.css(f'a[href="{href}"]::text').get() for every href,
+    in one pass over the page's links.
+    """
+    texts = {}
+    for link in _LINKS(root):
+        href = link.get('href')
+        if href not in texts:
+            text = _TEXT(link)
+            if text:
+                texts[href] = text[0]
+    return texts
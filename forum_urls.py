@@ -0,0 +1,109 @@
+"""
+Canonical forum URLs, shared by the crawler, the archives and the indexes.
+
+The same Tapatalk page is reachable under many URLs: with or without www,
+over http or https, with session ids or other query parameters, and for
+threads, once per page (-sNUM.html). canonical_url() maps all of them to the
+one URL a board or thread is stored under; canonical_request_url() does the
+same for a single page, keeping its page offset, and is what request
+fingerprints (and so the duplicate filter and HTTP cache) are based on.
+"""
+
+import re
+import weakref
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+FORUM_HOST = 'www.tapatalk.com'
+
+# Query parameters that only identify a browsing session
+SESSION_PARAMS = frozenset({'sid', 's', 'phpsessid', 'sessionid', 'jsessionid'})
+
+_SESSION_PATH_PARAM = re.compile(r';(?:jsessionid|sid)=[^/]*', re.IGNORECASE)
+_THREAD_PATH = re.compile(r'-t\d+(?:-s\d+)?\.html$')
+_PAGE_SUFFIX = re.compile(r'-s\d+\.html$')
+_FORUM_ID = re.compile(r'-f(\d+)/?$')
+_BOARD_PAGE = re.compile(r'-f(\d+)(?:/|$)')
+_TOPIC_ID = re.compile(r'-t(\d+)(?:-s\d+)?\.html')
+
+
+def _canonical_origin(parts):
+    host = (parts.hostname or '').lower()
+    if host == 'tapatalk.com' or host.endswith('.tapatalk.com'):
+        return 'https', FORUM_HOST
+    return parts.scheme, parts.netloc.lower()
+
+
+def canonical_request_url(url):
+    """Canonical URL of one forum page.
+
+    Unifies scheme and host of forum URLs, drops the fragment and session ids and sorts the
+    remaining query. Thread pages are fully addressed by their path, so their
+    query is dropped entirely; the -sNUM page offset is kept.
+    """
+    parts = urlsplit(url)
+    path = _SESSION_PATH_PARAM.sub('', parts.path) or '/'
+    if _THREAD_PATH.search(path):
+        query = ''
+    else:
+        query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                                 if key.lower() not in SESSION_PARAMS))
+    return urlunsplit((*_canonical_origin(parts), path, query, ''))
+
+
+def canonical_url(url):
+    """Canonical URL of a board or thread: every page and URL variant of it maps here"""
+    parts = urlsplit(canonical_request_url(url))
+    return urlunsplit((parts.scheme, parts.netloc, _PAGE_SUFFIX.sub('.html', parts.path), '', ''))
+
+
+def forum_id_from_url(board_url):
+    """Tapatalk board id (the NUM in -fNUM/), or 0 for the forum root"""
+    match = _FORUM_ID.search(board_url or '')
+    return int(match.group(1)) if match else 0
+
+
+def topic_id_from_url(thread_url):
+    """Tapatalk topic id (the NUM in -tNUM.html), or None"""
+    match = _TOPIC_ID.search(thread_url or '')
+    return int(match.group(1)) if match else None
+
+
+def page_type(url):
+    """'thread' for any page of a thread, 'board' for a board listing page, 'other' for the rest"""
+    path = urlsplit(url).path
+    if _THREAD_PATH.search(path):
+        return 'thread'
+    if _BOARD_PAGE.search(path):
+        return 'board'
+    return 'other'
+
+
+def board_shard(url, shards):
+    """Crawl shard (0..shards-1) that owns the board of a board page URL, or
+    None if the URL isn't a board page. Boards are dealt out by board id.
+    """
+    match = _BOARD_PAGE.search(urlsplit(url).path)
+    return int(match.group(1)) % shards if match else None
+
+
+class CanonicalRequestFingerprinter:
+    """Request fingerprinter (REQUEST_FINGERPRINTER_CLASS) that fingerprints the
+    canonical page URL, so URL variants of one page are downloaded and cached once
+    """
+
+    def __init__(self, crawler=None):
+        # Imported here so the server can use this module without loading Scrapy
+        from scrapy.utils.request import RequestFingerprinter
+        self._fingerprinter = RequestFingerprinter(crawler)
+        self._cache = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def fingerprint(self, request):
+        fingerprint = self._cache.get(request)
+        if fingerprint is None:
+            fingerprint = self._fingerprinter.fingerprint(request.replace(url=canonical_request_url(request.url)))
+            self._cache[request] = fingerprint
+        return fingerprint
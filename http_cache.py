@@ -0,0 +1,326 @@
+"""
+Persistent HTTP cache for the crawler, revalidated instead of wiped.
+
+Crawls used to start by deleting the cache, so it never saved a request
+across runs. This cache is kept between crawls instead, and a page is only
+downloaded again once it may have changed:
+
+- ForumCachePolicy decides how long a cached page stays fresh from what kind of
+  page it is (HTTPCACHE_FRESHNESS): the forum index, board listings and the
+  last page of a thread (where new replies land) for a short time, older
+  thread pages, which rarely change, for a long time. A page past its freshness
+  is requested again with If-None-Match / If-Modified-Since when the forum sent
+  an ETag or Last-Modified for it, and a 304 Not Modified reuses the cached
+  copy. HTTPCACHE_FRESH = True treats every cached page as stale and fetches
+  all of it again (a fresh full crawl), refreshing the cache as it goes.
+- SqliteCacheStorage keeps the cache in a single SQLite database
+  (httpcache/<spider>.sqlite3) with zlib-compressed bodies, instead of a
+  directory of files per response. Several crawl processes (shards) can
+  share it.
+- ForumHttpCacheMiddleware logs the cache's hit, revalidation and miss rates
+  when the crawl closes.
+
+Usage:
+    python http_cache.py stats [--cache-dir .scrapy/httpcache]
+    python http_cache.py prune --older-than 90
+"""
+
+import gzip
+import os
+import re
+import sqlite3
+import time
+import zlib
+from datetime import datetime
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+from forum_urls import page_type
+
+# Seconds a cached page is served without asking the forum, by page kind
+# (overridden per kind by the HTTPCACHE_FRESHNESS setting)
+DEFAULT_FRESHNESS = {
+    'index': 3600,  # forum index and anything else that isn't a board or thread
+    'board': 3600,
+    'last_thread_page': 3600,
+    'thread_page': 30 * 86400,  # a thread page followed by further pages
+}
+
+# A link to a following page, on thread pages (see the pagination selectors in 223crawl.py)
+_NEXT_PAGE = re.compile(rb'''rel=["']?next\b|class=["']arrow next\b''')
+
+
+def decode_body(body, content_encoding):
+    """Response body with its Content-Encoding undone, or None for an encoding
+    this can't decode. Cached responses are stored before Scrapy's
+    HttpCompressionMiddleware decompresses them.
+    """
+    encoding = (content_encoding or b'').strip().lower()
+    if not encoding or encoding == b'identity':
+        return body
+    try:
+        if encoding in (b'gzip', b'x-gzip'):
+            return gzip.decompress(body)
+        if encoding == b'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except (OSError, EOFError, zlib.error):
+        return None
+    return None
+
+
+def page_kind(url, body, content_encoding=None):
+    """Freshness class (a DEFAULT_FRESHNESS key) of a cached page"""
+    kind = page_type(url)
+    if kind == 'board':
+        return 'board'
+    if kind != 'thread':
+        return 'index'
+    body = decode_body(body, content_encoding)
+    # An undecodable page is treated as a last page, which is revalidated soonest
+    return 'thread_page' if body is not None and _NEXT_PAGE.search(body) else 'last_thread_page'
+
+
+class ForumCachePolicy:
+    """HTTPCACHE_POLICY: per-page-kind freshness, revalidated with conditional requests
+
+    The forum's own Cache-Control headers are ignored (forum software usually
+    marks every page uncacheable); its validators are used when it sends them.
+    """
+
+    def __init__(self, settings):
+        self.ignore_schemes = settings.getlist('HTTPCACHE_IGNORE_SCHEMES')
+        self.ignore_http_codes = {int(code) for code in settings.getlist('HTTPCACHE_IGNORE_HTTP_CODES')}
+        self.freshness = dict(DEFAULT_FRESHNESS, **settings.getdict('HTTPCACHE_FRESHNESS'))
+        self.refetch_all = settings.getbool('HTTPCACHE_FRESH')
+
+    def should_cache_request(self, request):
+        return urlparse_cached(request).scheme not in self.ignore_schemes
+
+    def should_cache_response(self, response, request):
+        # Error and rate limiting responses would be replayed for as long as
+        # they stayed fresh
+        return response.status < 400 and response.status not in self.ignore_http_codes
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if self.refetch_all:
+            return False
+        stored_at = request.meta.get('cache_timestamp', 0)
+        kind = page_kind(cachedresponse.url, cachedresponse.body, cachedresponse.headers.get(b'Content-Encoding'))
+        if time.time() - stored_at < self.freshness[kind]:
+            return True
+        # Stale: ask the forum whether the page changed since it was cached
+        if b'ETag' in cachedresponse.headers:
+            request.headers[b'If-None-Match'] = cachedresponse.headers[b'ETag']
+        if b'Last-Modified' in cachedresponse.headers:
+            request.headers[b'If-Modified-Since'] = cachedresponse.headers[b'Last-Modified']
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        # 304 Not Modified; a server error also falls back to the cached copy
+        return response.status == 304 or response.status >= 500
+
+
+def _connect(path):
+    db = sqlite3.connect(path, timeout=60, isolation_level=None)
+    # WAL lets crawl shards read while another one writes
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            fingerprint BLOB PRIMARY KEY,
+            url TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            headers BLOB NOT NULL,
+            body BLOB NOT NULL,
+            compressed INTEGER NOT NULL,
+            stored_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    return db
+
+
+def cache_path(cache_dir, spider_name):
+    return os.path.join(cache_dir, f'{spider_name}.sqlite3')
+
+
+class SqliteCacheStorage:
+    """HTTPCACHE_STORAGE: every cached response in one SQLite database
+
+    Entries neither stored again nor confirmed by a 304 within
+    HTTPCACHE_EXPIRATION_SECS (0 = never) are treated as missing and deleted
+    when a crawl starts.
+    """
+
+    def __init__(self, settings):
+        self.cache_dir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.db = None
+
+    def open_spider(self, spider):
+        path = cache_path(self.cache_dir, spider.name)
+        self.db = _connect(path)
+        if self.expiration_secs > 0:
+            self.db.execute('DELETE FROM responses WHERE stored_at < ?', (time.time() - self.expiration_secs,))
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        spider.logger.debug(f"Using SQLite cache storage in {path}")
+
+    def close_spider(self, spider):
+        self.db.close()
+
+    def retrieve_response(self, spider, request):
+        row = self.db.execute('SELECT url, status, headers, body, compressed, stored_at FROM responses '
+                              'WHERE fingerprint = ?', (self._fingerprinter.fingerprint(request),)).fetchone()
+        if row is None:
+            return None
+        url, status, raw_headers, body, compressed, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None
+        if compressed:
+            body = zlib.decompress(body)
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        request.meta['cache_timestamp'] = stored_at
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        # Bodies the forum already sent compressed are stored as they are
+        compressed = b'Content-Encoding' not in response.headers
+        body = zlib.compress(response.body) if compressed else response.body
+        self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (self._fingerprinter.fingerprint(request), response.url, response.status,
+                         headers_dict_to_raw(response.headers), body, int(compressed), time.time()))
+
+    def touch(self, request, cachedresponse):
+        """Restart a cached entry's freshness after the forum confirmed it (a 304),
+        keeping its body and storing its current headers (validators)"""
+        now = time.time()
+        self.db.execute('UPDATE responses SET headers = ?, stored_at = ? WHERE fingerprint = ?',
+                        (headers_dict_to_raw(cachedresponse.headers), now, self._fingerprinter.fingerprint(request)))
+        request.meta['cache_timestamp'] = now
+
+
+def cache_report(stats):
+    """One line summing up how the HTTP cache did, from the crawl's stats, or None"""
+    fresh = stats.get('httpcache/hit', 0)
+    revalidated = stats.get('httpcache/revalidate', 0)
+    changed = stats.get('httpcache/invalidate', 0)
+    missing = stats.get('httpcache/miss', 0)
+    lookups = fresh + revalidated + changed + missing
+    if not lookups:
+        return None
+
+    def share(count):
+        return f'{count} ({count / lookups:.1%})'
+
+    return (f"🗄️  HTTP cache: {lookups} lookups | fresh {share(fresh)} | revalidated unchanged {share(revalidated)} | "
+            f"changed {share(changed)} | not cached {share(missing)}")
+
+
+class ForumHttpCacheMiddleware(HttpCacheMiddleware):
+    """Scrapy's HttpCacheMiddleware, reporting the cache's hit rates when the crawl closes
+
+    A page the forum confirms with a 304 is fresh again from then on, rather
+    than being revalidated on every crawl and eventually expired.
+    """
+
+    def process_response(self, request, response, *args, **kwargs):
+        cachedresponse = request.meta.get('cached_response')
+        result = super().process_response(request, response, *args, **kwargs)
+        if response.status == 304 and cachedresponse is not None and result is cachedresponse:
+            # Scrapy before 2.13 neither stores a revalidated response again nor
+            # takes the 304's validators; newer releases do both, which this repeats
+            for header in (b'ETag', b'Last-Modified'):
+                if header in response.headers:
+                    cachedresponse.headers[header] = response.headers[header]
+            self.storage.touch(request, cachedresponse)
+        return result
+
+    def spider_closed(self, spider):
+        super().spider_closed(spider)
+        report = cache_report(self.stats.get_stats())
+        if report:
+            spider.logger.info(report)
+
+
+def cached_responses(path):
+    """(url, status, body with its Content-Encoding undone or None) of every entry of a cache database"""
+    db = _connect(path)
+    try:
+        for url, status, raw_headers, body, compressed in db.execute(
+                'SELECT url, status, headers, body, compressed FROM responses'):
+            if compressed:
+                body = zlib.decompress(body)
+            yield url, status, decode_body(body, Headers(headers_raw_to_dict(raw_headers)).get(b'Content-Encoding'))
+    finally:
+        db.close()
+
+
+def cache_stats(path):
+    """Entries, stored bytes and age range of a cache database, per page kind"""
+    kinds = {}
+    db = _connect(path)
+    try:
+        for url, body, compressed, raw_headers, stored_at in db.execute(
+                'SELECT url, body, compressed, headers, stored_at FROM responses'):
+            size = len(body)
+            if compressed:
+                body = zlib.decompress(body)
+            headers = Headers(headers_raw_to_dict(raw_headers))
+            kind = kinds.setdefault(page_kind(url, body, headers.get(b'Content-Encoding')),
+                                    {'entries': 0, 'bytes': 0, 'validators': 0, 'oldest': stored_at, 'newest': stored_at})
+            kind['entries'] += 1
+            kind['bytes'] += size
+            kind['validators'] += b'ETag' in headers or b'Last-Modified' in headers
+            kind['oldest'] = min(kind['oldest'], stored_at)
+            kind['newest'] = max(kind['newest'], stored_at)
+    finally:
+        db.close()
+    return kinds
+
+
+def prune(path, older_than_secs):
+    """Delete entries stored more than older_than_secs ago; returns how many"""
+    db = _connect(path)
+    try:
+        deleted = db.execute('DELETE FROM responses WHERE stored_at < ?', (time.time() - older_than_secs,)).rowcount
+        db.execute('VACUUM')
+    finally:
+        db.close()
+    return deleted
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description="Inspect or prune the crawler's HTTP cache")
+    parser.add_argument('--cache-dir', help='HTTP cache directory (default: .scrapy/httpcache or httpcache)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='Show cached pages per kind')
+    prune_cmd = commands.add_parser('prune', help='Delete entries not refreshed for a while')
+    prune_cmd.add_argument('--older-than', type=float, required=True, metavar='DAYS', help='Age in days')
+    args = parser.parse_args()
+
+    cache_dir = args.cache_dir or next(
+        (d for d in (os.path.join('.scrapy', 'httpcache'), 'httpcache') if os.path.isdir(d)), None)
+    databases = sorted(glob.glob(os.path.join(cache_dir, '*.sqlite3'))) if cache_dir else []
+    if not databases:
+        raise SystemExit('No HTTP cache database found; pass --cache-dir')
+
+    for path in databases:
+        print(f"🗄️  {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+        if args.command == 'prune':
+            print(f"   🧹 Deleted {prune(path, args.older_than * 86400)} entries")
+            continue
+        for name, kind in sorted(cache_stats(path).items()):
+            oldest, newest = (datetime.fromtimestamp(kind[key]).strftime('%Y-%m-%d %H:%M') for key in ('oldest', 'newest'))
+            print(f"   {name:<18} {kind['entries']:>7} pages  {kind['bytes'] / 1e6:>8.1f} MB  "
+                  f"{kind['validators']} with ETag/Last-Modified  stored {oldest} .. {newest}")
@@ -0,0 +1,227 @@
+"""
+Adaptive politeness: crawl as fast as the forum takes it, and no faster.
+
+DOWNLOAD_DELAY and CONCURRENT_REQUESTS_PER_DOMAIN/_PER_IP only set where a
+crawl starts. Every ADAPTIVE_THROTTLE_INTERVAL seconds the AdaptiveThrottle
+extension (enabled in settings.py) looks at the responses each download slot,
+i.e. the forum's host, got since its last look, and adjusts that slot's
+concurrency and delay:
+
+- 429 Too Many Requests or 503 Service Unavailable: back off hard, halving
+  concurrency and doubling the delay. A Retry-After header on such a response
+  raises the delay to it right away.
+- Slow responses (p90 latency over ADAPTIVE_THROTTLE_TARGET_LATENCY, or a
+  median more than twice the lowest median seen so far and over a quarter of
+  the target) or other server errors: back off gently, one request less at a time and 1.5 times the delay.
+- Healthy responses while requests are waiting for the slot: speed up, first
+  by shortening the delay down to its floor, then by one more concurrent
+  request. The delay halves at each step until it gets near the delay that
+  last drew a 429/503, and shrinks by 15% per step from there on.
+
+Every change stays within ADAPTIVE_THROTTLE_MIN/MAX_CONCURRENCY and
+ADAPTIVE_THROTTLE_MIN/MAX_DELAY and is logged with the numbers behind it.
+Cached responses aren't downloaded, so they don't count. This replaces
+Scrapy's AutoThrottle, which only looks at latency; with both enabled, this
+one stays off.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+# Statuses that mean "too fast"
+THROTTLE_STATUSES = (429, 503)
+
+# Responses a slot needs before its latency is judged
+MIN_SAMPLES = 3
+
+# Delay (seconds) a backoff starts from when a slot had no delay at all
+MIN_BACKOFF_DELAY = 0.25
+
+logger = logging.getLogger('politeness')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header (delay-seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    value = value.decode('latin-1').strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _new_window():
+    # What a slot got since its last adjustment
+    return {'latencies': [], 'throttled': 0, 'errors': 0}
+
+
+class AdaptiveThrottle:
+    """Scrapy extension adjusting each download slot's concurrency and delay"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.interval = settings.getfloat('ADAPTIVE_THROTTLE_INTERVAL', 10)
+        self.target_latency = settings.getfloat('ADAPTIVE_THROTTLE_TARGET_LATENCY', 2.0)
+        self.min_concurrency = settings.getint('ADAPTIVE_THROTTLE_MIN_CONCURRENCY', 1)
+        self.max_concurrency = settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 8)
+        self.min_delay = settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.25)
+        self.max_delay = settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 30)
+        self.windows = {}
+        # Per slot: the (concurrency, delay) last set, the lowest median latency
+        # seen, the delay that last drew a 429/503, and the delay from before a
+        # Retry-After pause
+        self.targets = {}
+        self.baselines = {}
+        self.limits = {}
+        self.paused = {}
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('ADAPTIVE_THROTTLE_ENABLED'):
+            raise NotConfigured
+        if crawler.settings.getbool('AUTOTHROTTLE_ENABLED'):
+            logger.warning("⚠️  AUTOTHROTTLE_ENABLED is set, so the adaptive throttle is off")
+            raise NotConfigured
+        throttle = cls(crawler)
+        crawler.signals.connect(throttle.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(throttle.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(throttle.response_downloaded, signal=signals.response_downloaded)
+        return throttle
+
+    def spider_opened(self, spider):
+        self.task = task.LoopingCall(self.adjust)
+        self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+        if not self.targets:
+            return
+        stats = self.crawler.stats
+        ended = ', '.join(f'{key} at concurrency {concurrency}, delay {delay:.2f}s'
+                          for key, (concurrency, delay) in self.targets.items())
+        logger.info(f"🚦 Adaptive throttle: {stats.get_value('adaptive_throttle/backoffs', 0)} backoffs, "
+                    f"{stats.get_value('adaptive_throttle/speedups', 0)} speedups, "
+                    f"{stats.get_value('adaptive_throttle/throttled_responses', 0)}× 429/503; "
+                    f"ended with {ended}")
+
+    def slot(self, key):
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None and key in self.targets and (slot.concurrency, slot.delay) != self.targets[key]:
+            # The downloader drops idle slots and recreates them from the
+            # settings; carry on from where the throttle left the old one
+            slot.concurrency, slot.delay = self.targets[key]
+        return slot
+
+    def response_downloaded(self, response, request, spider):
+        key = request.meta.get('download_slot')
+        slot = self.slot(key)
+        if slot is None:
+            return
+        if key not in self.targets:
+            self.set(key, slot, slot.concurrency, slot.delay, 'starting point within bounds')
+
+        window = self.windows.setdefault(key, _new_window())
+        if response.status in THROTTLE_STATUSES:
+            window['throttled'] += 1
+            self.crawler.stats.inc_value('adaptive_throttle/throttled_responses')
+            wait = retry_after_seconds(response.headers.get(b'Retry-After'))
+            if wait is not None and wait > slot.delay:
+                self.paused.setdefault(key, (slot.delay, time.monotonic() + wait))
+                self.set(key, slot, slot.concurrency, wait, f'Retry-After {wait:g}s on a {response.status}')
+        elif response.status >= 500:
+            window['errors'] += 1
+        else:
+            latency = request.meta.get('download_latency')
+            if latency is not None:
+                window['latencies'].append(latency)
+
+    def adjust(self):
+        """Adjust every slot that got enough responses since its last adjustment"""
+        for key, window in list(self.windows.items()):
+            slot = self.slot(key)
+            if slot is None or self.adjust_slot(key, slot, window):
+                del self.windows[key]
+
+    def adjust_slot(self, key, slot, window):
+        """Back off, speed up or hold one slot
+        Returns: whether the window was used (False while it has too few responses)
+        """
+        if window['throttled']:
+            # Back off from where the slot was before any Retry-After pause,
+            # but not below what's left of the pause
+            delay, pause_ends = self.paused.pop(key, (slot.delay, 0))
+            self.limits[key] = delay
+            delay = max(self.backoff_base(delay) * 2, pause_ends - time.monotonic())
+            self.set(key, slot, slot.concurrency // 2, delay, f"{window['throttled']}× 429/503", slower=True)
+            return True
+
+        latencies = window['latencies']
+        if len(latencies) + window['errors'] < MIN_SAMPLES:
+            return False
+
+        reason = None
+        summary = f"{len(latencies) + window['errors']} responses"
+        if latencies:
+            p50, p90 = percentile(latencies, 0.5), percentile(latencies, 0.9)
+            baseline = self.baselines[key] = min(self.baselines.get(key, p50), p50)
+            summary += f", p50 {p50 * 1000:.0f}ms, p90 {p90 * 1000:.0f}ms"
+            if p90 > self.target_latency:
+                reason = f'p90 over {self.target_latency:g}s'
+            elif p50 > max(2 * baseline, self.target_latency / 4):
+                reason = f'median over twice the best {baseline * 1000:.0f}ms'
+        if window['errors']:
+            reason = f"{window['errors']} server errors"
+
+        if reason:
+            self.set(key, slot, slot.concurrency - 1, self.backoff_base(slot.delay) * 1.5,
+                     f'{reason}; {summary}')
+        elif slot.queue:
+            # Requests are waiting for this slot: there's throughput to gain
+            if slot.delay > self.min_delay:
+                limit = self.limits.get(key)
+                delay = slot.delay * (0.85 if limit is not None and slot.delay <= 2 * limit else 0.5)
+                self.set(key, slot, slot.concurrency, delay if delay >= 0.01 else 0,
+                         f'healthy, {len(slot.queue)} waiting; {summary}')
+            elif slot.concurrency < self.max_concurrency:
+                self.set(key, slot, slot.concurrency + 1, slot.delay, f'healthy, {len(slot.queue)} waiting; {summary}')
+        return True
+
+    def backoff_base(self, delay):
+        return max(delay, self.min_delay) if delay >= 0.01 else max(self.min_delay, MIN_BACKOFF_DELAY)
+
+    def set(self, key, slot, concurrency, delay, reason, slower=None):
+        """Move a slot to a new concurrency and delay, within bounds, and log why
+        slower: whether this is a backoff, if it isn't plain from the numbers
+        (backing off from before a Retry-After pause can shorten the delay)
+        """
+        concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        delay = round(min(max(delay, self.min_delay), self.max_delay), 3)
+        if (concurrency, delay) != (slot.concurrency, slot.delay):
+            if slower is None:
+                slower = concurrency < slot.concurrency or delay > slot.delay
+            logger.info(f"{'🐢' if slower else '🐇'} {key}: concurrency {slot.concurrency} → {concurrency}, "
+                        f"delay {slot.delay:.2f}s → {delay:.2f}s ({reason})")
+            if key in self.targets:
+                self.crawler.stats.inc_value(f"adaptive_throttle/{'backoffs' if slower else 'speedups'}")
+        slot.concurrency, slot.delay = concurrency, delay
+        self.targets[key] = (concurrency, delay)
@@ -28,14 +28,22 @@ show_help() {
     echo ""
     echo "Options:"
     echo "  full (default) - Full crawl of entire forum"
+    echo "  fresh          - Full crawl that downloads every page again (ignores the HTTP cache)"
+    echo "  incremental    - Only fetch threads changed since the newest archive"
+    echo "  resume         - Continue an interrupted crawl from its checkpoint"
+    echo "  sharded        - Full crawl split by board over several processes (-j N, --resume)"
     echo "  test           - Test crawl (only 10 pages)"
     echo "  debug          - Full crawl with debug logging"
-    echo "  slow           - Slower crawl (3s delay, more polite)"
+    echo "  slow           - Slower crawl (3s delay or more, more polite)"
     echo "  help           - Show this help message"
     echo ""
     echo "Examples:"
     echo "  ./run_crawler.sh          # Runs full crawl"
     echo "  ./run_crawler.sh test     # Quick test"
+    echo "  ./run_crawler.sh incremental  # Nightly update"
+    echo "  ./run_crawler.sh resume   # After a crash or Ctrl+C"
+    echo "  ./run_crawler.sh sharded -j 8  # 8 crawler processes, one merged archive"
+    echo "  ./run_crawler.sh fresh    # Full crawl without using cached pages"
     echo "  ./run_crawler.sh debug    # Debug mode"
     echo ""
 }
@@ -52,8 +60,6 @@ OPTION="${1:-full}"
 
 case $OPTION in
     full)
-        echo "Clearing cache for fresh data..."
-        rm -rf httpcache/ .scrapy/httpcache/
         echo "Running FULL crawl of entire forum..."
         echo "Output: archives/223-archive-<timestamp>.json"
         echo "Note: This will take several minutes"
@@ -61,9 +67,43 @@ case $OPTION in
             -s ROBOTSTXT_OBEY=False \
             -s LOG_LEVEL=INFO
         ;;
+    fresh)
+        echo "Running FULL crawl, downloading every page again..."
+        echo "Output: archives/223-archive-<timestamp>.json"
+        echo "Note: Ignores the HTTP cache and rewrites it"
+        scrapy runspider 223crawl.py \
+            -s ROBOTSTXT_OBEY=False \
+            -s LOG_LEVEL=INFO \
+            -s HTTPCACHE_FRESH=True
+        ;;
+    incremental)
+        echo "Running INCREMENTAL crawl against the newest archive..."
+        echo "Output: archives/223-archive-<timestamp>.json"
+        echo "Note: Unchanged threads are copied from the previous archive"
+        scrapy runspider 223crawl.py \
+            -s ROBOTSTXT_OBEY=False \
+            -s LOG_LEVEL=INFO \
+            -s INCREMENTAL_CRAWL=True
+        ;;
+    resume)
+        echo "Resuming the interrupted crawl from crawlstate/checkpoint.json..."
+        echo "Output: archives/223-archive-<timestamp>.json"
+        echo "Note: Threads completed before the interruption are not fetched again"
+        scrapy runspider 223crawl.py \
+            -s ROBOTSTXT_OBEY=False \
+            -s LOG_LEVEL=INFO \
+            -s RESUME_CRAWL=True
+        ;;
+    sharded)
+        shift
+        echo "Running SHARDED crawl, one process per group of boards..."
+        echo "Output: archives/223-archive-<timestamp>.json"
+        echo "Note: Shard logs are in crawlstate/shards/<n>/crawl.log"
+        python3 shard.py crawl "$@" \
+            -s ROBOTSTXT_OBEY=False \
+            -s LOG_LEVEL=INFO
+        ;;
     test)
-        echo "Clearing cache for fresh data..."
-        rm -rf httpcache/ .scrapy/httpcache/
         echo "Running test crawl (limited to 10 requests)..."
         echo "Output: output_test.json"
         scrapy runspider 223crawl.py -o output_test.json \
@@ -71,8 +111,6 @@ case $OPTION in
             -s CLOSESPIDER_PAGECOUNT=10
         ;;
     debug)
-        echo "Clearing cache for fresh data..."
-        rm -rf httpcache/ .scrapy/httpcache/
         echo "Running FULL crawl with DEBUG logging..."
         echo "Output: archives/223-archive-<timestamp>.json"
         echo "Note: This will be VERY verbose"
@@ -81,16 +119,16 @@ case $OPTION in
             -s LOG_LEVEL=DEBUG
         ;;
     slow)
-        echo "Clearing cache for fresh data..."
-        rm -rf httpcache/ .scrapy/httpcache/
         echo "Running slower, more polite crawl..."
         echo "Output: archives/223-archive-<timestamp>.json"
-        echo "Note: 3 second delay between requests"
+        echo "Note: At least 3 seconds between requests, one at a time"
         scrapy runspider 223crawl.py \
             -s ROBOTSTXT_OBEY=False \
             -s LOG_LEVEL=INFO \
             -s DOWNLOAD_DELAY=3 \
-            -s CONCURRENT_REQUESTS_PER_DOMAIN=1
+            -s CONCURRENT_REQUESTS_PER_DOMAIN=1 \
+            -s ADAPTIVE_THROTTLE_MIN_DELAY=3 \
+            -s ADAPTIVE_THROTTLE_MAX_CONCURRENCY=1
         ;;
     help|--help|-h)
         show_help
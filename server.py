@@ -2,34 +2,165 @@
 """
 Lightweight web server for 223 Forum Archives
 Serves archive metadata and files via JSON API
+
+Archive files never change once written (their names carry the crawl time),
+so they're sent with strong ETags, Range support and a long-lived
+Cache-Control. Responses of the per-archive query endpoints get ETags too.
+/archives/latest redirects to the newest archive's own URL. Each process keeps
+archive metadata in an LRU bounded by memory (ARCHIVE_CACHE_MB).
+
+Usage:
+    python3 server.py [--port 5000]        # development server (debug, auto-reload)
+    ./start_server.sh prod -w 4            # production: gunicorn worker processes
 """
 
-from flask import Flask, jsonify, send_file
+from flask import Flask, Response, jsonify, redirect, request, send_file, url_for
 from flask_cors import CORS
 import json
-import glob
 import os
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+from archive_analytics import ArchiveAnalytics
+from archive_diff import cached_diff_path
+from archive_io import compression_of, iter_decompressed, iter_gzipped, list_archives as find_archives
+from archive_index import ArchiveCatalog, ArchiveIndex, thread_key
+from archive_store import STORE_DIRNAME, ArchiveStore, snapshot_copy
+from crawl_metrics import deep_sizeof
+from thread_history import ThreadHistory
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend access
 
 ARCHIVES_DIR = 'archives'
 
+# Pagination defaults for the board/thread/comment query endpoints
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Comment fields returned when the client doesn't ask for specific ones
+DEFAULT_COMMENT_FIELDS = ('post_index', 'post_id', 'author', 'content', 'post_date')
+
+# Stored (deduplicated) snapshots are rebuilt here when an endpoint needs a plain file
+CACHE_DIR = os.path.join(ARCHIVES_DIR, '.cache')
+
+# Where crawls write their live metrics (CRAWL_STATE_DIR in settings.py)
+CRAWL_STATE_DIR = 'crawlstate'
+
+# HTTP caching (seconds): archive files for good, query results of a named
+# archive for INDEX_MAX_AGE, and anything about 'latest' only briefly
+ARCHIVE_MAX_AGE = int(os.environ.get('ARCHIVE_MAX_AGE', 365 * 86400))
+INDEX_MAX_AGE = int(os.environ.get('INDEX_MAX_AGE', 3600))
+LATEST_MAX_AGE = int(os.environ.get('LATEST_MAX_AGE', 60))
+
+# Memory budget of each server process's cache of archive metadata
+ARCHIVE_CACHE_MB = float(os.environ.get('ARCHIVE_CACHE_MB', 64))
+
+_catalog = None
+_store = None
+_analytics = None
+_history = None
+
+class MemoryLRU:
+    """Thread-safe LRU cache that evicts the least recently used entries once the
+    values it holds take more than max_bytes
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        """Cached value for key, computing and caching it with compute() on a miss"""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+        value = compute()
+        size = deep_sizeof(value)
+        with self.lock:
+            if key not in self.entries and size <= self.max_bytes:
+                self.entries[key] = (value, size)
+                self.size += size
+                while self.size > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.size -= evicted_size
+        return value
+
+_metadata_cache = MemoryLRU(int(ARCHIVE_CACHE_MB * 1024 * 1024))
+
+def file_version(path):
+    """(size, mtime) of a file, or None if it doesn't exist; part of cache keys,
+    so entries for a file that changed are never used again
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def store_version():
+    return file_version(os.path.join(ARCHIVES_DIR, STORE_DIRNAME, 'store.sqlite3'))
+
+def get_catalog():
+    """Archive metadata index, created on first use"""
+    global _catalog
+    if _catalog is None:
+        _catalog = ArchiveCatalog(ARCHIVES_DIR)
+    return _catalog
+
+def get_store():
+    """Deduplicated snapshot store, created on first use"""
+    global _store
+    if _store is None:
+        _store = ArchiveStore(ARCHIVES_DIR)
+    return _store
+
+def get_analytics():
+    """Activity rollups of all archives, created on first use"""
+    global _analytics
+    if _analytics is None:
+        _analytics = ArchiveAnalytics(ARCHIVES_DIR)
+    return _analytics
+
+def get_history():
+    """Global thread/post history index. Only read here: archives are added when
+    they're crawled, or by `python3 thread_history.py update`
+    """
+    global _history
+    if _history is None:
+        _history = ThreadHistory(ARCHIVES_DIR)
+    return _history
+
+def list_archive_files():
+    """Archive files on disk (plain or compressed), oldest first"""
+    return find_archives(ARCHIVES_DIR)
+
+def list_snapshots():
+    """Metadata of every stored snapshot (cached until the store changes)"""
+    return _metadata_cache.get(('snapshots', store_version()), lambda: get_store().snapshots())
+
+def list_archive_names():
+    """Every archive filename, from files and the snapshot store, oldest first"""
+    names = {os.path.basename(filepath) for filepath in list_archive_files()}
+    names.update(snapshot['filename'] for snapshot in list_snapshots())
+    return sorted(names)
+
+def latest_archive_name():
+    """Filename of the newest archive, or None. Only looked up again once a file
+    is added to or removed from the archives directory, or the store changes.
+    """
+    key = ('latest', file_version(ARCHIVES_DIR), store_version())
+    return _metadata_cache.get(key, lambda: (list_archive_names() or [None])[-1])
+
 def get_archive_metadata(filepath):
-    """Extract metadata from an archive file"""
+    """Extract metadata from an archive file (served from the metadata index)"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            return {
-                'filename': os.path.basename(filepath),
-                'filepath': filepath,
-                'size_bytes': os.path.getsize(filepath),
-                'size_mb': round(os.path.getsize(filepath) / 1024 / 1024, 2),
-                'crawled_at': data.get('crawled_at', 'unknown'),
-                'stats': data.get('stats', {}),
-                'modified_at': datetime.fromtimestamp(os.path.getmtime(filepath)).isoformat()
-            }
+        return _metadata_cache.get(('metadata', filepath, file_version(filepath)),
+                                   lambda: get_catalog().get(filepath))
     except Exception as e:
         return {
             'filename': os.path.basename(filepath),
@@ -37,6 +168,133 @@ def get_archive_metadata(filepath):
             'error': str(e)
         }
 
+def resolve_archive(filename):
+    """Map an archive filename (or 'latest') to a readable file, or None if it doesn't exist
+    Stored snapshots are rebuilt into CACHE_DIR the first time they're needed.
+    """
+    if filename == 'latest':
+        filename = latest_archive_name()
+        if filename is None:
+            return None
+    filename = os.path.basename(filename)
+    filepath = os.path.join(ARCHIVES_DIR, filename)
+    if os.path.isfile(filepath):
+        return filepath
+    
+    return snapshot_copy(filename, ARCHIVES_DIR)
+
+def cache_for_good(response):
+    """Let browsers and proxies keep an archive file response: the file never changes"""
+    response.cache_control.public = True
+    response.cache_control.max_age = ARCHIVE_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+def send_archive_file(filepath, etag=True):
+    """Send a file with a strong ETag, answering If-None-Match with 304 and Range with 206"""
+    response = send_file(os.path.abspath(filepath), mimetype='application/json', etag=etag, conditional=True,
+                         max_age=ARCHIVE_MAX_AGE)
+    return cache_for_good(response)
+
+def send_archive_stream(chunks, etag):
+    """Send a generated archive body with a strong ETag; a matching If-None-Match
+    gets a 304 without generating anything
+    """
+    response = Response(chunks, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Accept-Ranges'] = 'none'
+    return cache_for_good(response.make_conditional(request))
+
+def send_compressed_archive(filepath):
+    """Send a .json.gz/.json.zst archive as JSON, negotiating Content-Encoding.
+    Clients that accept the file's encoding get the stored bytes as is (with
+    Range support); others get it transcoded to gzip, or decompressed, on the fly.
+    """
+    encoding = compression_of(filepath)
+    accepted = request.accept_encodings
+    size, mtime_ns = file_version(filepath)
+    if accepted[encoding]:
+        response = send_archive_file(filepath, etag=f'{mtime_ns}-{size}-{encoding}')
+        response.headers['Content-Encoding'] = encoding
+    elif accepted['gzip']:
+        response = send_archive_stream(iter_gzipped(filepath), f'{mtime_ns}-{size}-gzip')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_archive_stream(iter_decompressed(filepath), f'{mtime_ns}-{size}-identity')
+    response.vary.add('Accept-Encoding')
+    return response
+
+def send_archive(filename):
+    """Send an archive file, or a stored snapshot: from its rebuilt copy if there
+    is one (or a Range asks for one), otherwise streamed as it's rebuilt. A
+    snapshot's ETag is the SHA-256 of its bytes.
+    """
+    filename = os.path.basename(filename)
+    filepath = os.path.join(ARCHIVES_DIR, filename)
+    if os.path.isfile(filepath):
+        if compression_of(filepath):
+            return send_compressed_archive(filepath)
+        return send_archive_file(filepath)
+    sha256 = _metadata_cache.get(('sha256', filename, store_version()), lambda: get_store().snapshot_sha256(filename))
+    if sha256 is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    cached = os.path.join(CACHE_DIR, filename)
+    if os.path.isfile(cached) or request.range:
+        return send_archive_file(resolve_archive(filename), etag=sha256)
+    return send_archive_stream(get_store().iter_chunks(filename), sha256)
+
+def get_archive_index(filename):
+    """Per-archive query index, built on first use"""
+    filepath = resolve_archive(filename)
+    if filepath is None:
+        return None
+    return _metadata_cache.get(('index', filepath, file_version(filepath)),
+                               lambda: ArchiveIndex(filepath, ARCHIVES_DIR))
+
+def rolled_up_archive(filename):
+    """Name of an archive (or 'latest') with its activity rollups in place, or None
+    if it doesn't exist. Archives are rolled up on first use; stored snapshots
+    never change, so theirs are used without rebuilding the snapshot.
+    """
+    if filename == 'latest':
+        filename = latest_archive_name()
+        if filename is None:
+            return None
+    filename = os.path.basename(filename)
+    if not os.path.isfile(os.path.join(ARCHIVES_DIR, filename)) and get_analytics().has(filename):
+        return filename
+    filepath = resolve_archive(filename)
+    return get_analytics().ensure(filepath) if filepath else None
+
+def analytics_filters():
+    """Read the board/author/since/until query parameters of the analytics endpoints"""
+    return {
+        'board_id': request.args.get('board', type=int),
+        'author': request.args.get('author') or None,
+        'since': request.args.get('since') or None,
+        'until': request.args.get('until') or None,
+    }
+
+def page_args():
+    """Read offset/limit query parameters, clamped to sane bounds"""
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    return offset, limit
+
+@app.after_request
+def cache_query_results(response):
+    """ETag and Cache-Control for the JSON of the per-archive endpoints: results
+    for a named archive never change; those for 'latest' change with each crawl
+    """
+    filename = (request.view_args or {}).get('filename')
+    if request.method not in ('GET', 'HEAD') or response.status_code != 200 or filename is None or \
+            'Cache-Control' in response.headers or response.is_streamed or response.direct_passthrough:
+        return response
+    response.cache_control.public = True
+    response.cache_control.max_age = LATEST_MAX_AGE if filename == 'latest' else INDEX_MAX_AGE
+    response.add_etag()
+    return response.make_conditional(request)
+
 @app.route('/')
 def index():
     """Root endpoint - API documentation"""
@@ -47,20 +305,37 @@ def index():
             '/': 'This help message',
             '/archives': 'List all archives with metadata',
             '/archives/<filename>': 'Get specific archive file',
-            '/archives/latest': 'Get the most recent archive',
-            '/stats': 'Aggregate statistics across all archives'
+            '/archives/latest': 'Redirect to the most recent archive',
+            '/archives/<filename>/boards': 'List boards with thread and comment counts',
+            '/archives/<filename>/boards/<board_id>/threads': 'Page through a board\'s threads (?offset=&limit=)',
+            '/archives/<filename>/threads/<thread_id>/comments': 'Page through a thread\'s comments (?offset=&limit=&fields=)',
+            '/archives/<a>/diff/<b>': 'What changed between two archives (boards, threads, comments)',
+            '/archives/<filename>/analytics': 'Activity summary: totals, date span, most active authors and boards',
+            '/archives/<filename>/analytics/boards': 'Threads, posts and authors per board',
+            '/archives/<filename>/analytics/authors': 'Most active authors (?board=&since=&until=&offset=&limit=)',
+            '/archives/<filename>/analytics/days': 'Posts, new threads and active authors per day (?period=month|year&board=&author=&since=&until=)',
+            '/analytics/timeseries': 'Threads, posts and authors in each archive, oldest first (?board=&author=)',
+            '/threads/<thread_id>/history': "A thread's title and comment count in every archive",
+            '/posts/<post_id>/history': 'Every recorded version of a post and the archives it appears in',
+            '/search': 'Full-text search over comments (?q=&author=&board=&since=&offset=&limit=&archive=)',
+            '/stats': 'Aggregate statistics across all archives',
+            '/crawl/status': 'Live metrics of the running (or last) crawl'
         }
     })
 
 @app.route('/archives')
 def list_archives():
     """List all available archives with metadata"""
-    archive_files = sorted(glob.glob(f'{ARCHIVES_DIR}/223-archive-*.json'))
+    archive_files = list_archive_files()
     
     archives = []
     for filepath in archive_files:
         archives.append(get_archive_metadata(filepath))
     
+    # Deduplicated snapshots that no longer exist as plain files
+    on_disk = {os.path.basename(filepath) for filepath in archive_files}
+    archives.extend(snapshot for snapshot in list_snapshots() if snapshot['filename'] not in on_disk)
+    
     # Sort by crawled_at descending (newest first)
     archives.sort(key=lambda x: x.get('crawled_at', ''), reverse=True)
     
@@ -72,54 +347,291 @@ def list_archives():
 @app.route('/archives/<filename>')
 def get_archive(filename):
     """Get a specific archive file"""
-    filepath = os.path.join(ARCHIVES_DIR, filename)
+    return send_archive(filename)
+
+@app.route('/archives/latest')
+def get_latest_archive():
+    """Redirect to the most recent archive, whose own URL can be cached for good"""
+    latest = latest_archive_name()
     
-    if not os.path.exists(filepath):
+    if latest is None:
+        return jsonify({'error': 'No archives found'}), 404
+    
+    response = redirect(url_for('get_archive', filename=latest))
+    response.cache_control.public = True
+    response.cache_control.max_age = LATEST_MAX_AGE
+    return response
+
+@app.route('/archives/<filename>/boards')
+def list_boards(filename):
+    """List the boards of an archive without loading the archive"""
+    archive_index = get_archive_index(filename)
+    if archive_index is None:
         return jsonify({'error': 'Archive not found'}), 404
     
-    return send_file(filepath, mimetype='application/json')
+    boards = archive_index.boards()
+    return jsonify({
+        'count': len(boards),
+        'boards': boards
+    })
 
-@app.route('/archives/latest')
-def get_latest_archive():
-    """Get the most recent archive"""
-    archive_files = sorted(glob.glob(f'{ARCHIVES_DIR}/223-archive-*.json'))
+@app.route('/archives/<filename>/boards/<int:board_id>/threads')
+def list_threads(filename, board_id):
+    """Page through the threads of one board"""
+    archive_index = get_archive_index(filename)
+    if archive_index is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    board = archive_index.board(board_id)
+    if board is None:
+        return jsonify({'error': 'Board not found'}), 404
+    
+    offset, limit = page_args()
+    return jsonify({
+        'board': board,
+        'total': board['thread_count'],
+        'offset': offset,
+        'limit': limit,
+        'threads': archive_index.threads(board_id, offset, limit)
+    })
+
+@app.route('/archives/<filename>/threads/<int:thread_id>/comments')
+def list_comments(filename, thread_id):
+    """Page through the comments of one thread, optionally projecting fields"""
+    archive_index = get_archive_index(filename)
+    if archive_index is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    thread = archive_index.thread(thread_id)
+    if thread is None:
+        return jsonify({'error': 'Thread not found'}), 404
+    
+    offset, limit = page_args()
+    fields = request.args.get('fields')
+    fields = set(fields.split(',')) if fields else set(DEFAULT_COMMENT_FIELDS)
+    return jsonify({
+        'thread': thread,
+        'total': thread['comment_count'],
+        'offset': offset,
+        'limit': limit,
+        'comments': archive_index.comments(thread_id, offset, limit, fields)
+    })
+
+@app.route('/archives/<filename>/diff/<other>')
+def diff_archives(filename, other):
+    """Change set from one archive to another (new/removed threads, new/removed/edited comments)"""
+    path_a = resolve_archive(filename)
+    path_b = resolve_archive(other)
+    if path_a is None or path_b is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    return send_file(os.path.abspath(cached_diff_path(path_a, path_b, ARCHIVES_DIR)), mimetype='application/json')
+
+@app.route('/archives/<filename>/analytics')
+def archive_analytics(filename):
+    """Activity summary of an archive, answered from its rollups"""
+    filename = rolled_up_archive(filename)
+    if filename is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    return jsonify(get_analytics().summary(filename))
+
+@app.route('/archives/<filename>/analytics/boards')
+def board_analytics(filename):
+    """Threads, posts, authors and post date span per board"""
+    filename = rolled_up_archive(filename)
+    if filename is None:
+        return jsonify({'error': 'Archive not found'}), 404
     
-    if not archive_files:
+    boards = get_analytics().boards(filename)
+    return jsonify({
+        'archive': filename,
+        'count': len(boards),
+        'boards': boards
+    })
+
+@app.route('/archives/<filename>/analytics/authors')
+def author_analytics(filename):
+    """Authors by number of posts, optionally within one board and/or date range"""
+    filename = rolled_up_archive(filename)
+    if filename is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    filters = analytics_filters()
+    filters.pop('author')
+    offset, limit = page_args()
+    return jsonify({
+        'archive': filename,
+        'offset': offset,
+        'limit': limit,
+        'authors': get_analytics().authors(filename, offset=offset, limit=limit, **filters)
+    })
+
+@app.route('/archives/<filename>/analytics/days')
+def day_analytics(filename):
+    """Posts, threads started and active authors per day, month or year"""
+    filename = rolled_up_archive(filename)
+    if filename is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    period = request.args.get('period', 'day')
+    if period not in ('day', 'month', 'year'):
+        return jsonify({'error': 'period must be day, month or year'}), 400
+    return jsonify({
+        'archive': filename,
+        'period': period,
+        'series': get_analytics().days(filename, period=period, **analytics_filters())
+    })
+
+@app.route('/analytics/timeseries')
+def analytics_timeseries():
+    """Threads, posts and authors in every archive, oldest first, to follow the forum across crawls"""
+    archive_names = [name for name in map(rolled_up_archive, list_archive_names()) if name]
+    if not archive_names:
         return jsonify({'error': 'No archives found'}), 404
     
-    latest = archive_files[-1]
-    return send_file(latest, mimetype='application/json')
+    filters = analytics_filters()
+    points = get_analytics().timeseries(archive_names, board_id=filters['board_id'], author=filters['author'])
+    return jsonify({
+        'count': len(points),
+        'points': points
+    })
+
+@app.route('/threads/<int:thread_id>/history')
+def thread_history(thread_id):
+    """A thread's title and comment count in every archive, from the history index"""
+    history = get_history().thread(thread_key(thread_id, None))
+    if history is None:
+        return jsonify({'error': 'Thread not found'}), 404
+    return jsonify(history)
+
+@app.route('/posts/<post_id>/history')
+def post_history(post_id):
+    """Every recorded version of a post, each read from one archive by offset"""
+    history = get_history().post(post_id)
+    if history is None:
+        return jsonify({'error': 'Post not found'}), 404
+    return jsonify(history)
+
+@app.route('/search')
+def search_comments():
+    """Ranked full-text search over the comments of one archive (latest by default)"""
+    query = request.args.get('q', '').strip()
+    author = request.args.get('author', '').strip()
+    if not query and not author:
+        return jsonify({'error': 'Provide a search query (q) or an author'}), 400
+    
+    filename = request.args.get('archive', 'latest')
+    archive_index = get_archive_index(filename)
+    if archive_index is None:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    offset, limit = page_args()
+    results = archive_index.search(
+        query=query,
+        author=author or None,
+        board_id=request.args.get('board', type=int),
+        since=request.args.get('since') or None,
+        offset=offset,
+        limit=limit + 1
+    )
+    return jsonify({
+        'archive': os.path.basename(archive_index.archive_path),
+        'offset': offset,
+        'limit': limit,
+        'has_more': len(results) > limit,
+        'results': results[:limit]
+    })
 
 @app.route('/stats')
 def aggregate_stats():
     """Get aggregate statistics across all archives"""
-    archive_files = sorted(glob.glob(f'{ARCHIVES_DIR}/223-archive-*.json'))
+    archive_files = list_archive_files()
+    archive_names = list_archive_names()
     
-    if not archive_files:
+    if not archive_names:
         return jsonify({'error': 'No archives found'}), 404
     
-    total_archives = len(archive_files)
+    total_archives = len(archive_names)
     total_size_mb = 0
-    latest_stats = None
     
     for filepath in archive_files:
         total_size_mb += os.path.getsize(filepath) / 1024 / 1024
-        
-        # Get stats from latest archive
-        if filepath == archive_files[-1]:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                latest_stats = data.get('stats', {})
+    
+    # Snapshots in the deduplicated store share one database; count what it
+    # actually occupies on disk, and separately what they'd take as plain files
+    on_disk = {os.path.basename(filepath) for filepath in archive_files}
+    stored = [snapshot for snapshot in list_snapshots() if snapshot['filename'] not in on_disk]
+    logical_size_mb = total_size_mb + sum(snapshot['size_bytes'] for snapshot in stored) / 1024 / 1024
+    total_size_mb += get_store().size_bytes() / 1024 / 1024
+    
+    # Get stats from latest archive
+    latest = archive_names[-1]
+    if latest in on_disk:
+        latest_stats = get_archive_metadata(os.path.join(ARCHIVES_DIR, latest)).get('stats', {})
+    else:
+        latest_stats = next(snapshot['stats'] for snapshot in stored if snapshot['filename'] == latest)
     
     return jsonify({
         'total_archives': total_archives,
         'total_size_mb': round(total_size_mb, 2),
-        'oldest_archive': os.path.basename(archive_files[0]) if archive_files else None,
-        'latest_archive': os.path.basename(archive_files[-1]) if archive_files else None,
+        'logical_size_mb': round(logical_size_mb, 2),
+        'oldest_archive': archive_names[0],
+        'latest_archive': latest,
         'latest_stats': latest_stats
     })
 
+def read_crawl_metrics(path):
+    """A metrics.json snapshot with a 'running' flag, or None if there isn't one"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A crawl that was killed never writes its closing snapshot; treat it as
+    # stopped once it has missed a few updates
+    age = (datetime.now() - datetime.fromisoformat(metrics['updated_at'])).total_seconds()
+    metrics['running'] = metrics['closed'] is None and age < 3 * metrics['interval_seconds']
+    return metrics
+
+@app.route('/crawl/status')
+def crawl_status():
+    """Live metrics of the running (or last) crawl, per shard for sharded crawls"""
+    shards_dir = os.path.join(CRAWL_STATE_DIR, 'shards')
+    shard_dirs = sorted((name for name in os.listdir(shards_dir) if name.isdigit()), key=int) \
+        if os.path.isdir(shards_dir) else []
+    shards = [metrics for metrics in (read_crawl_metrics(os.path.join(shards_dir, name, 'metrics.json'))
+                                      for name in shard_dirs) if metrics]
+    if shards:
+        progress = {}
+        for metrics in shards:
+            for name, value in metrics['progress'].items():
+                if name != 'eta_seconds' and isinstance(value, (int, float)):
+                    progress[name] = round(progress.get(name, 0) + value, 1)
+        etas = [metrics['progress']['eta_seconds'] for metrics in shards if metrics['running']]
+        # Shards run in parallel, so the crawl is done when the slowest one is
+        progress['eta_seconds'] = max(etas) if etas and None not in etas else None
+        return jsonify({
+            'running': any(metrics['running'] for metrics in shards),
+            'progress': progress,
+            'shards': shards
+        })
+    
+    metrics = read_crawl_metrics(os.path.join(CRAWL_STATE_DIR, 'metrics.json'))
+    if metrics is None:
+        return jsonify({'error': 'No crawl metrics found'}), 404
+    return jsonify(metrics)
+
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='223 Forum Archive development server '
+                                                 '(use ./start_server.sh prod for production)')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--no-debug', action='store_true', help='Turn off debug mode and auto-reload')
+    args = parser.parse_args()
+    
     # Ensure archives directory exists
     os.makedirs(ARCHIVES_DIR, exist_ok=True)
     
@@ -127,17 +639,27 @@ if __name__ == '__main__':
     print("🚀 223 Forum Archive Server")
     print("=" * 60)
     print(f"📁 Archives directory: {os.path.abspath(ARCHIVES_DIR)}")
-    print(f"🌐 Server running at: http://localhost:5000")
+    print(f"🌐 Server running at: http://localhost:{args.port}")
     print()
     print("Available endpoints:")
-    print("  • http://localhost:5000/")
-    print("  • http://localhost:5000/archives")
-    print("  • http://localhost:5000/archives/latest")
-    print("  • http://localhost:5000/archives/<filename>")
-    print("  • http://localhost:5000/stats")
+    print(f"  • http://localhost:{args.port}/")
+    print(f"  • http://localhost:{args.port}/archives")
+    print(f"  • http://localhost:{args.port}/archives/latest")
+    print(f"  • http://localhost:{args.port}/archives/<filename>")
+    print(f"  • http://localhost:{args.port}/archives/<filename>/boards")
+    print(f"  • http://localhost:{args.port}/archives/<filename>/boards/<board_id>/threads")
+    print(f"  • http://localhost:{args.port}/archives/<filename>/threads/<thread_id>/comments")
+    print(f"  • http://localhost:{args.port}/archives/<a>/diff/<b>")
+    print(f"  • http://localhost:{args.port}/archives/<filename>/analytics")
+    print(f"  • http://localhost:{args.port}/analytics/timeseries")
+    print(f"  • http://localhost:{args.port}/threads/<thread_id>/history")
+    print(f"  • http://localhost:{args.port}/posts/<post_id>/history")
+    print(f"  • http://localhost:{args.port}/search?q=<text>")
+    print(f"  • http://localhost:{args.port}/stats")
+    print(f"  • http://localhost:{args.port}/crawl/status")
     print()
     print("Press Ctrl+C to stop")
     print("=" * 60)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app.run(debug=not args.no_debug, host=args.host, port=args.port)
 
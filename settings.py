@@ -15,7 +15,9 @@ ROBOTSTXT_OBEY = True
 # Configure maximum concurrent requests
 CONCURRENT_REQUESTS = 16
 CONCURRENT_REQUESTS_PER_DOMAIN = 2
-CONCURRENT_REQUESTS_PER_IP = 2
+# One download slot per domain, which the adaptive throttle tunes (per-IP slots
+# aren't supported by the default scheduler queue of recent Scrapy versions)
+CONCURRENT_REQUESTS_PER_IP = 0
 
 # Configure a delay for requests for the same website (default: 0)
 DOWNLOAD_DELAY = 1
@@ -38,23 +40,122 @@ DEFAULT_REQUEST_HEADERS = {
 # Note: This spider uses a custom data structure (self.forum_data) instead of
 # yielding items, so item pipelines are not used.
 
-# Enable and configure the AutoThrottle extension (disabled by default)
-AUTOTHROTTLE_ENABLED = True
+# Stream each completed thread to a JSONL log in CRAWL_STATE_DIR instead of
+# holding the whole forum in memory; the archive is built from the log at close.
+# Set KEEP_THREAD_LOG = True to keep the log after the archive is written.
+STREAM_THREADS = True
+CRAWL_STATE_DIR = 'crawlstate'
+KEEP_THREAD_LOG = False
+
+# Checkpoints (with STREAM_THREADS): progress counters and partially fetched
+# multi-page threads are saved to CRAWL_STATE_DIR/checkpoint.json every
+# CHECKPOINT_INTERVAL seconds and whenever a crawl stops before finishing, so
+# ./run_crawler.sh resume (RESUME_CRAWL = True) can carry on where it stopped
+# without refetching completed threads. 0 only saves when the crawl stops.
+CHECKPOINT_INTERVAL = 60
+RESUME_CRAWL = False
+
+# Live crawl metrics: request rate, latency histogram, queue depth, time per
+# spider callback, memory and ETA, written to CRAWL_STATE_DIR/metrics.json every
+# CRAWL_METRICS_INTERVAL seconds and served by server.py at /crawl/status
+EXTENSIONS = {
+    'crawl_metrics.CrawlMetrics': 500,
+    'politeness.AdaptiveThrottle': 500,  # see ADAPTIVE_THROTTLE_* below
+}
+CRAWL_METRICS_ENABLED = True
+CRAWL_METRICS_INTERVAL = 5
+
+# Sharded crawls (./run_crawler.sh sharded -j N, see shard.py) run N spider
+# processes; each gets CRAWL_SHARDS = N and its own CRAWL_SHARD (0..N-1) and
+# only crawls the boards whose board id % N equals it. Set by shard.py, not here.
+CRAWL_SHARDS = 1
+CRAWL_SHARD = 0
+
+# Incremental crawls (./run_crawler.sh incremental) compare board listings with
+# the newest archive in archives/ and only fetch threads that are new or have
+# new replies; unchanged threads are copied over from that archive.
+INCREMENTAL_CRAWL = False
+
+# How finished archives are kept: 'files' writes a full 223-archive-<timestamp>.json
+# per crawl; 'dedup' stores each crawl as a snapshot in the content-addressed
+# store (archives/.store/), keeping unchanged threads and comments only once.
+ARCHIVE_STORAGE = 'files'
+
+# Archive file format (for ARCHIVE_STORAGE = 'files'). ARCHIVE_COMPRESSION is
+# None for plain .json, 'gzip' for .json.gz or 'zstd' for .json.zst (needs
+# `pip install zstandard`). ARCHIVE_COMPACT drops the indentation, and
+# ARCHIVE_CONTENT_HTML = False leaves out each comment's content_html (the
+# plain-text content is always kept). The server reads all of these formats.
+ARCHIVE_COMPRESSION = None
+ARCHIVE_COMPACT = False
+ARCHIVE_CONTENT_HTML = True
+
+# Roll each finished archive up into per-board, per-author and per-day activity
+# counts (archive_analytics.py) for the server's analytics endpoints. When off,
+# the server rolls an archive up the first time its analytics are asked for.
+ARCHIVE_ANALYTICS = True
+
+# Add each finished archive to the global thread history index
+# (thread_history.py), which the server's /threads/<id>/history and
+# /posts/<id>/history endpoints read. The server never writes to the index:
+# archives crawled with this off, or copied in or deleted by hand, are picked
+# up by the next crawl or by `python3 thread_history.py update`.
+THREAD_HISTORY_INDEX = True
+
+# Adaptive politeness (politeness.py): starting from DOWNLOAD_DELAY and the
+# concurrency limits above, every ADAPTIVE_THROTTLE_INTERVAL seconds the forum's
+# download slot is slowed down on 429/503 (honouring Retry-After), server
+# errors or rising latency, and sped up while responses stay healthy and
+# requests are waiting, always within these floors and ceilings. Every change
+# is logged. It replaces AutoThrottle, which is turned off below.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_INTERVAL = 10
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2.0  # p90 seconds
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 8
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.25
+ADAPTIVE_THROTTLE_MAX_DELAY = 30
+
+# Scrapy's AutoThrottle extension (superseded by the adaptive throttle above)
+AUTOTHROTTLE_ENABLED = False
 AUTOTHROTTLE_START_DELAY = 1
 AUTOTHROTTLE_MAX_DELAY = 10
 AUTOTHROTTLE_TARGET_CONCURRENCY = 2.0
 AUTOTHROTTLE_DEBUG = False
 
-# HTTP caching is ENABLED during crawls for efficiency
-# Cache is cleared BEFORE each run by run_crawler.sh to ensure fresh data
+# HTTP caching is ENABLED and kept between crawls (see http_cache.py). Cached
+# pages are served for HTTPCACHE_FRESHNESS seconds depending on their kind, then
+# revalidated with If-None-Match / If-Modified-Since where the forum sends an
+# ETag or Last-Modified (a 304 reuses the cached page). Board listings must stay
+# short for incremental crawls to notice new replies. HTTPCACHE_FRESH = True
+# (./run_crawler.sh fresh) refetches every page and rewrites the cache.
+# Entries not refreshed within HTTPCACHE_EXPIRATION_SECS are dropped (0 = never).
 HTTPCACHE_ENABLED = True
-HTTPCACHE_EXPIRATION_SECS = 86400  # 24 hours
+HTTPCACHE_EXPIRATION_SECS = 90 * 86400  # 90 days
 HTTPCACHE_DIR = 'httpcache'
 HTTPCACHE_IGNORE_HTTP_CODES = []
-HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_STORAGE = 'http_cache.SqliteCacheStorage'
+HTTPCACHE_POLICY = 'http_cache.ForumCachePolicy'
+HTTPCACHE_FRESHNESS = {
+    'index': 3600,                # forum index
+    'board': 3600,                # board listings
+    'last_thread_page': 3600,     # where new replies appear
+    'thread_page': 30 * 86400,    # thread pages with further pages after them
+}
+HTTPCACHE_FRESH = False
+DOWNLOADER_MIDDLEWARES = {
+    # Same middleware, plus a hit/revalidation/miss report when the crawl closes
+    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+    'http_cache.ForumHttpCacheMiddleware': 900,
+}
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = '2.7'
+
+# Fingerprint requests by their canonical page URL (forum_urls.py), so www/non-www,
+# http/https, session-id and other query-string variants of a page count as one
+# request for the duplicate filter and the HTTP cache
+REQUEST_FINGERPRINTER_CLASS = 'forum_urls.CanonicalRequestFingerprinter'
 TWISTED_REACTOR = 'twisted.internet.asyncioreactor.AsyncioSelectorReactor'
 FEED_EXPORT_ENCODING = 'utf-8'
 
@@ -0,0 +1,288 @@
+"""
+Board-sharded crawling: run the spider as several processes and merge their output.
+
+A single crawl parses every page on one core. `python shard.py crawl -j 8`
+starts 8 spider processes instead. Each one reads the forum index and keeps
+only the boards of its own shard: boards are dealt out by board id, see
+forum_urls.board_shard(). A shard crawls its boards' listings and threads
+into its own thread log under crawlstate/shards/<n>/, writes its log output
+to crawl.log there and reports progress in shard.json, which the launcher
+prints every few seconds.
+
+Once all shards have stopped, their thread logs are merged into one standard
+archive. The archive is written, stored and catalogued exactly like a single
+crawl's. A thread stored by more than one shard is kept once, and the stats
+are recomputed over the merged result. If a shard stopped early, its
+checkpoint is kept, the merged archive stays in crawlstate/shards/ rather than
+being published, and `python shard.py crawl --resume` continues every shard
+where it left off.
+
+Each shard gets its share of the politeness settings: the per-domain/IP
+concurrency limits (ADAPTIVE_THROTTLE_MAX_CONCURRENCY included) are divided
+by the number of shards, down to 1, and the delays multiplied by it, so the
+shards together stay within the request rate a single crawl would use.
+
+Usage:
+    python shard.py crawl [-j 8] [--resume] [-s NAME=VALUE ...]
+    python shard.py merge [-s NAME=VALUE ...]
+"""
+
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from archive_io import finalize_thread_logs
+
+SPIDER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '223crawl.py')
+SHARDS_DIRNAME = 'shards'
+
+# Counters summed over the shards into the archive's stats block
+STATS_COUNTERS = ('boards_discovered', 'threads_discovered', 'threads_completed', 'comments_extracted')
+
+logger = logging.getLogger('shard')
+
+
+def load_crawl_module(path=SPIDER_PATH):
+    """Import 223crawl.py (not importable by name) for its archive helpers"""
+    spec = importlib.util.spec_from_file_location('spider_223crawl', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_settings(overrides=None):
+    """Project settings (settings.py) with command line NAME=VALUE overrides applied"""
+    from scrapy.utils.project import get_project_settings
+    settings = get_project_settings()
+    settings.setdict(overrides or {}, priority='cmdline')
+    return settings
+
+
+def shards_dir(settings):
+    return os.path.join(settings.get('CRAWL_STATE_DIR', 'crawlstate'), SHARDS_DIRNAME)
+
+
+def shard_dir(settings, shard):
+    return os.path.join(shards_dir(settings), str(shard))
+
+
+def read_json(path):
+    """Contents of a JSON state file, or None if it doesn't exist (yet)"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def shard_politeness(settings, shards):
+    """One shard's share of the crawl's concurrency limits and delays
+    Each shard throttles its own download slot, so N shards left at the
+    crawl's settings would send N times its requests. Delays are scaled by
+    the shard count (a slot sends at most one request per delay) and the
+    concurrency limits divided by it, but never below one request at a time.
+    """
+    politeness = {
+        'CONCURRENT_REQUESTS_PER_DOMAIN': max(1, settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN') // shards),
+        'DOWNLOAD_DELAY': settings.getfloat('DOWNLOAD_DELAY') * shards,
+        # Defaults as in politeness.AdaptiveThrottle
+        'ADAPTIVE_THROTTLE_MAX_CONCURRENCY': max(1, settings.getint('ADAPTIVE_THROTTLE_MAX_CONCURRENCY', 8) // shards),
+        'ADAPTIVE_THROTTLE_MIN_DELAY': settings.getfloat('ADAPTIVE_THROTTLE_MIN_DELAY', 0.25) * shards,
+        'ADAPTIVE_THROTTLE_MAX_DELAY': settings.getfloat('ADAPTIVE_THROTTLE_MAX_DELAY', 30) * shards,
+        'AUTOTHROTTLE_START_DELAY': settings.getfloat('AUTOTHROTTLE_START_DELAY') * shards,
+        'AUTOTHROTTLE_MAX_DELAY': settings.getfloat('AUTOTHROTTLE_MAX_DELAY') * shards,
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': settings.getfloat('AUTOTHROTTLE_TARGET_CONCURRENCY') / shards,
+    }
+    if settings.getint('CONCURRENT_REQUESTS_PER_IP'):  # 0: limited per domain instead
+        politeness['CONCURRENT_REQUESTS_PER_IP'] = max(1, settings.getint('CONCURRENT_REQUESTS_PER_IP') // shards)
+    return politeness
+
+
+def launch_shard(shard, shards, settings, overrides, resume=False):
+    """Start the spider for one shard, logging to crawl.log in the shard's directory"""
+    state_dir = shard_dir(settings, shard)
+    os.makedirs(state_dir, exist_ok=True)
+    shard_settings = {
+        'CRAWL_SHARD': shard,
+        'CRAWL_SHARDS': shards,
+        'CRAWL_STATE_DIR': state_dir,
+        'STREAM_THREADS': True,
+        'RESUME_CRAWL': resume,
+        **shard_politeness(settings, shards),
+    }
+    if settings.get('HTTPCACHE_STORAGE') != 'http_cache.SqliteCacheStorage':
+        # Shards share the SQLite cache, but not a filesystem cache, whose
+        # entries aren't safe to write from two processes at once
+        shard_settings['HTTPCACHE_DIR'] = os.path.join(settings.get('HTTPCACHE_DIR', 'httpcache'), f'shard-{shard}')
+    command = [sys.executable, '-m', 'scrapy', 'runspider', SPIDER_PATH]
+    for name, value in {**overrides, **shard_settings}.items():
+        command += ['-s', f'{name}={value}']
+    with open(os.path.join(state_dir, 'crawl.log'), 'a', encoding='utf-8') as log_file:
+        # Own session, so Ctrl+C reaches the shards once, via the launcher
+        return subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def print_progress(settings, shards, processes, started):
+    """One line per shard from its shard.json, plus the totals"""
+    elapsed = int(time.monotonic() - started)
+    print(f"⏱️  {elapsed // 3600}:{elapsed // 60 % 60:02d}:{elapsed % 60:02d}")
+    totals = dict.fromkeys(STATS_COUNTERS, 0)
+    for shard in range(shards):
+        status = read_json(os.path.join(shard_dir(settings, shard), 'shard.json')) or {}
+        counters = status.get('counters', {})
+        for name in STATS_COUNTERS:
+            totals[name] += counters.get(name, 0)
+        returncode = processes[shard].poll() if processes else None
+        if status.get('closed'):
+            state = status['closed']
+        elif returncode is not None:
+            state = f'exited ({returncode})'
+        else:
+            state = f"running, {status.get('pending_threads', 0)} threads in flight"
+        print(f"   🧩 {shard + 1}/{shards}: {counters.get('boards_discovered', 0)} boards | "
+              f"{counters.get('threads_completed', 0)}/{counters.get('threads_discovered', 0)} threads | "
+              f"{counters.get('comments_extracted', 0)} comments | {state}")
+    print(f"   Σ  {totals['boards_discovered']} boards | {totals['threads_completed']}/{totals['threads_discovered']} "
+          f"threads | {totals['comments_extracted']} comments")
+
+
+def crawl(shards, settings, overrides, resume=False, interval=10):
+    """Run all shards to completion, reporting progress, then merge them
+    Returns: the merged archive path, or None if no shard logged anything
+    """
+    manifest_path = os.path.join(shards_dir(settings), 'shards.json')
+    manifest = read_json(manifest_path)
+    if resume and manifest is None:
+        print("⚠️  No interrupted sharded crawl to resume, starting a new crawl")
+        resume = False
+    if resume:
+        if manifest['shards'] != shards:
+            print(f"⚠️  Resuming with the {manifest['shards']} shards the crawl was started with")
+        shards = manifest['shards']
+    else:
+        if manifest is not None:
+            print(f"⚠️  Discarding the interrupted sharded crawl in {shards_dir(settings)}")
+        shutil.rmtree(shards_dir(settings), ignore_errors=True)
+        os.makedirs(shards_dir(settings))
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({'shards': shards, 'started_at': datetime.now().isoformat()}, f)
+
+    print(f"🚀 {'Resuming' if resume else 'Starting'} {shards} crawl shards (logs in {shards_dir(settings)}/<n>/crawl.log)")
+    politeness = shard_politeness(settings, shards)
+    print(f"   🚦 Per shard: concurrency {politeness['CONCURRENT_REQUESTS_PER_DOMAIN']} per domain "
+          f"(throttle max {politeness['ADAPTIVE_THROTTLE_MAX_CONCURRENCY']}), "
+          f"delay {politeness['DOWNLOAD_DELAY']:g}s")
+    started = time.monotonic()
+    processes = [launch_shard(shard, shards, settings, overrides, resume) for shard in range(shards)]
+
+    interrupts = 0
+    while any(process.poll() is None for process in processes):
+        try:
+            time.sleep(interval)
+            print_progress(settings, shards, processes, started)
+        except KeyboardInterrupt:
+            # First Ctrl+C: shards stop gracefully and checkpoint; second: they stop at once
+            interrupts += 1
+            print("\n⏸️  Stopping shards..." if interrupts == 1 else "\n⏹️  Forcing shards to stop...")
+            for process in processes:
+                if process.poll() is None:
+                    process.send_signal(signal.SIGINT)
+    print_progress(settings, shards, processes, started)
+
+    failed = [shard + 1 for shard, process in enumerate(processes) if process.returncode != 0]
+    if failed:
+        print(f"❌ Shard(s) {', '.join(map(str, failed))} exited with an error, see their crawl.log")
+    return merge(settings)
+
+
+def merge(settings):
+    """Merge the shards' thread logs into one archive
+    The archive is published (stored in archives/) and the shard state removed
+    once every shard finished; otherwise the partial archive is written next
+    to the shard state, which is kept so the crawl can be resumed.
+    Returns: the merged archive path, or None if no shard logged anything
+    """
+    manifest = read_json(os.path.join(shards_dir(settings), 'shards.json'))
+    if manifest is None:
+        print(f"❌ No sharded crawl found in {shards_dir(settings)}")
+        return None
+
+    log_paths = []
+    crawl_stats = dict.fromkeys(STATS_COUNTERS, 0)
+    finished = True
+    for shard in range(manifest['shards']):
+        status = read_json(os.path.join(shard_dir(settings, shard), 'shard.json'))
+        if status is None or not os.path.exists(status['thread_log']):
+            print(f"⚠️  Shard {shard + 1} has no thread log, its boards are missing from the archive")
+            finished = False
+            continue
+        log_paths.append(status['thread_log'])
+        for name in STATS_COUNTERS:
+            crawl_stats[name] += status['counters'][name]
+        finished = finished and status['closed'] == 'finished'
+    if not log_paths:
+        return None
+
+    crawl_module = load_crawl_module()
+    # Until every shard finished, the merged archive is partial: it's kept with
+    # the shards' state instead of being published in archives/
+    output_dir = 'archives' if finished else shards_dir(settings)
+    crawl_module.remove_partial_archives(shards_dir(settings))
+    output_file, compact, content_html = crawl_module.archive_output(settings, output_dir)
+    crawled_at = datetime.now().isoformat()
+    print(f"🔗 Merging {len(log_paths)} shard thread logs...")
+    stats = finalize_thread_logs(log_paths, output_file, crawl_stats=crawl_stats, crawled_at=crawled_at,
+                                 compact=compact, content_html=content_html)
+    duplicates = crawl_stats['threads_completed'] - stats['threads_completed']
+    print(f"   📦 {stats['boards']} boards, {stats['threads']} threads, {stats['comments']} comments "
+          f"({duplicates} threads stored by more than one shard)")
+    print(f"✅ Hierarchical forum data written to {output_file}")
+
+    if not finished:
+        print("⏸️  Not every shard finished, so the archive isn't published; "
+              "continue with ./run_crawler.sh sharded --resume")
+        return output_file
+    crawl_module.store_archive(settings, output_file, crawled_at, stats, logger)
+    if settings.getbool('KEEP_THREAD_LOG'):
+        print(f"💾 Shard thread logs kept in {shards_dir(settings)}")
+    else:
+        shutil.rmtree(shards_dir(settings))
+    return output_file
+
+
+if __name__ == '__main__':
+    import argparse
+
+    def setting(value):
+        name, _, value = value.partition('=')
+        return name, value
+
+    shared = argparse.ArgumentParser(add_help=False)
+    shared.add_argument('-s', '--set', type=setting, action='append', default=[], metavar='NAME=VALUE',
+                        help='Scrapy setting for every shard (as with scrapy runspider -s)')
+    parser = argparse.ArgumentParser(description='Crawl the 223 forum with several processes, sharded by board')
+    commands = parser.add_subparsers(dest='command', required=True)
+    crawl_cmd = commands.add_parser('crawl', parents=[shared], help='Run a sharded crawl and merge its archive')
+    crawl_cmd.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of shards (processes)')
+    crawl_cmd.add_argument('--resume', action='store_true', help='Continue an interrupted sharded crawl')
+    crawl_cmd.add_argument('--interval', type=float, default=10, help='Seconds between progress reports')
+    commands.add_parser('merge', parents=[shared], help='Merge the shards of an interrupted crawl into an archive now')
+    args = parser.parse_args()
+    if args.command == 'crawl' and args.jobs < 2:
+        parser.error('a sharded crawl needs at least 2 jobs; use ./run_crawler.sh full for one process')
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    overrides = dict(args.set)
+    settings = load_settings(overrides)
+    if args.command == 'crawl':
+        output = crawl(args.jobs, settings, overrides, args.resume, args.interval)
+    else:
+        output = merge(settings)
+    sys.exit(0 if output else 1)
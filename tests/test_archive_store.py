@@ -0,0 +1,50 @@
+import hashlib
+
+from archive_io import new_board, write_archive
+from archive_store import ArchiveStore
+
+THREAD_URL = 'https://www.tapatalk.com/groups/223/some-thread-t42.html'
+
+
+def comment(index, post_id):
+    return {
+        'post_index': index,
+        'post_id': str(post_id),
+        'author': f'member{post_id % 7}',
+        'content': f'Post number {post_id}',
+        'content_html': f'<div>Post number {post_id}</div>',
+        'post_date': '2026-10-01 12:00',
+    }
+
+
+def write_snapshot(path, post_ids):
+    board = new_board('https://www.tapatalk.com/groups/223/general-f5/', 'General')
+    board['threads'] = [{
+        'thread_title': 'Some thread',
+        'thread_url': THREAD_URL,
+        'crawled_at': '2026-10-01T12:00:00',
+        'comments': [comment(index, post_id) for index, post_id in enumerate(post_ids)],
+    }]
+    with open(path, 'w', encoding='utf-8') as f:
+        write_archive(f, {'forum_name': '223', 'crawled_at': '2026-10-01T12:00:00', 'boards': [board]})
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_deleted_post_stores_only_the_thread_again(tmp_path):
+    store = ArchiveStore(str(tmp_path))
+    post_ids = list(range(1000, 1035))
+    first = tmp_path / '223-archive-2026-10-01-12-00-00.json'
+    write_snapshot(first, post_ids)
+    assert store.import_archive(str(first))['new_comments'] == 35
+
+    # Every post after the deleted one moves up a place
+    del post_ids[1]
+    second = tmp_path / '223-archive-2026-10-02-12-00-00.json'
+    sha256 = write_snapshot(second, post_ids)
+    summary = store.import_archive(str(second))
+    assert summary['verified']
+    assert (summary['comments'], summary['new_comments'], summary['new_threads']) == (34, 0, 1)
+
+    rebuilt = hashlib.sha256(b''.join(store.iter_chunks(second.name))).hexdigest()
+    assert rebuilt == sha256 == store.snapshot_sha256(second.name)
@@ -0,0 +1,51 @@
+import time
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+
+from http_cache import ForumHttpCacheMiddleware
+
+THREAD_URL = 'https://www.tapatalk.com/groups/223/some-thread-t42.html'
+
+
+def open_middleware(tmp_path):
+    crawler = get_crawler(Spider, {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_EXPIRATION_SECS': 90 * 86400,
+        'HTTPCACHE_STORAGE': 'http_cache.SqliteCacheStorage',
+        'HTTPCACHE_POLICY': 'http_cache.ForumCachePolicy',
+    })
+    crawler.spider = crawler._create_spider('223')
+    middleware = ForumHttpCacheMiddleware.from_crawler(crawler)
+    middleware.spider_opened(crawler.spider)
+    return middleware
+
+
+def test_304_restarts_freshness(tmp_path):
+    middleware = open_middleware(tmp_path)
+    db = middleware.storage.db
+
+    request = Request(THREAD_URL)
+    assert middleware.process_request(request) is None
+    middleware.process_response(request, HtmlResponse(
+        THREAD_URL, body=b'<html>last page</html>', headers={'ETag': '"v1"'}))
+
+    # Past the one hour a thread's last page stays fresh
+    db.execute('UPDATE responses SET stored_at = ?', (time.time() - 2 * 3600,))
+
+    request = Request(THREAD_URL)
+    assert middleware.process_request(request) is None
+    assert request.headers[b'If-None-Match'] == b'"v1"'
+    result = middleware.process_response(request, Response(THREAD_URL, status=304, headers={'ETag': '"v2"'}))
+    assert result.status == 200 and result.body == b'<html>last page</html>'
+
+    stored_at, = db.execute('SELECT stored_at FROM responses').fetchone()
+    assert time.time() - stored_at < 60
+
+    # Fresh again: served from the cache without asking the forum
+    request = Request(THREAD_URL)
+    cached = middleware.process_request(request)
+    assert cached is not None and 'cached' in cached.flags
+    assert cached.headers[b'ETag'] == b'"v2"'
@@ -0,0 +1,333 @@
+"""
+History of threads and posts across archives, from one global index.
+
+Following one thread across crawls used to mean opening every archive in turn.
+The history index (archives/.index/history.sqlite3) records where every thread
+and every post appears in every archive: threads by thread key (topic id, or
+the canonical thread_url when there is none) with their title, comment count
+and byte offsets, and posts by post_id with their position, a hash of their
+text and byte offsets. It is kept up to date incrementally by update(), which
+indexes archives that are new or changed and forgets those that are gone: the
+spider runs it after writing each archive (THREAD_HISTORY_INDEX in
+settings.py), and so can the command line. The server only reads the index.
+
+A thread's history (comment count and title in each crawl) is answered from
+the index alone. A post's history reads each distinct version of the post
+once, by offset, from an archive that holds it, so it costs one small read
+per edit, however many archives there are. Offsets of compressed archives
+point into their decompressed copy, and those of deduplicated snapshots into
+the rebuilt file; both are byte-identical every time they're recreated.
+
+Usage:
+    python3 thread_history.py update          # index new or changed archives
+    python3 thread_history.py thread <topic id>
+    python3 thread_history.py post <post id>
+"""
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from archive_index import INDEX_DIRNAME, content_hash, thread_key
+from archive_io import ArchiveReader, compression_of, file_lock, list_archives, plain_archive
+from archive_store import STORE_DIRNAME, ArchiveStore, snapshot_copy
+from forum_urls import forum_id_from_url, topic_id_from_url
+
+# Bump when what's indexed changes; archives indexed by an older version are redone
+HISTORY_VERSION = 1
+
+
+@contextmanager
+def _connect(path):
+    db = sqlite3.connect(path, timeout=60)
+    db.row_factory = sqlite3.Row
+    try:
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+def archive_files(archives_dir='archives'):
+    """Map every archive filename to its file, or to None for stored snapshots
+    that no longer exist as files (without creating a store)
+    """
+    files = {os.path.basename(path): path for path in list_archives(archives_dir)}
+    if os.path.exists(os.path.join(archives_dir, STORE_DIRNAME, 'store.sqlite3')):
+        for snapshot in ArchiveStore(archives_dir).snapshots():
+            files.setdefault(snapshot['filename'], None)
+    return files
+
+
+def readable_archive(filename, archives_dir='archives'):
+    """Uncompressed file with an archive's bytes, or None if the archive is gone.
+    Compressed archives are decompressed and stored snapshots rebuilt into
+    archives/.cache/ when needed.
+    """
+    path = os.path.join(archives_dir, filename)
+    if os.path.isfile(path):
+        return plain_archive(path, archives_dir)
+    return snapshot_copy(filename, archives_dir)
+
+
+class ThreadHistory:
+    """Global index of thread and post occurrences across all archives"""
+
+    def __init__(self, archives_dir='archives'):
+        self.archives_dir = archives_dir
+        self.path = os.path.join(archives_dir, INDEX_DIRNAME, 'history.sqlite3')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with _connect(self.path) as db:
+            db.executescript('''
+                CREATE TABLE IF NOT EXISTS archives (
+                    archive_id INTEGER PRIMARY KEY,
+                    filename TEXT NOT NULL UNIQUE,
+                    size_bytes INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    crawled_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_key TEXT NOT NULL,
+                    archive_id INTEGER NOT NULL,
+                    topic_id INTEGER,
+                    board_id INTEGER NOT NULL,
+                    thread_title TEXT,
+                    thread_url TEXT,
+                    comment_count INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (thread_key, archive_id)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS posts (
+                    post_id TEXT NOT NULL,
+                    archive_id INTEGER NOT NULL,
+                    thread_key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (post_id, archive_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS threads_by_archive ON threads (archive_id);
+                CREATE INDEX IF NOT EXISTS posts_by_archive ON posts (archive_id);
+            ''')
+
+    def _forget(self, db, filename):
+        archive = db.execute('SELECT archive_id FROM archives WHERE filename = ?', (filename,)).fetchone()
+        if archive is not None:
+            for table in ('posts', 'threads', 'archives'):
+                db.execute(f'DELETE FROM {table} WHERE archive_id = ?', (archive['archive_id'],))
+
+    def add(self, filepath):
+        """Index one archive file in a single streaming pass, replacing any earlier entries for it
+        Returns: (threads, posts) indexed
+        """
+        filename = os.path.basename(filepath)
+        threads = posts = 0
+        with ArchiveReader(plain_archive(filepath, self.archives_dir)) as reader, _connect(self.path) as db:
+            self._forget(db, filename)
+            archive_id = db.execute('INSERT INTO archives (filename, size_bytes, version, crawled_at) VALUES (?, ?, ?, ?)',
+                                    (filename, os.path.getsize(filepath), HISTORY_VERSION,
+                                     reader.header().get('crawled_at'))).lastrowid
+            for board, threads_offset in reader.iter_boards():
+                board_id = forum_id_from_url(board.get('board_url'))
+                for offset, end in reader.iter_threads(threads_offset):
+                    thread, comments = reader.load_thread(offset)
+                    topic_id = topic_id_from_url(thread.get('thread_url'))
+                    key = thread_key(topic_id, thread.get('thread_url'))
+                    db.execute('INSERT OR REPLACE INTO threads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (key, archive_id, topic_id, board_id, thread.get('thread_title'),
+                                thread.get('thread_url'), len(comments), offset, end - offset))
+                    rows = [(comment['post_id'], archive_id, key, position, content_hash(comment),
+                             c_offset, c_end - c_offset)
+                            for position, (comment, c_offset, c_end) in enumerate(comments) if comment.get('post_id')]
+                    db.executemany('INSERT OR REPLACE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                    threads += 1
+                    posts += len(rows)
+        return threads, posts
+
+    def update(self):
+        """Index archives that are new or changed since they were indexed, and forget
+        archives that no longer exist. Stored snapshots never change once indexed.
+        Returns: (filenames indexed, filenames forgotten)
+        """
+        with file_lock(self.path):
+            files = archive_files(self.archives_dir)
+            with _connect(self.path) as db:
+                indexed = {row['filename']: row for row in db.execute('SELECT * FROM archives')}
+                gone = sorted(filename for filename in indexed if filename not in files)
+                for filename in gone:
+                    self._forget(db, filename)
+
+            added = []
+            for filename, path in sorted(files.items()):
+                row = indexed.get(filename)
+                if row is not None and row['version'] == HISTORY_VERSION and \
+                        (path is None or row['size_bytes'] == os.path.getsize(path)):
+                    continue
+                path = path or readable_archive(filename, self.archives_dir)
+                if path is not None:
+                    self.add(path)
+                    added.append(filename)
+            return added, gone
+
+    def thread(self, key):
+        """A thread's title, board and comment count in every archive it appears in, oldest
+        first, or None if no archive has it. Answered from the index alone.
+        """
+        with _connect(self.path) as db:
+            rows = db.execute('''
+                SELECT a.filename, a.crawled_at, t.topic_id, t.board_id, t.thread_title, t.thread_url, t.comment_count
+                FROM threads t JOIN archives a ON a.archive_id = t.archive_id
+                WHERE t.thread_key = ? ORDER BY a.filename
+            ''', (key,)).fetchall()
+            archives = db.execute('SELECT filename FROM archives ORDER BY filename').fetchall()
+        if not rows:
+            return None
+
+        seen = {row['filename'] for row in rows}
+        history = []
+        previous = 0
+        for row in rows:
+            history.append({
+                'archive': row['filename'],
+                'crawled_at': row['crawled_at'],
+                'board_id': row['board_id'],
+                'thread_title': row['thread_title'],
+                'comment_count': row['comment_count'],
+                'new_comments': row['comment_count'] - previous,
+            })
+            previous = row['comment_count']
+        latest = rows[-1]
+        return {
+            'thread_id': latest['topic_id'],
+            'thread_url': latest['thread_url'],
+            'thread_title': latest['thread_title'],
+            'board_id': latest['board_id'],
+            'first_seen': rows[0]['filename'],
+            'last_seen': latest['filename'],
+            # Crawls since the thread first appeared that didn't have it
+            'missing_from': [archive['filename'] for archive in archives
+                             if archive['filename'] > rows[0]['filename'] and archive['filename'] not in seen],
+            'history': history,
+        }
+
+    def post(self, post_id):
+        """Every recorded version of a post and where each appears, oldest first, or
+        None if no archive has it. Each distinct version is read from one archive by offset.
+        """
+        with _connect(self.path) as db:
+            rows = db.execute('''
+                SELECT a.filename, a.crawled_at, p.thread_key, p.position, p.content_hash, p.offset, p.length
+                FROM posts p JOIN archives a ON a.archive_id = p.archive_id
+                WHERE p.post_id = ? ORDER BY a.filename
+            ''', (post_id,)).fetchall()
+            if not rows:
+                return None
+            thread_rows = db.execute('''
+                SELECT a.filename, t.topic_id FROM threads t JOIN archives a ON a.archive_id = t.archive_id
+                WHERE t.thread_key = ? ORDER BY a.filename
+            ''', (rows[-1]['thread_key'],)).fetchall()
+
+        versions = {}
+        appearances = []
+        for row in rows:
+            version = versions.get(row['content_hash'])
+            if version is None:
+                version = versions[row['content_hash']] = {
+                    'version': len(versions) + 1,
+                    'content_hash': row['content_hash'],
+                    'first_seen': row['filename'],
+                    'comment': None,
+                    'archives': 0,
+                    '_rows': [],
+                }
+            version['last_seen'] = row['filename']
+            version['archives'] += 1
+            version['_rows'].append(row)
+            appearances.append({
+                'archive': row['filename'],
+                'crawled_at': row['crawled_at'],
+                'post_index': row['position'],
+                'version': version['version'],
+            })
+
+        for version in versions.values():
+            # The first archive that still has the bytes of this version, trying
+            # plain files before those that need decompressing or rebuilding
+            for row in sorted(version.pop('_rows'), key=lambda row: not self._is_plain(row['filename'])):
+                version['comment'] = self._read_post(row, post_id)
+                if version['comment'] is not None:
+                    break
+
+        first_seen = rows[0]['filename']
+        return {
+            'post_id': post_id,
+            'thread_id': thread_rows[-1]['topic_id'],
+            'first_seen': first_seen,
+            'last_seen': rows[-1]['filename'],
+            # Crawls of its thread since the post first appeared that didn't have the post
+            'missing_from': sorted({row['filename'] for row in thread_rows if row['filename'] > first_seen} -
+                                   {row['filename'] for row in rows}),
+            'versions': list(versions.values()),
+            'appearances': appearances,
+        }
+
+    def _is_plain(self, filename):
+        return compression_of(filename) is None and os.path.isfile(os.path.join(self.archives_dir, filename))
+
+    def _read_post(self, row, post_id):
+        path = readable_archive(row['filename'], self.archives_dir)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(row['offset'])
+            data = f.read(row['length'])
+        try:
+            comment = json.loads(data)
+        except ValueError:
+            return None
+        # An archive rewritten since it was indexed has other bytes at the offset
+        return comment if isinstance(comment, dict) and comment.get('post_id') == post_id else None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='History of 223 threads and posts across archives')
+    parser.add_argument('--archives-dir', default='archives', help='Where archives and the history index are kept')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('update', help='Index new or changed archives and forget deleted ones')
+    thread_parser = commands.add_parser('thread', help="A thread's comment count in each archive")
+    thread_parser.add_argument('topic_id', type=int)
+    post_parser = commands.add_parser('post', help='Every recorded version of a post')
+    post_parser.add_argument('post_id')
+    args = parser.parse_args()
+
+    history = ThreadHistory(args.archives_dir)
+    added, gone = history.update()
+    if args.command == 'update':
+        for filename in added:
+            print(f"🕰️  Indexed {filename}")
+        for filename in gone:
+            print(f"➖ Forgot {filename}")
+        print(f"✅ History index up to date ({len(added)} indexed, {len(gone)} forgotten)")
+    elif args.command == 'thread':
+        thread = history.thread(thread_key(args.topic_id, None))
+        if thread is None:
+            parser.exit(1, f"❌ Thread {args.topic_id} is in no archive\n")
+        print(f"🧵 {thread['thread_title']} ({thread['thread_url']})")
+        for point in thread['history']:
+            print(f"   {point['archive']}  {point['comment_count']:>6} comments  (+{point['new_comments']})")
+        for filename in thread['missing_from']:
+            print(f"   {filename}  missing")
+    else:
+        post = history.post(args.post_id)
+        if post is None:
+            parser.exit(1, f"❌ Post {args.post_id} is in no archive\n")
+        print(f"💬 {args.post_id} in thread {post['thread_id']}: {len(post['versions'])} versions "
+              f"in {len(post['appearances'])} archives")
+        for version in post['versions']:
+            content = (version['comment'] or {}).get('content', '?')
+            print(f"   v{version['version']} {version['first_seen']} → {version['last_seen']}: {content[:100]}")
@@ -5,7 +5,7 @@ import {
   Text,
 } from '@chakra-ui/react'
 
-import { Archive, ForumData } from './types';
+import { Archive, BoardSummary } from './types';
 import { BoardTable } from './components/BoardTable.component';
 import { Header } from './components/Header.compontent';
 import { useEffect, useState } from 'react';
@@ -13,7 +13,7 @@ import { useEffect, useState } from 'react';
 function App() {
   const [archives, setArchives] = useState<Archive[] | null>(null);
   const [selectedArchive, setSelectedArchive] = useState<Archive | null>(null);
-  const [forumData, setForumData] = useState<ForumData | null>(null);
+  const [boards, setBoards] = useState<BoardSummary[] | null>(null);
   const [isLoading, setIsLoading] = useState(true);
 
   useEffect(() => {
@@ -31,9 +31,9 @@ function App() {
 
   useEffect(() => {
     if (selectedArchive) {
-      fetch(`http://localhost:5000/archives/${selectedArchive.filename}`)
+      fetch(`http://localhost:5000/archives/${selectedArchive.filename}/boards`)
         .then(response => response.json())
-        .then(data => setForumData(data))
+        .then(data => setBoards(data.boards))
         .then(() => setIsLoading(false))
         .catch(error => console.error('Error fetching forum data:', error));
     }
@@ -50,8 +50,8 @@ function App() {
       {archives && (
         <Header archives={archives} selectedArchive={selectedArchive ?? archives[0]} setSelectedArchive={setSelectedArchive} />
       )}
-      {forumData && (
-        <BoardTable boards={forumData.boards} />
+      {boards && selectedArchive && (
+        <BoardTable archive={selectedArchive} boards={boards} />
       )}
     </Container>
   )
@@ -1,4 +1,8 @@
-import { ExternalLinkIcon, ViewIcon } from "@chakra-ui/icons";
+import {
+  ChevronDownIcon,
+  ChevronRightIcon,
+  ExternalLinkIcon,
+} from "@chakra-ui/icons";
 import {
   Tooltip,
   Link,
@@ -10,32 +14,56 @@ import {
   Tbody,
   Td,
   Box,
+  IconButton,
 } from "@chakra-ui/react";
-import { Board } from "../types";
+import { Fragment, useState } from "react";
+import { Archive, BoardSummary } from "../types";
+import { ThreadList } from "./ThreadList.component";
+
+export const BoardTable = ({
+  archive,
+  boards,
+}: {
+  archive: Archive;
+  boards: BoardSummary[];
+}) => {
+  const [expandedBoards, setExpandedBoards] = useState<Set<number>>(
+    new Set()
+  );
 
-export const BoardTable = ({ boards }: { boards: Board[] }) => {
+  const toggleBoard = (board: BoardSummary) => {
+    setExpandedBoards((expanded) => {
+      const next = new Set(expanded);
+      if (next.has(board.board_id)) {
+        next.delete(board.board_id);
+      } else {
+        next.add(board.board_id);
+      }
+      return next;
+    });
+  };
 
-  const renderBoardActions = (board: Board) => {
-    const actions = [
-      {
-        label: "View Original",
-        icon: <ExternalLinkIcon />,
-        href: board.board_url,
-      },
-      {
-        label: "View Archived",
-        icon: <ViewIcon />,
-        href: board.board_url,
-      },
-    ];
+  const renderBoardActions = (board: BoardSummary) => {
+    const isExpanded = expandedBoards.has(board.board_id);
 
-    return actions.map((action) => (
-      <Tooltip key={action.label} label={action.label}>
-        <Link href={action.href} target="_blank" marginX={2}>
-          {action.icon}
-        </Link>
-      </Tooltip>
-    ));
+    return (
+      <>
+        <Tooltip label={isExpanded ? "Hide Threads" : "View Archived"}>
+          <IconButton
+            aria-label={isExpanded ? "Hide Threads" : "View Archived"}
+            icon={isExpanded ? <ChevronDownIcon /> : <ChevronRightIcon />}
+            size="sm"
+            variant="ghost"
+            onClick={() => toggleBoard(board)}
+          />
+        </Tooltip>
+        <Tooltip label="View Original">
+          <Link href={board.board_url} target="_blank" marginX={2}>
+            <ExternalLinkIcon />
+          </Link>
+        </Tooltip>
+      </>
+    );
   };
 
   return (
@@ -53,19 +81,24 @@ export const BoardTable = ({ boards }: { boards: Board[] }) => {
           </Tr>
         </Thead>
         <Tbody>
-          {!!boards.length && boards.map((board) => (
-            <Tr key={board.board_url}>
-              <Td>{renderBoardActions(board)}</Td>
-              <Td>{board.board_name}</Td>
-              <Td>{board.threads.length}</Td>
-              <Td>
-                {board.threads.reduce(
-                  (acc, thread) => acc + thread.comments.length,
-                  0
+          {!!boards.length &&
+            boards.map((board) => (
+              <Fragment key={board.board_url}>
+                <Tr>
+                  <Td>{renderBoardActions(board)}</Td>
+                  <Td>{board.board_name}</Td>
+                  <Td>{board.thread_count}</Td>
+                  <Td>{board.comment_count}</Td>
+                </Tr>
+                {expandedBoards.has(board.board_id) && (
+                  <Tr>
+                    <Td colSpan={4}>
+                      <ThreadList archive={archive} board={board} />
+                    </Td>
+                  </Tr>
                 )}
-              </Td>
-            </Tr>
-          ))}
+              </Fragment>
+            ))}
         </Tbody>
       </Table>
     </Box>
@@ -0,0 +1,97 @@
+import { ExternalLinkIcon } from "@chakra-ui/icons";
+import {
+  Box,
+  Button,
+  Link,
+  Spinner,
+  Table,
+  Tbody,
+  Td,
+  Text,
+  Th,
+  Thead,
+  Tr,
+} from "@chakra-ui/react";
+import { useCallback, useEffect, useState } from "react";
+import { Archive, BoardSummary, ThreadPage, ThreadSummary } from "../types";
+
+const PAGE_SIZE = 50;
+
+export const ThreadList = ({
+  archive,
+  board,
+}: {
+  archive: Archive;
+  board: BoardSummary;
+}) => {
+  const [threads, setThreads] = useState<ThreadSummary[]>([]);
+  const [isLoading, setIsLoading] = useState(false);
+
+  const fetchThreads = useCallback(
+    (offset: number): Promise<ThreadPage> =>
+      fetch(
+        `http://localhost:5000/archives/${archive.filename}/boards/${board.board_id}/threads?offset=${offset}&limit=${PAGE_SIZE}`
+      ).then((response) => response.json()),
+    [archive.filename, board.board_id]
+  );
+
+  useEffect(() => {
+    let cancelled = false;
+    setIsLoading(true);
+    fetchThreads(0)
+      .then((data) => {
+        if (!cancelled) setThreads(data.threads);
+      })
+      .catch((error) => console.error("Error fetching threads:", error))
+      .finally(() => setIsLoading(false));
+    return () => {
+      cancelled = true;
+    };
+  }, [fetchThreads]);
+
+  const loadMore = () => {
+    setIsLoading(true);
+    fetchThreads(threads.length)
+      .then((data) => setThreads((loaded) => [...loaded, ...data.threads]))
+      .catch((error) => console.error("Error fetching threads:", error))
+      .finally(() => setIsLoading(false));
+  };
+
+  return (
+    <Box paddingLeft={8}>
+      <Table size="sm">
+        <Thead>
+          <Tr>
+            <Th>Thread</Th>
+            <Th>Comments</Th>
+            <Th>Crawled</Th>
+          </Tr>
+        </Thead>
+        <Tbody>
+          {threads.map((thread) => (
+            <Tr key={thread.thread_url}>
+              <Td>
+                <Link href={thread.thread_url} target="_blank">
+                  {thread.thread_title} <ExternalLinkIcon marginX={1} />
+                </Link>
+              </Td>
+              <Td>{thread.comment_count}</Td>
+              <Td>{new Date(thread.crawled_at).toLocaleString()}</Td>
+            </Tr>
+          ))}
+        </Tbody>
+      </Table>
+      {isLoading && <Spinner size="sm" marginY={2} />}
+      {!isLoading && threads.length < board.thread_count && (
+        <Button size="sm" marginY={2} onClick={loadMore}>
+          Load more threads
+        </Button>
+      )}
+      {!isLoading && board.thread_count === 0 && (
+        <Text fontSize="sm" color="gray.500" marginY={2}>
+          No threads archived for this board
+        </Text>
+      )}
+    </Box>
+  );
+};
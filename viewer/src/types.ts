@@ -21,6 +21,31 @@ export interface Board {
   threads: Thread[];
 }
 
+export interface BoardSummary {
+  board_id: number;
+  board_name: string;
+  board_url: string;
+  discovered_at: string;
+  thread_count: number;
+  comment_count: number;
+}
+
+export interface ThreadSummary {
+  thread_id: number;
+  thread_title: string;
+  thread_url: string;
+  crawled_at: string;
+  comment_count: number;
+}
+
+export interface ThreadPage {
+  board: BoardSummary;
+  total: number;
+  offset: number;
+  limit: number;
+  threads: ThreadSummary[];
+}
+
 export interface ForumStats {
   boards_discovered: number;
   threads_discovered: number;